@@ -5,36 +5,48 @@ Each scene's audio is exported separately, matching the image sequence.
 """
 
 import os
-from pydub import AudioSegment
+import sys
 from pathlib import Path
 
-# 🪄 Tell pydub exactly where ffmpeg is
-AudioSegment.converter = r"C:\\ffmpeg\\bin\\ffmpeg.exe"
-AudioSegment.ffprobe = r"C:\\ffmpeg\bin\\ffprobe.exe"
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
 
+from utils.log_utils import safe_print, span, traced
 
-def estimate_scene_durations(scenes, total_audio_duration):
+
+def _audio_segment():
+    """pydub's AudioSegment, imported (and pointed at ffmpeg) on first use."""
+    from pydub import AudioSegment
+
+    # 🪄 Tell pydub exactly where ffmpeg is
+    AudioSegment.converter = r"C:\\ffmpeg\\bin\\ffmpeg.exe"
+    AudioSegment.ffprobe = r"C:\\ffmpeg\bin\\ffprobe.exe"
+    return AudioSegment
+
+
+def estimate_scene_durations(scenes, total_audio_duration, voice="*"):
     """
-    Estimate scene durations based on word count ratio.
+    Estimate scene durations from predicted spoken length of each scene.
 
     Args:
         scenes (list[str]): List of scene texts.
         total_audio_duration (float): Total audio duration in seconds.
+        voice (str): TTS voice the narration was produced with (see utils.speech_duration).
 
     Returns:
         list[float]: Estimated durations per scene in seconds.
     """
-    total_words = sum(len(scene.split()) for scene in scenes)
-    durations = []
+    from utils.speech_duration import default_model
 
-    for scene in scenes:
-        word_count = len(scene.split())
-        ratio = word_count / total_words
-        durations.append(total_audio_duration * ratio)
+    model = default_model()
+    predicted = [model.predict(scene, voice) for scene in scenes]
+    total_predicted = sum(predicted) or 1.0
 
-    return durations
+    return [total_audio_duration * p / total_predicted for p in predicted]
 
 
+@traced("audio_split_agent", stage="audio_split")
 def split_audio_by_scenes(
     audio_path: str,
     scenes: list[str],
@@ -54,7 +66,8 @@ def split_audio_by_scenes(
     Path(output_dir).mkdir(parents=True, exist_ok=True)
 
     # Load the full audio
-    audio = AudioSegment.from_file(audio_path)
+    with span("audio_split_load", stage="audio_split"):
+        audio = _audio_segment().from_file(audio_path)
     total_duration_ms = len(audio)  # total in ms
     total_duration_s = total_duration_ms / 1000.0
 
@@ -69,10 +82,11 @@ def split_audio_by_scenes(
         segment = audio[cursor:end_time]
 
         seg_file = os.path.join(output_dir, f"scene_{idx}.mp3")
-        segment.export(seg_file, format="mp3")
+        with span("audio_split_scene", stage="audio_split", scene=idx, seconds=round(duration, 2)):
+            segment.export(seg_file, format="mp3")
         segment_paths.append(seg_file)
 
-        print(f"🎧 Scene {idx} audio segment saved ({duration:.2f}s): {seg_file}")
+        safe_print(f"🎧 Scene {idx} audio segment saved ({duration:.2f}s): {seg_file}")
         cursor = end_time
 
     return segment_paths
@@ -2,7 +2,8 @@
 import os
 import json
 import base64
-import requests
+import shutil
+import hashlib
 import sys
 from pathlib import Path
 from dotenv import load_dotenv
@@ -13,24 +14,37 @@ if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
 
 # ✅ Use shared logging utilities
-from utils.log_utils import safe_print, log_step, log_success, log_error
-from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn
+from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn, span, traced
+from utils.metrics import record_cache
+from utils.prompt_index import PromptIndex
+from utils import providers
+from utils.artifact_store import RunArtifacts
 
 load_dotenv()
 EURON_API_KEY = os.getenv("EURON_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-if not EURON_API_KEY and not GROQ_API_KEY:
-    raise ValueError("No image API keys provided (EURON or GROQ).")
 
-EURON_IMAGE_URL = "https://api.euron.one/api/v1/euri/images/generations"
+# API bases can be pointed at a local stand-in (see benchmarks/mock_api_server.py)
+EURON_API_BASE = os.getenv("EURON_API_BASE", "https://api.euron.one/api/v1/euri")
+GROQ_API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1")
+
+EURON_IMAGE_URL = f"{EURON_API_BASE}/images/generations"
 EURON_IMAGE_MODEL = "black-forest-labs/FLUX.1-schnell"
 
-GROQ_IMAGE_URL = "https://api.groq.com/openai/v1/images/generations"
+GROQ_IMAGE_URL = f"{GROQ_API_BASE}/images/generations"
 GROQ_IMAGE_MODEL = "flux-1-schnell"  # adjust per Groq console
 
 TIMEOUT = 120
 
+# Scenes whose image prompt is at least this similar (Jaccard over word shingles) to an
+# already generated one reuse that image instead of a new generation; 0 disables reuse.
+IMAGE_REUSE_THRESHOLD = float(os.getenv("IMAGE_REUSE_THRESHOLD", "0.8"))
+# Generated images are kept here across runs, indexed by prompt and provider; empty keeps
+# the index per story. The least recently used beyond IMAGE_CACHE_MAX_ENTRIES are deleted.
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "output/cache/images")
+IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "2000"))
+
 
 def load_script_json(script_path: Path):
     if not script_path.exists():
@@ -52,6 +66,7 @@ def _save_image_bytes(img_bytes: bytes, img_path: Path):
 
 
 def generate_scene_image_euron(prompt: str, size: str = "1024x1024"):
+    import requests
     headers = {"Content-Type": "application/json", "Authorization": f"Bearer {EURON_API_KEY}"}
     payload = {"model": EURON_IMAGE_MODEL, "prompt": prompt, "size": size}
     r = requests.post(EURON_IMAGE_URL, headers=headers, json=payload, timeout=TIMEOUT)
@@ -62,6 +77,7 @@ def generate_scene_image_euron(prompt: str, size: str = "1024x1024"):
 
 
 def generate_scene_image_groq(prompt: str, size: str = "1024x1024"):
+    import requests
     headers = {"Content-Type": "application/json", "Authorization": f"Bearer {GROQ_API_KEY}"}
     payload = {"model": GROQ_IMAGE_MODEL, "prompt": prompt, "size": size}
     r = requests.post(GROQ_IMAGE_URL, headers=headers, json=payload, timeout=TIMEOUT)
@@ -70,6 +86,7 @@ def generate_scene_image_groq(prompt: str, size: str = "1024x1024"):
 
 
 def extract_image_bytes_from_response(data: dict):
+    import requests
     # supports keys: url, b64_json, image
     if "data" in data and len(data["data"]) > 0:
         item = data["data"][0]
@@ -83,53 +100,118 @@ def extract_image_bytes_from_response(data: dict):
     raise ValueError("No image bytes found in response.")
 
 
+def _download(data: dict) -> bytes:
+    with span("image_download", stage="image") as sp:
+        img_bytes = extract_image_bytes_from_response(data)
+        sp.set(bytes=len(img_bytes))
+    return img_bytes
+
+
+def image_bytes_euron(prompt: str, size: str = "1024x1024") -> bytes:
+    return _download(generate_scene_image_euron(prompt, size))
+
+
+def image_bytes_groq(prompt: str, size: str = "1024x1024") -> bytes:
+    return _download(generate_scene_image_groq(prompt, size))
+
+
+providers.register("image", "euron", image_bytes_euron, label=f"euron:{EURON_IMAGE_MODEL}",
+                   available=lambda: bool(EURON_API_KEY))
+providers.register("image", "groq", image_bytes_groq, label=f"groq:{GROQ_IMAGE_MODEL}",
+                   available=lambda: bool(GROQ_API_KEY))
+
+
+@traced("image_scene", stage="image")
 def generate_scene_image(prompt: str, scene_number: int, image_dir: Path):
+    """Returns ``(image path, label of the provider that made it)``."""
     log_step(f"Generating image for scene {scene_number}")
-    # Try Euron
-    data = None
-    try:
-        if EURON_API_KEY:
-            resp = generate_scene_image_euron(prompt)
-            data = resp
-    except Exception as e:
-        log_warn(f"Euron image generation failed: {e}")
-
-    # Fallback Groq
-    if data is None and GROQ_API_KEY:
+    img_bytes = None
+    for attempt, provider in enumerate(providers.resolve("image"), 1):
         try:
-            resp = generate_scene_image_groq(prompt)
-            data = resp
+            with span("image_request", stage="image", scene=scene_number, provider=provider.name,
+                      attempt=attempt) as sp:
+                img_bytes = provider(prompt)
+                sp.set(bytes=len(img_bytes))
+            break
         except Exception as e:
-            log_error(f"Groq image generation failed: {e}")
+            log_warn(f"{provider.name.title()} image generation failed: {e}")
 
-    if data is None:
-        raise RuntimeError("Both Euron and Groq image generation failed.")
+    if img_bytes is None:
+        raise RuntimeError("Every configured image provider failed.")
 
-    img_bytes = extract_image_bytes_from_response(data)
     img_path = image_dir / f"scene_{scene_number}.jpg"
     _save_image_bytes(img_bytes, img_path)
-    return img_path
+    return img_path, provider.label
+
+
+def reuse_similar_image(index: PromptIndex, prompt: str, scene_number: int, image_dir: Path) -> bool:
+    """
+    Copy the image of a near-duplicate prompt (this story or the cache) into place, if any.
+    Only images made by one of the configured providers count.
+    """
+    if IMAGE_REUSE_THRESHOLD <= 0:
+        return False
+    with span("image_reuse_lookup", stage="image", scene=scene_number) as sp:
+        match = index.query(prompt, IMAGE_REUSE_THRESHOLD,
+                            namespaces={p.label for p in providers.resolve("image")})
+        sp.set(hit=match is not None)
+    record_cache("image_prompt", match is not None)
+    if match is None:
+        return False
+    img_path = image_dir / f"scene_{scene_number}.jpg"
+    shutil.copyfile(match.path, img_path)
+    index.touch(match)
+    log_success(f"Reused image for scene {scene_number} ({match.similarity:.0%} similar to \"{match.prompt[:60]}\")")
+    return True
+
+
+def _index_image(index: PromptIndex, prompt: str, img_path: Path, provider: str):
+    if index.cache_dir is None:
+        index.add(prompt, img_path, provider)
+        return
+    try:
+        index.cache_dir.mkdir(parents=True, exist_ok=True)
+        cached = index.cache_dir / f"{hashlib.sha1(f'{provider}|{prompt}'.encode('utf-8')).hexdigest()}.jpg"
+        shutil.copyfile(img_path, cached)
+        index.add(prompt, cached, provider)
+    except OSError as e:
+        log_warn(f"Could not cache image for reuse: {e}")
+        index.add(prompt, img_path, provider)
 
 
+@traced("image_agent", stage="image")
 def process_story_script(base_output_dir: Path):
+    # Resolved when work starts rather than at import, so importing the agent stays cheap and safe.
+    providers.resolve("image")
     log_step("Image generation step")
-    script_path = base_output_dir / "script" / "story.json"
-    scenes = load_script_json(script_path)
+    artifacts = RunArtifacts(base_output_dir)
+    scenes = load_script_json(artifacts.fetch("script", "story.json"))
 
-    image_dir = base_output_dir / "images"
+    image_dir = artifacts.dir / "images"
     image_dir.mkdir(parents=True, exist_ok=True)
+    index = PromptIndex.load(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_ENTRIES) if IMAGE_CACHE_DIR else PromptIndex()
 
+    reused = 0
     for scene in scenes:
         if not isinstance(scene, dict):
             log_warn(f"Skipping invalid scene: {scene}")
             continue
         prompt = scene.get("image_prompt") or scene.get("narration") or "illustration"
         scene_number = scene.get("scene_number")
+        if reuse_similar_image(index, prompt, scene_number, image_dir):
+            artifacts.publish("images", image_dir / f"scene_{scene_number}.jpg")
+            reused += 1
+            continue
         try:
-            generate_scene_image(prompt, scene_number, image_dir)
+            img_path, provider = generate_scene_image(prompt, scene_number, image_dir)
         except Exception as e:
             log_error(f"Failed to generate image for scene {scene_number}: {e}")
+            continue
+        artifacts.publish("images", img_path)
+        _index_image(index, prompt, img_path, provider)
 
+    if reused:
+        log_success(f"Reused {reused} image(s) for near-duplicate prompts.")
     log_success("Image generation completed.")
 
 
@@ -2,7 +2,6 @@
 import os
 import json
 import sys
-import requests
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -10,7 +9,9 @@ ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
     
-from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn
+from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn, log_debug, span, traced, current_span
+from utils import providers
+from utils.artifact_store import RunArtifacts
 
 
 
@@ -18,40 +19,82 @@ load_dotenv()
 EURON_API_KEY = os.getenv("EURON_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-EURON_API_URL = "https://api.euron.one/api/v1/euri/chat/completions"
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+# API bases can be pointed at a local stand-in (see benchmarks/mock_api_server.py)
+EURON_API_BASE = os.getenv("EURON_API_BASE", "https://api.euron.one/api/v1/euri")
+GROQ_API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1")
+
+EURON_API_URL = f"{EURON_API_BASE}/chat/completions"
+GROQ_API_URL = f"{GROQ_API_BASE}/chat/completions"
 
 MODEL = "gpt-4.1-nano"
 GROQ_MODEL = "llama-3.3-70b"  # change per your Groq availability
 
 
-def call_euron(prompt: str, num_scenes: int):
+SYSTEM_PROMPT = "You are a storytelling assistant. Return ONLY a valid JSON array. Each scene must be an object with scene_number, narration, image_prompt."
+
+# Long-form planning: narration pace and how many scenes one chapter request covers.
+WORDS_PER_MINUTE = 150
+SECONDS_PER_SCENE = 20
+SCENES_PER_CHAPTER = 5
+LONG_FORM_MIN_MINUTES = 5
+MAX_PARALLEL_CHAPTERS = 8
+CHAPTER_ATTEMPTS = 3  # requests per chapter before a short chapter fails the story
+
+
+def call_euron(prompt: str, system_prompt: str = SYSTEM_PROMPT, max_tokens: int = 1500):
+    import requests
     headers = {"Content-Type": "application/json", "Authorization": f"Bearer {EURON_API_KEY}"}
     payload = {
         "messages": [
-            {"role": "system", "content": f"You are a storytelling assistant. Return ONLY a valid JSON array. Each scene must be an object with scene_number, narration, image_prompt."},
+            {"role": "system", "content": system_prompt},
             {"role": "user", "content": prompt}
         ],
         "model": MODEL,
-        "max_tokens": 1500,
+        "max_tokens": max_tokens,
         "temperature": 0.8
     }
     return requests.post(EURON_API_URL, headers=headers, json=payload, timeout=120)
 
 
-def call_groq(prompt: str, num_scenes: int):
+def call_groq(prompt: str, system_prompt: str = SYSTEM_PROMPT, max_tokens: int = None):
+    import requests
     headers = {"Content-Type": "application/json", "Authorization": f"Bearer {GROQ_API_KEY}"}
     payload = {
         "messages": [
-            {"role": "system", "content": f"You are a storytelling assistant. Return ONLY a valid JSON array. Each scene must be an object with scene_number, narration, image_prompt."},
+            {"role": "system", "content": system_prompt},
             {"role": "user", "content": prompt}
         ],
         "model": GROQ_MODEL,
         "temperature": 0.8
     }
+    if max_tokens:
+        payload["max_tokens"] = max_tokens
     return requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=120)
 
 
+def _completion_text(provider: str, resp) -> str:
+    if current_span():
+        current_span().set(status=resp.status_code)
+    if resp.status_code in (401, 403):
+        log_warn(f"{provider.title()} responded {resp.status_code}. Will try the next provider.")
+        raise RuntimeError(f"{provider.title()} HTTP {resp.status_code}")
+    resp.raise_for_status()
+    data = resp.json()
+    return data.get("choices", [{}])[0].get("message", {}).get("content", "")
+
+
+def complete_euron(prompt: str, system_prompt: str = SYSTEM_PROMPT, max_tokens: int = 1500) -> str:
+    return _completion_text("euron", call_euron(prompt, system_prompt, max_tokens))
+
+
+def complete_groq(prompt: str, system_prompt: str = SYSTEM_PROMPT, max_tokens: int = None) -> str:
+    return _completion_text("groq", call_groq(prompt, system_prompt, max_tokens))
+
+
+providers.register("llm", "euron", complete_euron, label=f"euron:{MODEL}", available=lambda: bool(EURON_API_KEY))
+providers.register("llm", "groq", complete_groq, label=f"groq:{GROQ_MODEL}", available=lambda: bool(GROQ_API_KEY))
+
+
 def clean_model_output(text: str) -> str:
     """Remove common markdown fences and whitespace that can wrap JSON."""
     s = text.strip()
@@ -84,53 +127,152 @@ def parse_script_content(content: str):
     return parsed
 
 
-def generate_story_script(prompt: str, num_scenes: int = 3) -> list:
-    log_step("Generating story script (Euron primary, Groq fallback)")
-    # Try Euron first if key present
-    if EURON_API_KEY:
+def complete_json_list(prompt: str, system_prompt: str = SYSTEM_PROMPT, max_tokens: int = 1500,
+                       label: str = "story") -> list:
+    """Run one completion through the configured LLM providers (in order) and parse it as a JSON list."""
+    chain = providers.resolve("llm")
+    last_error = None
+    for attempt, provider in enumerate(chain, 1):
+        if attempt > 1:
+            log_step(f"Using {provider.name} fallback for {label} generation")
         try:
-            resp = call_euron(prompt, num_scenes)
-            if resp.status_code in (401, 403):
-                log_warn(f"Euron responded {resp.status_code}. Will try Groq fallback.")
-                raise RuntimeError(f"Euron HTTP {resp.status_code}")
-            resp.raise_for_status()
-            data = resp.json()
-            content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-            safe_print("Raw output (Euron):")
-            safe_print(content)
+            with span("llm_request", stage="script", provider=provider.name, attempt=attempt, label=label) as sp:
+                content = provider(prompt, system_prompt, max_tokens)
+                sp.set(bytes=len(content.encode("utf-8")))
+            # Whole model outputs are only worth their cost when debugging (LOG_LEVEL=debug).
+            log_debug(f"Raw output ({provider.label}, {label}):\n{content}", provider=provider.name)
             return parse_script_content(content)
         except Exception as e:
-            log_warn(f"Euron failed: {e}")
-    # Fallback to Groq
-    if GROQ_API_KEY:
-        log_step("Using Groq fallback for story generation")
-        resp = call_groq(prompt, num_scenes)
-        resp.raise_for_status()
-        data = resp.json()
-        content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-        safe_print("Raw output (Groq):")
-        safe_print(content)
-        return parse_script_content(content)
-    raise RuntimeError("No working LLM API key available (Euron/Groq).")
+            last_error = e
+            log_warn(f"{provider.name.title()} failed ({label}): {e}")
+    raise RuntimeError(f"No LLM provider produced a valid {label} ({', '.join(p.name for p in chain)}): {last_error}")
+
+
+@traced("generate_story_script", stage="script")
+def generate_story_script(prompt: str) -> list:
+    log_step(f"Generating story script ({' -> '.join(p.name for p in providers.resolve('llm'))})")
+    return complete_json_list(prompt)
+
+
+def plan_long_story(minutes: float) -> dict:
+    """Target scene count, narration length and chapter split for a story of ``minutes``."""
+    num_scenes = max(1, round(minutes * 60 / SECONDS_PER_SCENE))
+    num_chapters = max(1, -(-num_scenes // SCENES_PER_CHAPTER))
+    return {
+        "num_scenes": num_scenes,
+        "num_chapters": num_chapters,
+        "words_per_scene": round(WORDS_PER_MINUTE * SECONDS_PER_SCENE / 60),
+    }
+
+
+def generate_outline(prompt: str, num_chapters: int) -> list:
+    """Ask for a compact chapter outline that every chapter request shares as context."""
+    system_prompt = (
+        "You are a story planner. Return ONLY a valid JSON array. Each chapter must be an object "
+        "with chapter_number, title, summary (at most two sentences)."
+    )
+    user_prompt = f"Plan a story in exactly {num_chapters} chapters.\nStory idea: {prompt}"
+    outline = complete_json_list(user_prompt, system_prompt, max_tokens=120 * num_chapters + 200, label="outline")
+    if not outline:
+        raise ValueError("Model returned an empty chapter outline.")
+    return outline[:num_chapters]
+
+
+@traced("generate_chapter", stage="script")
+def generate_chapter_scenes(prompt: str, outline: list, chapter_index: int, num_scenes: int,
+                            words_per_scene: int) -> list:
+    chapter = outline[chapter_index]
+    outline_text = "\n".join(
+        f"{i}. {c.get('title', '')}: {c.get('summary', '')}" if isinstance(c, dict) else f"{i}. {c}"
+        for i, c in enumerate(outline, 1)
+    )
+    user_prompt = (
+        f"Story idea: {prompt}\n\nFull outline:\n{outline_text}\n\n"
+        f"Write ONLY chapter {chapter_index + 1} as exactly {num_scenes} scenes. "
+        f"Each narration should be about {words_per_scene} words and continue smoothly from the previous chapter."
+    )
+    max_tokens = num_scenes * (words_per_scene * 2 + 80) + 200
+    label = f"chapter {chapter_index + 1}"
+    for attempt in range(1, CHAPTER_ATTEMPTS + 1):
+        scenes = []
+        for scene in complete_json_list(user_prompt, max_tokens=max_tokens, label=label):
+            if isinstance(scene, dict) and scene.get("narration"):
+                scenes.append(scene)
+            else:
+                log_warn(f"Skipping invalid scene in {label}: {scene}")
+        if len(scenes) >= num_scenes:
+            return scenes[:num_scenes]
+        # A short chapter would silently shorten the whole story.
+        log_warn(f"{label.title()} came back with {len(scenes)}/{num_scenes} scenes "
+                 f"(attempt {attempt}/{CHAPTER_ATTEMPTS})")
+    raise ValueError(f"{label.title()} returned {len(scenes)} scenes instead of {num_scenes}.")
+
+
+@traced("generate_long_story_script", stage="script")
+def generate_long_story_script(prompt: str, minutes: float) -> list:
+    """
+    Long-form mode: one outline request, then every chapter's scenes in parallel.
+
+    Chapters share the outline as context, so latency is roughly one outline plus one
+    chapter instead of one decode covering the whole story.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    plan = plan_long_story(minutes)
+    log_step(f"Generating long story script: {plan['num_scenes']} scenes in {plan['num_chapters']} chapters")
+    outline = generate_outline(prompt, plan["num_chapters"])
+
+    per_chapter = [plan["num_scenes"] // len(outline)] * len(outline)
+    for i in range(plan["num_scenes"] % len(outline)):
+        per_chapter[i] += 1
+
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_CHAPTERS, len(outline))) as pool:
+        futures = [
+            pool.submit(generate_chapter_scenes, prompt, outline, i, per_chapter[i], plan["words_per_scene"])
+            for i in range(len(outline))
+        ]
+        chapters = [f.result() for f in futures]
+
+    script = []
+    for chapter_number, scenes in enumerate(chapters, 1):
+        for scene in scenes:
+            script.append(dict(scene, chapter=chapter_number, scene_number=len(script) + 1))
+    log_success(f"Long story script assembled: {len(script)} scenes.")
+    return script
+
+
+def parse_minutes(prompt: str):
+    """Pull the requested length out of prompts like '... approximately 10 minute story'."""
+    import re
+
+    match = re.search(r"(\d+(?:\.\d+)?)\s*-?\s*min", prompt, re.IGNORECASE)
+    return float(match.group(1)) if match else None
 
 
 def save_script(script_data: list, base_output_dir: Path, filename: str = "story.json"):
-    script_dir = base_output_dir / "script"
-    script_dir.mkdir(parents=True, exist_ok=True)
-    path = script_dir / filename
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(script_data, f, indent=2, ensure_ascii=False)
+    path = RunArtifacts(base_output_dir).save("script", filename, json.dumps(script_data, indent=2, ensure_ascii=False))
     log_success(f"Script saved: {path}")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) >= 3:
-        user_prompt = sys.argv[1]
-        base_output_dir = Path(sys.argv[2])
+    args = [a for a in sys.argv[1:] if not a.startswith("--minutes")]
+    minutes = None
+    for a in sys.argv[1:]:
+        if a.startswith("--minutes="):
+            minutes = float(a.split("=", 1)[1])
+
+    if len(args) >= 2:
+        user_prompt = args[0]
+        base_output_dir = Path(args[1])
     else:
         user_prompt = input("Enter story idea: ")
         base_output_dir = Path("output/manual_test")
         base_output_dir.mkdir(parents=True, exist_ok=True)
 
-    script = generate_story_script(user_prompt, num_scenes=3)
+    if minutes is None:
+        minutes = parse_minutes(user_prompt)
+    if minutes and minutes >= LONG_FORM_MIN_MINUTES:
+        script = generate_long_story_script(user_prompt, minutes)
+    else:
+        script = generate_story_script(user_prompt)
     save_script(script, base_output_dir)
@@ -2,35 +2,53 @@
 import os
 import json
 import sys
-import requests
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
     
-from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn
+from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn, span, traced
+from utils.speech_duration import VOICE_FILE, default_model, mp3_duration, source_key
+from utils.text_splitter import split_sentences
+from utils import providers
+from utils.artifact_store import RunArtifacts
+from utils.timeline import DURATIONS_FILE
 
 load_dotenv()
 EURON_API_KEY = os.getenv("EURON_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-if not EURON_API_KEY and not GROQ_API_KEY:
-    raise ValueError("No TTS API keys provided (EURON or GROQ).")
+
+# API bases can be pointed at a local stand-in (see benchmarks/mock_api_server.py)
+EURON_API_BASE = os.getenv("EURON_API_BASE", "https://api.euron.one/api/v1/euri")
+GROQ_API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1")
 
 # Euron TTS
-EURON_TTS_URL = "https://api.euron.one/api/v1/euri/audio/speech"
+EURON_TTS_URL = f"{EURON_API_BASE}/audio/speech"
 EURON_TTS_MODEL = "playai-tts"
 
 # Groq TTS fallback
-GROQ_TTS_URL = "https://api.groq.com/openai/v1/audio/speech"
+GROQ_TTS_URL = f"{GROQ_API_BASE}/audio/speech"
 GROQ_TTS_MODEL = "playai-tts"  # adjust if Groq provides a different id
 
 TIMEOUT = 120
 
+# Narrations are split at sentence boundaries and synthesized concurrently, then stitched.
+# TTS_SHARDING=0 sends each narration as a single request.
+SHARDING = os.getenv("TTS_SHARDING", "1") != "0"
+SHARD_CONCURRENCY = int(os.getenv("TTS_SHARD_CONCURRENCY", "4"))
+SHARD_RETRIES = int(os.getenv("TTS_SHARD_RETRIES", "2"))
+# Sentences shorter than this ride along with a neighbour instead of costing a request.
+MIN_SHARD_CHARS = 40
+SENTENCE_PAUSE_S = float(os.getenv("TTS_SENTENCE_PAUSE", "0.25"))
+CROSSFADE_S = 0.015
+
 
 def generate_tts_euron(text: str) -> bytes:
+    import requests
     headers = {"Authorization": f"Bearer {EURON_API_KEY}", "Content-Type": "application/json"}
     payload = {"model": EURON_TTS_MODEL, "input": text}
     r = requests.post(EURON_TTS_URL, headers=headers, json=payload, timeout=TIMEOUT)
@@ -41,6 +59,7 @@ def generate_tts_euron(text: str) -> bytes:
 
 
 def generate_tts_groq(text: str) -> bytes:
+    import requests
     headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
     payload = {"model": GROQ_TTS_MODEL, "input": text}
     r = requests.post(GROQ_TTS_URL, headers=headers, json=payload, timeout=TIMEOUT)
@@ -48,6 +67,12 @@ def generate_tts_groq(text: str) -> bytes:
     return r.content
 
 
+providers.register("tts", "euron", generate_tts_euron, label=f"euron:{EURON_TTS_MODEL}",
+                   available=lambda: bool(EURON_API_KEY))
+providers.register("tts", "groq", generate_tts_groq, label=f"groq:{GROQ_TTS_MODEL}",
+                   available=lambda: bool(GROQ_API_KEY))
+
+
 def load_script_json(script_path: Path):
     if not script_path.exists():
         raise FileNotFoundError(f"Script file not found: {script_path}")
@@ -61,50 +86,118 @@ def load_script_json(script_path: Path):
     return data
 
 
-def process_story_script(base_output_dir: Path):
-    log_step("TTS generation step")
-    script_path = base_output_dir / "script" / "story.json"
-    scenes = load_script_json(script_path)
-
-    audio_dir = base_output_dir / "audio_segments"
-    audio_dir.mkdir(parents=True, exist_ok=True)
-
-    for scene in scenes:
-        if not isinstance(scene, dict):
-            log_warn(f"Skipping invalid scene: {scene}")
-            continue
-        scene_number = scene.get("scene_number")
-        narration = scene.get("narration")
-        if not narration:
-            log_warn(f"Scene {scene_number} missing narration, skipping.")
-            continue
-
-        audio_bytes = None
-        # Try Euron first
-        if EURON_API_KEY:
+def record_duration(text: str, voice: str, audio_path: Path, seconds: float):
+    """Feed the measured length of a fresh TTS clip to the duration model (never fatal)."""
+    try:
+        model = default_model()
+        predicted = model.predict(text, voice)
+        model.observe(text, voice, seconds, source=source_key(audio_path))
+        safe_print(f"Scene audio {seconds:.2f}s (predicted {predicted:.2f}s)")
+    except Exception as e:
+        log_warn(f"Could not record TTS duration for {audio_path}: {e}")
+
+
+def synthesize(text: str, scene_number, shard: int = None, retries: int = 0) -> bytes:
+    """
+    One TTS request with provider fallback (the configured chain, Euron then Groq by
+    default), retried up to ``retries`` more times. Raises if nothing was produced.
+    """
+    chain = providers.resolve("tts")
+    last_error = None
+    attempt = 0
+    for _ in range(retries + 1):
+        for provider in chain:
+            attempt += 1
             try:
-                audio_bytes = generate_tts_euron(narration)
-                audio_path = audio_dir / f"scene_{scene_number}.mp3"
-                with open(audio_path, "wb") as f:
-                    f.write(audio_bytes)
-                log_success(f"Euron TTS saved: {audio_path}")
+                with span("tts_request", stage="tts", scene=scene_number, shard=shard,
+                          provider=provider.name, attempt=attempt) as sp:
+                    audio_bytes = provider(text)
+                    sp.set(bytes=len(audio_bytes))
+                return audio_bytes
             except Exception as e:
-                log_warn(f"Euron TTS failed for scene {scene_number}: {e}")
+                last_error = e
+                log_warn(f"{provider.name.title()} TTS failed for scene {scene_number}"
+                         f"{'' if shard is None else f' sentence {shard}'}: {e}")
+    raise RuntimeError(f"No TTS produced: {last_error}")
 
-        # If no audio, try Groq
-        if audio_bytes is None and GROQ_API_KEY:
-            try:
-                audio_bytes = generate_tts_groq(narration)
-                audio_path = audio_dir / f"scene_{scene_number}.mp3"
-                with open(audio_path, "wb") as f:
-                    f.write(audio_bytes)
-                log_success(f"Groq TTS saved: {audio_path}")
-            except Exception as e:
-                log_error(f"Groq TTS failed for scene {scene_number}: {e}")
 
-        if audio_bytes is None:
-            log_warn(f"Skipping scene {scene_number}; no TTS produced.")
+def synthesize_sharded(sentences: list, scene_number, audio_path: Path, pool: ThreadPoolExecutor) -> list:
+    """
+    Synthesize sentences concurrently (a failure retries only that sentence), stitch them
+    with fixed pauses and short fades into ``audio_path``; return per-sentence timings.
+    """
+    from utils.audio_stitch import decode_pcm, trim_silence, stitch, encode_mp3, encoder_lead
 
+    def shard(i_text):
+        i, text = i_text
+        audio_bytes = synthesize(text, scene_number, shard=i, retries=SHARD_RETRIES)
+        return trim_silence(decode_pcm(audio_bytes))
+
+    clips = list(pool.map(shard, enumerate(sentences, 1)))
+    pcm, spans = stitch(clips, pause_s=SENTENCE_PAUSE_S, crossfade_s=CROSSFADE_S)
+    encode_mp3(pcm, audio_path)
+    # Timings are for the mp3 as played, so they include any encoder delay the file keeps.
+    lead = encoder_lead(pcm, audio_path)
+    return [{"text": text, "start": round(max(0.0, start + lead), 3), "end": round(max(0.0, end + lead), 3)}
+            for text, (start, end) in zip(sentences, spans)]
+
+
+def _voice() -> str:
+    return providers.resolve("tts")[0].label
+
+
+@traced("tts_agent", stage="tts")
+def process_story_script(base_output_dir: Path, record_durations: bool = True, artifacts: RunArtifacts = None):
+    # Resolved when work starts rather than at import, so importing the agent stays cheap and safe.
+    providers.resolve("tts")
+    log_step("TTS generation step")
+    artifacts = artifacts or RunArtifacts(base_output_dir)
+    scenes = load_script_json(artifacts.fetch("script", "story.json"))
+    voice = _voice()
+    durations = {}
+
+    with ThreadPoolExecutor(max_workers=SHARD_CONCURRENCY, thread_name_prefix="tts-shard") as pool:
+        for scene in scenes:
+            if not isinstance(scene, dict):
+                log_warn(f"Skipping invalid scene: {scene}")
+                continue
+            scene_number = scene.get("scene_number")
+            narration = scene.get("narration")
+            if not narration:
+                log_warn(f"Scene {scene_number} missing narration, skipping.")
+                continue
+
+            audio_path = artifacts.path("audio_segments", f"scene_{scene_number}.mp3")
+            sentences = split_sentences(narration, MIN_SHARD_CHARS) if SHARDING else [narration]
+            with span("tts_scene", stage="tts", scene=scene_number, shards=len(sentences)) as scene_span:
+                try:
+                    if len(sentences) > 1:
+                        timings = synthesize_sharded(sentences, scene_number, audio_path, pool)
+                        artifacts.save("audio_segments", f"scene_{scene_number}.timing.json",
+                                       json.dumps(timings, ensure_ascii=False, indent=2))
+                    else:
+                        audio_bytes = synthesize(narration, scene_number)
+                        with open(audio_path, "wb") as f:
+                            f.write(audio_bytes)
+                    artifacts.publish("audio_segments", audio_path)
+                except Exception as e:
+                    scene_span.set(outcome="skipped")
+                    log_error(f"Skipping scene {scene_number}; no TTS produced: {e}")
+                    continue
+                log_success(f"TTS saved: {audio_path} ({len(sentences)} sentence shard(s))")
+                try:
+                    seconds = round(mp3_duration(audio_path), 6)
+                except Exception as e:
+                    log_warn(f"Could not measure {audio_path}: {e}")
+                    continue
+                # The size lets renders tell whether the clip was replaced after this manifest.
+                durations[scene_number] = {"seconds": seconds, "size": audio_path.stat().st_size}
+                if record_durations and not voice.startswith("local:"):  # synthetic voices would skew the pooled fit
+                    record_duration(narration, voice, audio_path, seconds)
+
+    # Renders plan the timeline from this manifest instead of opening every clip.
+    artifacts.save("audio_segments", DURATIONS_FILE, json.dumps(durations, indent=2))
+    artifacts.save("audio_segments", VOICE_FILE, voice)
     log_success("TTS generation completed.")
 
 
@@ -0,0 +1,261 @@
+# agents/variant_agent.py
+"""
+Dubbed language variants of a finished story.
+
+The narrations in script/story.json are translated into every target language with one
+batched LLM request, TTS runs only for the new narrations, and each language's video is
+rendered from the story's existing scene images (and the normalized frames cached by
+the first render), re-timed to the new narration. An extra language costs TTS plus one
+encode, never image generation.
+
+    python agents/variant_agent.py <base_output_dir> --languages=hi,es,en [--source=en]
+
+Per language: variants/<lang>/script/story.json and variants/<lang>/audio_segments/,
+with the video at video/final_story_<lang>.mp4.
+"""
+
+import os
+import sys
+import json
+import hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn, span, traced
+from utils.artifact_store import RunArtifacts
+
+LANGUAGE_NAMES = {
+    "en": "English", "hi": "Hindi", "es": "Spanish", "fr": "French", "de": "German", "pt": "Portuguese",
+    "bn": "Bengali", "ta": "Tamil", "te": "Telugu", "mr": "Marathi", "ja": "Japanese", "ar": "Arabic",
+}
+# Language the script agent writes in.
+SOURCE_LANGUAGE = os.getenv("STORY_LANGUAGE", "en")
+# Source words per translation request: ordinary stories fit in one, long-form ones are split.
+TRANSLATION_BATCH_WORDS = 1500
+MAX_PARALLEL_BATCHES = 4
+
+TRANSLATION_SYSTEM_PROMPT = (
+    "You are a translator for narrated stories. Return ONLY a valid JSON array. Each item must be an "
+    "object with language, scene_number, narration. Translate for reading aloud, keep names, and never "
+    "add, merge or drop scenes."
+)
+
+
+def language_name(code: str) -> str:
+    return LANGUAGE_NAMES.get(code.lower(), code)
+
+
+def _language_code(value: str, languages: list) -> str:
+    """Map what the model put in ``language`` ("hi", "Hindi", "HI") back to one of ``languages``."""
+    value = str(value or "").strip().lower()
+    for code in languages:
+        if value in (code.lower(), language_name(code).lower()):
+            return code
+    return value
+
+
+def _batches(scenes: list):
+    batch, words = [], 0
+    for scene in scenes:
+        n = len(scene["narration"].split())
+        if batch and words + n > TRANSLATION_BATCH_WORDS:
+            yield batch
+            batch, words = [], 0
+        batch.append(scene)
+        words += n
+    if batch:
+        yield batch
+
+
+def _translate_batch(scenes: list, languages: list) -> dict:
+    """One LLM request: ``{(language, scene_number): narration}`` for these scenes in every language."""
+    from agents.script_agent import complete_json_list
+
+    source = [{"scene_number": s["scene_number"], "narration": s["narration"]} for s in scenes]
+    targets = ", ".join(f"{code} ({language_name(code)})" for code in languages)
+    prompt = (
+        f"Translate the narration of every scene into each of these languages: {targets}.\n"
+        f"Put the language code in the language field.\n\nScenes:\n{json.dumps(source, ensure_ascii=False)}"
+    )
+    words = sum(len(s["narration"].split()) for s in scenes)
+    max_tokens = len(languages) * (words * 3 + 40 * len(scenes)) + 200
+    items = complete_json_list(prompt, TRANSLATION_SYSTEM_PROMPT, max_tokens=max_tokens, label="translation")
+
+    out = {}
+    for item in items:
+        try:
+            key = (_language_code(item["language"], languages), int(item["scene_number"]))
+            narration = str(item["narration"]).strip()
+        except (KeyError, TypeError, ValueError):
+            log_warn(f"Ignoring malformed translation item: {item}")
+            continue
+        if narration:
+            out[key] = narration
+    return out
+
+
+@traced("translate_story", stage="variants")
+def translate_scenes(scenes: list, languages: list) -> dict:
+    """``{language: {scene_number: narration}}``, in as few LLM requests as the story allows."""
+    batches = list(_batches(scenes))
+    log_step(f"Translating {len(scenes)} scenes into {', '.join(map(language_name, languages))} "
+             f"({len(batches)} request(s))")
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_BATCHES, len(batches))) as pool:
+        merged = {}
+        for result in pool.map(lambda batch: _translate_batch(batch, languages), batches):
+            merged.update(result)
+
+    missing = [(lang, s["scene_number"]) for lang in languages for s in scenes
+               if (lang, s["scene_number"]) not in merged]
+    if missing:
+        # Models occasionally skip an item; ask again for just the gaps, once.
+        log_warn(f"{len(missing)} translation(s) missing; requesting them again.")
+        numbers = {n for _, n in missing}
+        langs = sorted({lang for lang, _ in missing})
+        merged.update(_translate_batch([s for s in scenes if s["scene_number"] in numbers], langs))
+        missing = [key for key in missing if key not in merged]
+        if missing:
+            raise RuntimeError(f"Translation incomplete, missing (language, scene): {missing}")
+    return {lang: {s["scene_number"]: merged[(lang, s["scene_number"])] for s in scenes} for lang in languages}
+
+
+def _source_hash(narration: str) -> str:
+    return hashlib.sha1(narration.encode("utf-8")).hexdigest()[:16]
+
+
+def _saved_script(variant: RunArtifacts):
+    """The translated script a previous run saved for this language, if any."""
+    if not variant.exists("script", "story.json"):
+        return None
+    try:
+        saved = json.loads(variant.read_text("script", "story.json"))
+    except ValueError:
+        return None
+    return saved if isinstance(saved, list) else None
+
+
+def _saved_translation(saved: list, scenes: list):
+    """``saved``'s narrations, if they were translated from exactly the story's current narrations."""
+    if not saved:
+        return None
+    current = [(s["scene_number"], _source_hash(s["narration"])) for s in scenes]
+    if [(s.get("scene_number"), s.get("source_hash")) for s in saved if isinstance(s, dict)] != current:
+        return None
+    return {s["scene_number"]: s["narration"] for s in saved if isinstance(s, dict)}
+
+
+@traced("render_variant", stage="variants")
+def render_variant(artifacts: RunArtifacts, language: str, narration: RunArtifacts) -> str:
+    """Render one language from the story's images and that language's narration (``narration``'s audio_segments)."""
+    from agents.video_agent import (create_multiscene_video_streaming, get_scene_files, render_if_changed,
+                                    FINAL_FPS, FINAL_HEIGHT, DEFAULT_PROFILE)
+
+    # The story's images, re-timed to this language's narration (paired by scene number).
+    timeline = get_scene_files(artifacts.dir, artifacts, narration=narration)
+    video_dir = artifacts.dir / "video"
+    output_path = artifacts.path("video", f"final_story_{language}.mp4")
+    # Same frame cache as the story's own renders: scene images are normalized once for all languages.
+    render_if_changed(
+        artifacts, f"final_story_{language}", timeline, lambda: create_multiscene_video_streaming(
+            timeline, str(output_path), fps=FINAL_FPS, height=FINAL_HEIGHT,
+            cache_dir=video_dir / "_cache", source_height=FINAL_HEIGHT),
+        FINAL_FPS, height=FINAL_HEIGHT, profile=DEFAULT_PROFILE, renderer="streaming")
+    artifacts.publish("video", output_path)
+    return str(output_path)
+
+
+@traced("variant_agent", stage="variants")
+def create_variants(base_output_dir: Path, languages: list, source: str = SOURCE_LANGUAGE) -> dict:
+    """
+    Make every language variant of a finished story; returns ``{language: video path}``.
+
+    Translations already saved by an earlier run are reused while the story's narrations are
+    unchanged, and TTS reruns whenever a language's narration text changed. TTS for one
+    language overlaps with the encode of the previous one.
+    """
+    from agents.tts_agent import load_script_json, process_story_script
+
+    artifacts = RunArtifacts(base_output_dir)
+    scenes = [s for s in load_script_json(artifacts.fetch("script", "story.json"))
+              if isinstance(s, dict) and s.get("narration") and s.get("scene_number") is not None]
+    if not scenes:
+        raise ValueError("Story has no narrated scenes to translate.")
+    for scene in scenes:
+        scene["scene_number"] = int(scene["scene_number"])
+
+    videos = {}
+    targets = []
+    for lang in dict.fromkeys(languages):
+        if lang == source:
+            # The story itself is the source-language version.
+            if artifacts.exists("video", "final_story.mp4"):
+                source_video = artifacts.fetch("video", "final_story.mp4")
+                videos[lang] = str(source_video)
+                safe_print(f"{language_name(lang)}: using the original render {source_video}")
+                continue
+        targets.append(lang)
+
+    translations, to_translate, previous = {}, [], {}
+    for lang in targets:
+        previous[lang] = _saved_script(artifacts.scoped(f"variants/{lang}")) if lang != source else None
+        saved = _saved_translation(previous[lang], scenes)
+        if lang == source:
+            translations[lang] = {s["scene_number"]: s["narration"] for s in scenes}
+        elif saved:
+            translations[lang] = saved
+        else:
+            to_translate.append(lang)
+    if to_translate:
+        translations.update(translate_scenes(scenes, to_translate))
+
+    renders = {}
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="variant-render") as render_pool:
+        for lang in targets:
+            if lang == source:
+                # Re-rendered from the story's own script and narration; there is no variant to save.
+                renders[lang] = render_pool.submit(render_variant, artifacts, lang, artifacts)
+                continue
+            variant = artifacts.scoped(f"variants/{lang}")
+            script = [dict(s, narration=translations[lang][s["scene_number"]], language=lang,
+                           source_hash=_source_hash(s["narration"])) for s in scenes]
+            variant.save("script", "story.json", json.dumps(script, indent=2, ensure_ascii=False))
+
+            text_changed = [s.get("narration") for s in previous[lang] or []] != [s["narration"] for s in script]
+            if text_changed or not ({f"scene_{s['scene_number']}.mp3" for s in scenes}
+                                    <= set(variant.names("audio_segments"))):
+                try:
+                    with span("variant_tts", stage="variants", language=lang):
+                        # Duration-model features are English-only, so translated clips are not recorded.
+                        process_story_script(variant.dir, record_durations=(lang == "en"), artifacts=variant)
+                except Exception as e:
+                    log_error(f"{language_name(lang)} variant failed: no narration ({e})")
+                    continue
+            renders[lang] = render_pool.submit(render_variant, artifacts, lang, variant)
+
+        for lang, future in renders.items():
+            try:
+                videos[lang] = future.result()
+                log_success(f"{language_name(lang)} variant: {videos[lang]}")
+            except Exception as e:
+                log_error(f"{language_name(lang)} variant failed: {e}")
+    return videos
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    languages, source = [], SOURCE_LANGUAGE
+    for a in sys.argv[1:]:
+        if a.startswith("--languages="):
+            languages = [code.strip() for code in a.split("=", 1)[1].split(",") if code.strip()]
+        elif a.startswith("--source="):
+            source = a.split("=", 1)[1]
+    if not args or not languages:
+        print("Usage: python agents/variant_agent.py <base_output_dir> --languages=hi,es,en [--source=en]")
+        sys.exit(1)
+    videos = create_variants(Path(args[0]), languages, source)
+    if len(videos) < len(set(languages)):
+        sys.exit(1)
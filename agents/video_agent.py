@@ -1,6 +1,11 @@
 # agents/video_agent.py
 import os
 import sys
+import json
+import math
+import wave
+import subprocess
+import tempfile
 from pathlib import Path
 
 
@@ -8,84 +13,635 @@ ROOT_DIR = Path(__file__).resolve().parents[1]
 if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
     
-from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn
+from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn, span, traced, current_span
+from utils.render_settings import encoder_settings, load_calibration, DEFAULT_PROFILE
+from utils.artifact_store import RunArtifacts
+from utils.timeline import Timeline, RenderPlan, run_timeline, diff
 import PIL.Image
-if not hasattr(PIL.Image, "ANTIALIAS"):
-    PIL.Image.ANTIALIAS = PIL.Image.LANCZOS
 
-import moviepy.editor as mpy
+AUDIO_FPS = 44100
 
-def create_multiscene_video(image_paths, audio_paths, output_path, bg_music_path=None,
-                            bg_music_volume=0.15, fade_duration=1.0, fps=24, height=720):
-    if not image_paths or not audio_paths:
-        raise ValueError("No image or audio files provided.")
 
-    # align lengths: choose min to ensure no index error
-    n = min(len(image_paths), len(audio_paths))
-    if len(image_paths) != len(audio_paths):
-        log_warn(f"Image/audio count mismatch. Trimming to {n} scenes.")
+def _mpy():
+    """
+    moviepy.editor, imported on first use: it drags in IPython and friends (~0.5s),
+    which only the moviepy code paths need, not every import of this module.
+    """
+    if not hasattr(PIL.Image, "ANTIALIAS"):
+        PIL.Image.ANTIALIAS = PIL.Image.LANCZOS
+    import moviepy.editor as mpy
+    return mpy
 
-    scene_clips = []
-    for idx in range(n):
-        img = image_paths[idx]
-        aud = audio_paths[idx]
-        audio_clip = mpy.AudioFileClip(aud)
-        img_clip = mpy.ImageClip(img).set_duration(audio_clip.duration).resize(height=height)
-        clip = img_clip.set_audio(audio_clip)
-        if idx > 0:
-            clip = clip.fadein(fade_duration)
-        if idx < n - 1:
-            clip = clip.fadeout(fade_duration)
-        scene_clips.append(clip)
-        safe_print(f"Added scene {idx+1}: {img} + {aud} ({audio_clip.duration:.2f}s)")
-
-    final_clip = mpy.concatenate_videoclips(scene_clips, method="compose")
-
-    # optional background music
-    if bg_music_path and os.path.exists(bg_music_path):
+
+def _scene_clip(mpy, plan: RenderPlan, idx: int, height: int):
+    """moviepy clip of one planned scene: the still for exactly its frames, narration and fades."""
+    scene = plan.scenes[idx]
+    duration = plan.frame_count(idx) / plan.fps
+    audio_clip = mpy.AudioFileClip(scene.audio)
+    img_clip = mpy.ImageClip(scene.image).set_duration(duration).resize(height=height)
+    clip = img_clip.set_audio(audio_clip.subclip(0, min(duration, audio_clip.duration)))
+    if scene.fade_in:
+        clip = clip.fadein(scene.fade_in)
+    if scene.fade_out:
+        clip = clip.fadeout(scene.fade_out)
+    return clip
+
+
+def _add_audio_layers(mpy, plan: RenderPlan, final_clip):
+    """Mix the plan's audio layers (music bed) under ``final_clip``'s narration."""
+    for layer in plan.layers:
         try:
-            bg = mpy.AudioFileClip(bg_music_path).volumex(bg_music_volume).set_duration(final_clip.duration)
-            final_clip = final_clip.set_audio(mpy.CompositeAudioClip([final_clip.audio, bg]))
-            safe_print(f"Background music added: {bg_music_path}")
+            bed = mpy.AudioFileClip(layer.path).volumex(layer.volume).set_duration(final_clip.duration)
+            final_clip = final_clip.set_audio(mpy.CompositeAudioClip([final_clip.audio, bed]))
+            safe_print(f"Background music added: {layer.path}")
         except Exception as e:
             log_warn(f"Could not add background music: {e}")
+    return final_clip
+
+
+@traced("render_composed", stage="video")
+def create_multiscene_video(timeline: Timeline, output_path, fps=24, height=720, profile=None):
+    plan = timeline.compile(fps)
+    mpy = _mpy()
+
+    scene_clips = []
+    for idx, scene in enumerate(plan.scenes):
+        scene_clips.append(_scene_clip(mpy, plan, idx, height))
+        safe_print(f"Added scene {scene.number}: {scene.image} + {scene.audio} ({scene.duration:.2f}s)")
+
+    final_clip = _add_audio_layers(mpy, plan, mpy.concatenate_videoclips(scene_clips, method="compose"))
 
     # ensure output dir
     Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    if current_span():
+        current_span().set(frames=plan.total_frames)
 
-    final_clip.write_videofile(
-        output_path, fps=fps, codec="libx264", audio_codec="aac",
-        threads=4, preset="medium", temp_audiofile=str(Path(output_path).with_name("_temp_audio.m4a")),
-        remove_temp=True
-    )
+    with encoder_settings(profile, fps=fps, height=height) as enc:
+        safe_print(f"Encoder: preset={enc['preset']} threads={enc['threads']} profile={enc['profile']}")
+        final_clip.write_videofile(
+            output_path, fps=fps, codec="libx264", audio_codec="aac",
+            threads=enc["threads"], preset=enc["preset"], ffmpeg_params=enc["ffmpeg_params"],
+            temp_audiofile=str(Path(output_path).with_name("_temp_audio.m4a")),
+            remove_temp=True
+        )
     log_success(f"Final video created: {output_path}")
     return output_path
 
 
-def get_scene_files(base_output_dir: Path):
-    image_dir = base_output_dir / "images"
-    audio_dir = base_output_dir / "audio_segments"
-    if not image_dir.exists() or not audio_dir.exists():
-        raise FileNotFoundError("Missing images or audio_segments directory.")
+def _target_size(img_path, height):
+    """Size of an image scaled to ``height``, with an even width for libx264."""
+    with PIL.Image.open(img_path) as im:
+        w, h = im.size
+    width = int(round(w * height / h))
+    return width + (width % 2), height
+
+
+def _cache_key(*parts):
+    """Short content key from file paths (with their mtimes) and plain values."""
+    import hashlib
+
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, (str, Path)) and os.path.exists(part):
+            part = f"{part}:{os.path.getmtime(part)}"
+        h.update(str(part).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _scene_image(img_path, height, cache_dir=None):
+    """
+    Scene image decoded to RGB and scaled to ``height``.
+
+    With ``cache_dir`` the normalized pixels are kept as .npy, so previews and the final
+    render decode and resample each source image only once.
+    """
+    import numpy as np
+
+    cached = Path(cache_dir) / f"frame_{_cache_key(img_path, height)}.npy" if cache_dir else None
+    if cached is not None and cached.exists():
+        return PIL.Image.fromarray(np.load(cached))
+    with PIL.Image.open(img_path) as im:
+        im = im.convert("RGB")
+        scaled_w = max(1, int(round(im.width * height / im.height)))
+        im = im.resize((scaled_w, height), PIL.Image.LANCZOS)
+    if cached is not None:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        np.save(cached, np.asarray(im, dtype=np.uint8))
+    return im
+
+
+def _load_frame(img_path, canvas_size, cache_dir=None, source_height=None):
+    """Scene image scaled to the canvas height and centred on black, as an RGB array."""
+    import numpy as np
+
+    width, height = canvas_size
+    im = _scene_image(img_path, source_height or height, cache_dir)
+    if im.height != height or im.width > width:
+        scaled_w = max(1, int(round(im.width * height / im.height)))
+        im = im.resize((min(scaled_w, width), height), PIL.Image.LANCZOS)
+    canvas = PIL.Image.new("RGB", canvas_size)
+    canvas.paste(im, ((width - im.width) // 2, 0))
+    return np.asarray(canvas, dtype=np.uint8)
+
+
+def _write_scene_audio(wav, plan: RenderPlan, idx: int, beds):
+    """
+    Append scene ``idx``'s narration, mixed with its slice of each ``(clip, volume)`` bed,
+    to ``wav``: exactly the scene's planned samples, trimmed or padded with silence.
+    """
+    mpy = _mpy()
+    first, end = plan.samples(idx, AUDIO_FPS)
+    start, wanted = first / AUDIO_FPS, end - first
+    narration = mpy.AudioFileClip(plan.scenes[idx].audio, fps=AUDIO_FPS)
+    duration = min(narration.duration, wanted / AUDIO_FPS)
+    clip = narration
+    layers = [bed.subclip(start, min(start + duration, bed.duration)).volumex(volume)
+              for bed, volume in beds if start < bed.duration]
+    if layers:
+        clip = mpy.CompositeAudioClip([narration, *layers]).set_duration(duration)
+    written = 0
+    try:
+        for chunk in clip.iter_chunks(chunk_duration=1.0, fps=AUDIO_FPS, quantize=True, nbytes=2):
+            chunk = chunk[:wanted - written]
+            wav.writeframes(chunk.tobytes())
+            written += len(chunk)
+    finally:
+        narration.close()
+    if written < wanted:
+        wav.writeframes(bytes(4 * (wanted - written)))  # 16-bit stereo silence
+
+
+HLS_SEGMENT_SECONDS = 4
+HLS_PLAYLIST = "stream.m3u8"
+
+
+def _tee_path(path):
+    """Escape a path for use inside ffmpeg's tee muxer spec."""
+    return Path(path).as_posix().replace("\\", "\\\\").replace(":", "\\:").replace("|", "\\|").replace("[", "\\[")
+
+
+def _open_encoder(output_path, size, fps, audio_path, threads=4, preset="medium", ffmpeg_params=(), hls_dir=None):
+    """
+    Start the single ffmpeg process that receives raw RGB frames on stdin.
+
+    With ``hls_dir`` the same encode is also muxed (tee) into fragmented-MP4 HLS segments
+    and an EVENT playlist that grows while rendering, so playback can start early.
+    """
+    import imageio_ffmpeg
+
+    cmd = [
+        imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-vcodec", "rawvideo", "-pix_fmt", "rgb24",
+        "-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "-",
+        "-i", str(audio_path),
+        "-c:v", "libx264", "-preset", preset, "-threads", str(threads), *ffmpeg_params, "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest",
+    ]
+    if hls_dir is None:
+        cmd.append(str(output_path))
+    else:
+        Path(hls_dir).mkdir(parents=True, exist_ok=True)
+        gop = str(fps * HLS_SEGMENT_SECONDS)
+        hls_opts = (f"f=hls:hls_time={HLS_SEGMENT_SECONDS}:hls_list_size=0:"
+                    f"hls_playlist_type=event:hls_segment_type=fmp4")
+        cmd += [
+            "-map", "0:v", "-map", "1:a", "-g", gop, "-keyint_min", gop, "-sc_threshold", "0",
+            "-f", "tee",
+            f"[f=mp4]{_tee_path(output_path)}|[{hls_opts}]{_tee_path(Path(hls_dir) / HLS_PLAYLIST)}",
+        ]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def _mix_audio(plan: RenderPlan, wav_path):
+    """Stream narration (plus the plan's audio layers) scene by scene into ``wav_path``."""
+    beds = []
+    for layer in plan.layers:
+        try:
+            beds.append((_mpy().AudioFileClip(layer.path, fps=AUDIO_FPS), layer.volume))
+        except Exception as e:
+            log_warn(f"Could not add background music: {e}")
+
+    with span("mix_audio", stage="video"), wave.open(str(wav_path), "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(AUDIO_FPS)
+        for idx in range(len(plan)):
+            _write_scene_audio(wav, plan, idx, beds)
+    for bed, _ in beds:
+        bed.close()
+    for layer in plan.layers[:len(beds)]:
+        safe_print(f"Background music added: {layer.path}")
+
+
+def _cached_audio_mix(plan: RenderPlan, cache_dir):
+    """Audio mix shared by preview and final renders; rebuilt only when its inputs change."""
+    key = _cache_key(*plan.audio_paths, *plan.times, *(f"{l.path}:{l.volume}" for l in plan.layers))
+    wav_path = Path(cache_dir) / f"mix_{key}.wav"
+    if wav_path.exists():
+        safe_print(f"Reusing cached audio mix: {wav_path}")
+        return wav_path
+    wav_path.parent.mkdir(parents=True, exist_ok=True)
+    partial = wav_path.with_name(f".{wav_path.name}.{os.getpid()}")
+    _mix_audio(plan, partial)
+    os.replace(partial, wav_path)
+    return wav_path
+
+
+def _pipe_frames(encoder, plan: RenderPlan, canvas_size, cache_dir=None, source_height=None,
+                 output_path=None, on_frame=None):
+    """
+    Generate every planned frame scene by scene into ``encoder``'s stdin, fading to black
+    between scenes; wait for ffmpeg and return the number of frames written.
+
+    ``on_frame(frame_no, frame, gain)`` is called for each frame, with the scene's still
+    image (already in memory) and the fade gain applied to it.
+    """
+    n = len(plan)
+    frames_written = 0
+    try:
+        next_frame = _load_frame(plan.scenes[0].image, canvas_size, cache_dir, source_height)
+        for idx, scene in enumerate(plan.scenes):
+            with span("encode_scene", stage="video", scene=scene.number):
+                frame = next_frame
+                next_frame = (_load_frame(plan.scenes[idx + 1].image, canvas_size, cache_dir, source_height)
+                              if idx + 1 < n else None)
+
+                count = plan.frame_count(idx)
+                still = frame.tobytes()
+                for i in range(count):
+                    gain = plan.gain(idx, i)
+                    if on_frame is not None:
+                        on_frame(frames_written + i, frame, gain)
+                    encoder.stdin.write(still if gain >= 1.0 else (frame * gain).astype("uint8").tobytes())
+
+                frames_written += count
+                safe_print(f"Streamed scene {scene.number}: {scene.image} + {scene.audio} ({scene.duration:.2f}s)")
+        encoder.stdin.close()
+    except BrokenPipeError:
+        pass
+    finally:
+        err = encoder.stderr.read().decode("utf-8", "ignore")
+        encoder.wait()
+    if encoder.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed while streaming {output_path}: {err.strip()}")
+    return frames_written
+
+
+@traced("render_streaming", stage="video")
+def create_multiscene_video_streaming(timeline: Timeline, output_path, fps=24, height=720, profile=None,
+                                      cache_dir=None, source_height=None, hls_dir=None):
+    """
+    Constant-memory variant of ``create_multiscene_video`` for long-form stories.
+
+    Narration (plus music) is first streamed scene by scene into a WAV, then frames are
+    generated scene by scene and piped into one ffmpeg encoder. Only the current and next
+    scene frames are held in memory, so peak RSS does not grow with the length of the
+    video. Fades go to black, exactly like the composed renderer.
+
+    With ``cache_dir`` the audio mix and normalized images (at ``source_height``) are kept
+    and reused, which is how a draft preview and the final render share their work.
+    With ``hls_dir`` an HLS playlist is written alongside the MP4 as scenes are encoded.
+    """
+    plan = timeline.compile(fps)
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    canvas_size = _target_size(plan.scenes[0].image, height)
+
+    if cache_dir:
+        wav_path = _cached_audio_mix(plan, cache_dir)
+        temp_wav = None
+    else:
+        fd, temp_wav = tempfile.mkstemp(suffix=".wav", dir=str(Path(output_path).parent))
+        os.close(fd)
+        wav_path = temp_wav
+    try:
+        if not cache_dir:
+            # Pass 1: audio, one scene at a time.
+            _mix_audio(plan, wav_path)
+
+        # Pass 2: video frames into a single encoder.
+        with encoder_settings(profile, fps=fps, height=height) as enc:
+            encoder = _open_encoder(output_path, canvas_size, fps, wav_path, threads=enc["threads"],
+                                    preset=enc["preset"], ffmpeg_params=enc["ffmpeg_params"], hls_dir=hls_dir)
+            frames_written = _pipe_frames(encoder, plan, canvas_size, cache_dir, source_height, output_path)
+        if current_span():
+            current_span().set(frames=frames_written)
+    finally:
+        if temp_wav and os.path.exists(temp_wav):
+            os.remove(temp_wav)
+
+    log_success(f"Final video created (streaming): {output_path}")
+    return output_path
+
+
+# Multi-format output: name -> aspect ratio. The render height is each format's short side.
+FORMATS = {"landscape": (16, 9), "vertical": (9, 16), "square": (1, 1)}
+SPRITE_INTERVAL_S = 5.0
+SPRITE_THUMB_WIDTH = 160
+SPRITE_COLUMNS = 10
+
+
+def _format_size(aspect, short_side):
+    aw, ah = aspect
+    w, h = (short_side * aw / ah, short_side) if aw >= ah else (short_side, short_side * ah / aw)
+    return int(round(w / 2)) * 2, int(round(h / 2)) * 2
+
+
+def _cover_crop(src_size, out_size):
+    """Largest centred ``(w, h, x, y)`` region of ``src_size`` with the aspect of ``out_size``."""
+    src_w, src_h = src_size
+    out_w, out_h = out_size
+    if out_w * src_h > out_h * src_w:  # output is wider than the source
+        w, h = src_w, int(src_w * out_h / out_w)
+    else:
+        w, h = int(src_h * out_w / out_h), src_h
+    w, h = w - w % 2, h - h % 2
+    return w, h, (src_w - w) // 2, (src_h - h) // 2
+
+
+def _master_height(img_path, out_sizes):
+    """Height of the shared canvas at which every format's crop is at least its output size."""
+    with PIL.Image.open(img_path) as im:
+        src_w, src_h = im.size
+    need = max((out_w * src_h / src_w) if out_w * src_h > out_h * src_w else out_h for out_w, out_h in out_sizes)
+    return int(math.ceil(need / 2)) * 2
+
+
+def _encode_audio(wav_path, m4a_path):
+    """AAC-encode the mix once; every format copies the same stream."""
+    import imageio_ffmpeg
+
+    if Path(m4a_path).exists():
+        return m4a_path
+    with span("encode_audio", stage="video"):
+        subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error", "-i", str(wav_path),
+                        "-c:a", "aac", "-b:a", "192k", str(m4a_path)], check=True, capture_output=True)
+    return m4a_path
+
+
+def _open_multi_encoder(outputs, master_size, fps, audio_path, threads=4, preset="medium", ffmpeg_params=()):
+    """
+    One ffmpeg process for every format: the raw frames on stdin are split in the filter
+    graph, cropped and scaled per format and encoded side by side; audio is stream-copied.
+
+    ``outputs`` is a list of ``(path, (w, h), (crop_w, crop_h, crop_x, crop_y))``.
+    """
+    import imageio_ffmpeg
+
+    n = len(outputs)
+    graph = [f"[0:v]split={n}" + "".join(f"[s{i}]" for i in range(n))]
+    for i, (_, (out_w, out_h), (cw, ch, cx, cy)) in enumerate(outputs):
+        graph.append(f"[s{i}]crop={cw}:{ch}:{cx}:{cy},scale={out_w}:{out_h}:flags=lanczos,setsar=1[o{i}]")
+    cmd = [
+        imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-vcodec", "rawvideo", "-pix_fmt", "rgb24",
+        "-s", f"{master_size[0]}x{master_size[1]}", "-r", str(fps), "-i", "-",
+        "-i", str(audio_path), "-filter_complex", ";".join(graph),
+    ]
+    per_output_threads = str(max(1, threads // n))
+    for i, (path, _, _) in enumerate(outputs):
+        cmd += ["-map", f"[o{i}]", "-map", "1:a",
+                "-c:v", "libx264", "-preset", preset, "-threads", per_output_threads, *ffmpeg_params,
+                "-pix_fmt", "yuv420p", "-c:a", "copy", "-shortest", str(path)]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+class _FrameTaps:
+    """Keeps a poster frame and sprite thumbnails from frames already generated for encoding."""
+
+    def __init__(self, poster_frame, sprite_every, crop, thumb_size):
+        self.poster_frame, self.sprite_every = poster_frame, sprite_every
+        self.crop, self.thumb_size = crop, thumb_size
+        self.poster, self.thumbs = None, []
+
+    def __call__(self, frame_no, frame, gain):
+        if frame_no == self.poster_frame:
+            self.poster = frame
+        if self.sprite_every and frame_no % self.sprite_every == 0:
+            cw, ch, cx, cy = self.crop
+            pixels = frame if gain >= 1.0 else (frame * gain).astype("uint8")
+            thumb = PIL.Image.fromarray(pixels[cy:cy + ch, cx:cx + cw]).resize(self.thumb_size, PIL.Image.BILINEAR)
+            self.thumbs.append(thumb)
+
+
+def _vtt_time(seconds):
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{int(h):02d}:{int(m):02d}:{s:06.3f}"
+
+
+def _write_sprites(thumbs, interval_s, total_s, sheet_path):
+    """Tile thumbnails into one JPEG plus a WebVTT index (``#xywh``) for player scrubbing."""
+    w, h = thumbs[0].size
+    rows = int(math.ceil(len(thumbs) / SPRITE_COLUMNS))
+    sheet = PIL.Image.new("RGB", (w * min(SPRITE_COLUMNS, len(thumbs)), h * rows))
+    cues = ["WEBVTT", ""]
+    for i, thumb in enumerate(thumbs):
+        x, y = (i % SPRITE_COLUMNS) * w, (i // SPRITE_COLUMNS) * h
+        sheet.paste(thumb, (x, y))
+        start, end = i * interval_s, min(total_s, (i + 1) * interval_s)
+        cues += [f"{_vtt_time(start)} --> {_vtt_time(end)}", f"{Path(sheet_path).name}#xywh={x},{y},{w},{h}", ""]
+    sheet.save(sheet_path, quality=80)
+    vtt_path = Path(sheet_path).with_suffix(".vtt")
+    vtt_path.write_text("\n".join(cues), encoding="utf-8")
+    return str(vtt_path)
+
+
+@traced("render_multiformat", stage="video")
+def create_multiformat_video(timeline: Timeline, output_path, formats=tuple(FORMATS), fps=24, height=720,
+                             profile=None, cache_dir=None, sprite_interval=SPRITE_INTERVAL_S):
+    """
+    Render several aspect-ratio cuts of the story in one pass.
+
+    Frames are generated once on a shared canvas and piped into a single ffmpeg whose
+    filter graph splits them into a centre crop per format; the audio mix is made and
+    AAC-encoded once and copied into every output, so each extra format costs roughly
+    one more video encode. The first format is written to ``output_path``, the others
+    next to it as ``<stem>_<format>.mp4``. A poster JPEG per format and a thumbnail
+    sprite sheet (with a WebVTT index) are cut from frames already in memory.
+
+    Returns ``{"videos": {format: path}, "posters": {format: path}, "sprites": path, "sprites_vtt": path}``.
+    """
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown or not formats:
+        raise ValueError(f"Unknown output formats: {unknown} (choose from {', '.join(FORMATS)})")
+    plan = timeline.compile(fps)
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    out_sizes = [_format_size(FORMATS[f], height) for f in formats]
+    first_image = plan.scenes[0].image
+    master_size = _target_size(first_image, _master_height(first_image, out_sizes))
+    outputs, videos = [], {}
+    for i, (fmt, size) in enumerate(zip(formats, out_sizes)):
+        path = output_path if i == 0 else output_path.with_name(f"{output_path.stem}_{fmt}{output_path.suffix}")
+        videos[fmt] = str(path)
+        outputs.append((path, size, _cover_crop(master_size, size)))
+
+    work_dir = Path(cache_dir) if cache_dir else Path(tempfile.mkdtemp(dir=str(output_path.parent)))
+    try:
+        if cache_dir:
+            wav_path = _cached_audio_mix(plan, cache_dir)
+        else:
+            wav_path = work_dir / "mix.wav"
+            _mix_audio(plan, wav_path)
+        m4a_path = _encode_audio(wav_path, Path(wav_path).with_suffix(".m4a"))
+
+        primary_crop = outputs[0][2]
+        thumb_w = SPRITE_THUMB_WIDTH
+        thumb_size = (thumb_w, int(round(thumb_w * primary_crop[1] / primary_crop[0])))
+        taps = _FrameTaps(poster_frame=plan.frame_count(0) // 2, sprite_every=int(round(sprite_interval * fps)),
+                          crop=primary_crop, thumb_size=thumb_size)
+
+        with encoder_settings(profile, fps=fps, height=height) as enc:
+            encoder = _open_multi_encoder(outputs, master_size, fps, m4a_path, threads=enc["threads"],
+                                          preset=enc["preset"], ffmpeg_params=enc["ffmpeg_params"])
+            frames_written = _pipe_frames(encoder, plan, master_size, cache_dir, None, output_path, on_frame=taps)
+        if current_span():
+            current_span().set(frames=frames_written * len(outputs), formats=len(outputs))
+    finally:
+        if not cache_dir:
+            import shutil
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    posters = {}
+    if taps.poster is not None:
+        for fmt, (path, size, (cw, ch, cx, cy)) in zip(formats, outputs):
+            poster = Path(path).with_suffix(".jpg")
+            PIL.Image.fromarray(taps.poster[cy:cy + ch, cx:cx + cw]).resize(size, PIL.Image.LANCZOS).save(poster, quality=90)
+            posters[fmt] = str(poster)
+    sprites = sprites_vtt = None
+    if taps.thumbs:
+        sprites = str(output_path.with_name(f"{output_path.stem}_sprites.jpg"))
+        sprites_vtt = _write_sprites(taps.thumbs, sprite_interval, frames_written / fps, sprites)
+
+    for fmt, path in videos.items():
+        log_success(f"Final video created ({fmt}): {path}")
+    return {"videos": videos, "posters": posters, "sprites": sprites, "sprites_vtt": sprites_vtt}
+
+
+BG_MUSIC = "assets/bg_music.mp3"
+BG_MUSIC_VOLUME = 0.18
+FADE_S = 1.0
+
+
+def get_scene_files(base_output_dir: Path, artifacts: RunArtifacts = None, narration: RunArtifacts = None) -> Timeline:
+    """
+    The run's timeline: scene_N.jpg and scene_N.mp3 paired by scene number (from
+    ``narration``'s audio_segments when given), with crossfades and the music bed.
+    """
+    artifacts = artifacts or RunArtifacts(base_output_dir)
+    return run_timeline(artifacts, narration, fade=FADE_S, music=BG_MUSIC, music_volume=BG_MUSIC_VOLUME)
+
+
+def _output_paths(result) -> list:
+    """Files a render produced: one path, or create_multiformat_video's dict of them."""
+    if isinstance(result, dict):
+        paths = [*result["videos"].values(), *result["posters"].values(), result["sprites"], result["sprites_vtt"]]
+    else:
+        paths = [result]
+    return [p for p in paths if p]
+
+
+def _publish_outputs(artifacts: RunArtifacts, result):
+    for path in _output_paths(result):
+        artifacts.publish("video", path)
+    return result
+
+
+def render_if_changed(artifacts: RunArtifacts, name: str, timeline: Timeline, render, fps, **settings):
+    """
+    Run ``render()`` unless the previous render of ``name`` used the same plan and
+    settings and its outputs still exist; the plan diff says what forced a re-render.
+    """
+    record = artifacts.dir / "video" / "_cache" / f"{name}.plan.json"
+    plan = timeline.compile(fps)
+    settings = json.loads(json.dumps(settings))
+    try:
+        saved = json.loads(record.read_text(encoding="utf-8"))
+        previous = RenderPlan.from_dict(saved["plan"]) if saved["settings"] == settings else None
+    except (OSError, ValueError, KeyError):
+        saved = previous = None
+    if previous is not None:
+        changes = diff(previous, plan)
+        if not (changes["scenes"] or changes["removed"] or changes["audio"]) \
+                and all(os.path.exists(p) for p in _output_paths(saved["result"])):
+            safe_print(f"{name} is up to date ({len(plan)} scenes, {plan.total_frames} frames)")
+            return saved["result"]
+        spans = ", ".join(f"{a / fps:.1f}-{b / fps:.1f}s" for a, b in changes["spans"]) or "none"
+        log_step(f"Re-rendering {name}: scenes {changes['scenes'] or '-'} changed (picture {spans}), "
+                 f"removed {changes['removed'] or '-'}, audio {'changed' if changes['audio'] else 'same'}")
+    result = render()
+    record.parent.mkdir(parents=True, exist_ok=True)
+    record.write_text(json.dumps({"settings": settings, "plan": plan.to_dict(), "result": result}), encoding="utf-8")
+    return result
+
+
+# Draft preview: same scenes and timing, a fraction of the encode work.
+PREVIEW_HEIGHT = 360
+PREVIEW_FPS = 12
+FINAL_HEIGHT = 720
+FINAL_FPS = 24
+
+
+@traced("video_agent", stage="video")
+def process_video_creation(base_output_dir: Path, streaming: bool = False, preview: bool = False,
+                           hls_dir: Path = None, formats=None):
+    log_step("Video creation step" + (" (preview)" if preview else " (streaming)" if streaming else ""))
+    artifacts = RunArtifacts(base_output_dir)
+    timeline = get_scene_files(base_output_dir, artifacts)
+    video_dir = artifacts.dir / "video"
+    # Audio mix + normalized images shared between the preview and the final render
+    cache_dir = video_dir / "_cache"
 
-    # scene_1.jpg, scene_2.jpg ... ; scene_1.mp3 ...
-    image_files = sorted(image_dir.glob("scene_*.jpg"), key=lambda p: int(p.stem.split("_")[-1]))
-    audio_files = sorted(audio_dir.glob("scene_*.mp3"), key=lambda p: int(p.stem.split("_")[-1]))
-    return [str(p) for p in image_files], [str(p) for p in audio_files]
+    if preview:
+        return _publish_outputs(artifacts, render_if_changed(
+            artifacts, "preview", timeline, lambda: create_multiscene_video_streaming(
+                timeline, str(video_dir / "preview.mp4"), fps=PREVIEW_FPS, height=PREVIEW_HEIGHT, profile="draft",
+                cache_dir=cache_dir, source_height=FINAL_HEIGHT),
+            PREVIEW_FPS, height=PREVIEW_HEIGHT, profile="draft", renderer="streaming"))
 
+    # Measured once per host, here rather than inside a render's core lease and span.
+    with span("encoder_calibration", stage="video"):
+        load_calibration()
 
-def process_video_creation(base_output_dir: Path):
-    log_step("Video creation step")
-    image_paths, audio_paths = get_scene_files(base_output_dir)
-    output_video = base_output_dir / "video" / "final_story.mp4"
-    create_multiscene_video(image_paths, audio_paths, str(output_video),
-                            bg_music_path="assets/bg_music.mp3", bg_music_volume=0.18,
-                            fade_duration=1.0, fps=24, height=720)
+    output_video = video_dir / "final_story.mp4"
+    if formats:
+        return _publish_outputs(artifacts, render_if_changed(
+            artifacts, "final_story", timeline, lambda: create_multiformat_video(
+                timeline, str(output_video), formats=formats, fps=FINAL_FPS, height=FINAL_HEIGHT,
+                cache_dir=cache_dir),
+            FINAL_FPS, height=FINAL_HEIGHT, profile=DEFAULT_PROFILE, renderer="multiformat", formats=formats))
+    if hls_dir:
+        # A live playlist is always written afresh.
+        return _publish_outputs(artifacts, create_multiscene_video_streaming(
+            timeline, str(output_video), fps=FINAL_FPS, height=FINAL_HEIGHT,
+            cache_dir=cache_dir, source_height=FINAL_HEIGHT, hls_dir=hls_dir))
+    if streaming:
+        return _publish_outputs(artifacts, render_if_changed(
+            artifacts, "final_story", timeline, lambda: create_multiscene_video_streaming(
+                timeline, str(output_video), fps=FINAL_FPS, height=FINAL_HEIGHT,
+                cache_dir=cache_dir, source_height=FINAL_HEIGHT),
+            FINAL_FPS, height=FINAL_HEIGHT, profile=DEFAULT_PROFILE, renderer="streaming"))
+    return _publish_outputs(artifacts, render_if_changed(
+        artifacts, "final_story", timeline, lambda: create_multiscene_video(
+            timeline, str(output_video), fps=FINAL_FPS, height=FINAL_HEIGHT),
+        FINAL_FPS, height=FINAL_HEIGHT, profile=DEFAULT_PROFILE, renderer="composed"))
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python agents/video_agent.py <base_output_dir>")
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not args:
+        print("Usage: python agents/video_agent.py <base_output_dir> [--stream] [--preview] [--hls[=DIR]] "
+              "[--formats=landscape,vertical,square]")
         sys.exit(1)
-    base_output_dir = Path(sys.argv[1])
-    process_video_creation(base_output_dir)
+    base_output_dir = Path(args[0])
+    hls_dir = formats = None
+    for a in sys.argv[1:]:
+        if a == "--hls":
+            hls_dir = base_output_dir / "video" / "hls"
+        elif a.startswith("--hls="):
+            hls_dir = Path(a.split("=", 1)[1])
+        elif a.startswith("--formats="):
+            formats = [f for f in a.split("=", 1)[1].split(",") if f]
+    process_video_creation(base_output_dir, streaming="--stream" in sys.argv[1:],
+                           preview="--preview" in sys.argv[1:], hls_dir=hls_dir, formats=formats)
@@ -1,18 +1,32 @@
 import os
+import sys
 from pathlib import Path
-import PIL.Image
-if not hasattr(PIL.Image, "ANTIALIAS"):
-    PIL.Image.ANTIALIAS = PIL.Image.LANCZOS
 
-import moviepy.editor as mpy
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
 
+from utils.log_utils import current_span, span, traced
+from utils.render_settings import encoder_settings
+from utils.timeline import Timeline
 
-def add_subtitle(clip: mpy.VideoClip, text: str, fontsize: int = 40) -> mpy.VideoClip:
+
+def _mpy():
+    """moviepy.editor, imported on first use (it costs ~0.5s of startup per process)."""
+    import PIL.Image
+    if not hasattr(PIL.Image, "ANTIALIAS"):
+        PIL.Image.ANTIALIAS = PIL.Image.LANCZOS
+    import moviepy.editor as mpy
+    return mpy
+
+
+def add_subtitle(clip: "mpy.VideoClip", text: str, fontsize: int = 40) -> "mpy.VideoClip":
     """
     Creates a subtitle overlay using TextClip with Pillow (no ImageMagick needed).
     """
     if not text.strip():
         return clip
+    mpy = _mpy()
 
     txt_clip = mpy.TextClip(
         text,
@@ -27,65 +41,70 @@ def add_subtitle(clip: mpy.VideoClip, text: str, fontsize: int = 40) -> mpy.Vide
     return mpy.CompositeVideoClip([clip, txt_clip])
 
 
+@traced("render_subtitled", stage="video")
 def create_multiscene_video(
-    image_paths: list,
-    audio_paths: list,
-    subtitles: list = None,
+    timeline: Timeline,
     output_path: str = "output/video/final_story.mp4",
-    bg_music_path: str = "assets/bg_music.mp3",
-    bg_music_volume: float = 0.15,
-    fade_duration: float = 1.0,
+    subtitles: bool = True,
     fps: int = 24,
-    height: int = 720
+    height: int = 720,
+    profile: str = None
 ) -> str:
-    if len(image_paths) != len(audio_paths):
-        raise ValueError("❌ Number of images and audio segments must match.")
-    if subtitles and len(subtitles) != len(image_paths):
-        raise ValueError("❌ Number of subtitles must match scenes.")
+    """Render ``timeline`` with each scene's caption as a subtitle (``subtitles=False`` to leave them out)."""
+    plan = timeline.compile(fps)
+    if current_span():
+        current_span().set(frames=plan.total_frames, subtitles=subtitles)
 
     Path(os.path.dirname(output_path)).mkdir(parents=True, exist_ok=True)
+    mpy = _mpy()
     scene_clips = []
 
-    for idx, (img, aud) in enumerate(zip(image_paths, audio_paths), 1):
-        audio_clip = mpy.AudioFileClip(aud)
-        img_clip = mpy.ImageClip(img).set_duration(audio_clip.duration).resize(height=height)
-        clip = img_clip.set_audio(audio_clip)
-
-        # ✅ Fade in/out video only
-        if idx > 1:
-            clip = clip.fadein(fade_duration)
-        if idx < len(audio_paths):
-            clip = clip.fadeout(fade_duration)
-
-        # 📝 Add subtitle if available
-        if subtitles:
-            clip = add_subtitle(clip, subtitles[idx - 1])
+    for idx, scene in enumerate(plan.scenes):
+        # Exactly the planned frames, whatever the clip's own length
+        duration = plan.frame_count(idx) / fps
+        with span("build_scene", stage="video", scene=scene.number):
+            audio_clip = mpy.AudioFileClip(scene.audio)
+            img_clip = mpy.ImageClip(scene.image).set_duration(duration).resize(height=height)
+            clip = img_clip.set_audio(audio_clip.subclip(0, min(duration, audio_clip.duration)))
+
+            # ✅ Fade in/out video only
+            if scene.fade_in:
+                clip = clip.fadein(scene.fade_in)
+            if scene.fade_out:
+                clip = clip.fadeout(scene.fade_out)
+
+            # 📝 Add subtitle if available
+            caption = scene.caption if subtitles else None
+            if caption:
+                clip = add_subtitle(clip, caption)
 
         scene_clips.append(clip)
-        print(f"🎬 Added scene {idx} with subtitle: {subtitles[idx - 1] if subtitles else '—'}")
+        print(f"🎬 Added scene {scene.number} with subtitle: {caption or '—'}")
 
     final_clip = mpy.concatenate_videoclips(scene_clips, method="compose")
 
-    if bg_music_path and os.path.exists(bg_music_path):
+    for layer in plan.layers:
         try:
-            bg_music = mpy.AudioFileClip(bg_music_path).volumex(bg_music_volume)
+            bg_music = mpy.AudioFileClip(layer.path).volumex(layer.volume)
             bg_music = bg_music.set_duration(final_clip.duration)
             combined_audio = mpy.CompositeAudioClip([final_clip.audio, bg_music])
             final_clip = final_clip.set_audio(combined_audio)
-            print(f"🎼 Background music added: {bg_music_path}")
+            print(f"🎼 Background music added: {layer.path}")
         except Exception as e:
             print(f"⚠️ Could not add background music: {e}")
 
-    final_clip.write_videofile(
-        output_path,
-        fps=fps,
-        codec="libx264",
-        audio_codec="aac",
-        threads=4,
-        preset="medium",
-        temp_audiofile="output/video/_temp_audio.m4a",
-        remove_temp=True
-    )
+    with encoder_settings(profile, fps=fps, height=height) as enc, span("encode", stage="video"):
+        final_clip.write_videofile(
+            output_path,
+            fps=fps,
+            codec="libx264",
+            audio_codec="aac",
+            threads=enc["threads"],
+            preset=enc["preset"],
+            ffmpeg_params=enc["ffmpeg_params"],
+            temp_audiofile=str(Path(output_path).with_name("_temp_audio.m4a")),
+            remove_temp=True
+        )
 
     print(f"✅ Final video with subtitles created: {output_path}")
     return output_path
@@ -108,11 +127,7 @@ if __name__ == "__main__":
         "And from that day, everything changed."
     ]
 
-    create_multiscene_video(
-        image_paths=test_images,
-        audio_paths=test_audio,
-        subtitles=test_subtitles,
-        fade_duration=1.0,
-        bg_music_path="assets/bg_music.mp3",
-        bg_music_volume=0.18
-    )
+    create_multiscene_video(Timeline.from_paths(
+        test_images, test_audio, captions=test_subtitles,
+        fade=1.0, music="assets/bg_music.mp3", music_volume=0.18,
+    ))
@@ -1 +1,341 @@
-"""Handles YouTube upload using YouTube Data API."""
+# agents/youtube_agent.py
+"""
+Handles YouTube upload using YouTube Data API: resumable, chunked uploads of finished runs.
+
+Implements the resumable-upload protocol directly:
+  1. POST the video metadata with ``uploadType=resumable`` -> session URI (Location)
+  2. PUT the file in chunks with ``Content-Range: bytes a-b/total``; the server answers
+     308 with ``Range: bytes=0-n`` until the last chunk returns 200/201 with the video
+  3. after any error, PUT ``Content-Range: bytes */total`` to ask how much arrived
+     and continue from that offset
+
+The file is streamed from disk one chunk at a time. Session URIs are saved in
+``<run>/upload/session.json`` so a restarted process resumes where the last one
+stopped instead of starting again; ``upload/result.json`` marks a finished upload.
+
+    python agents/youtube_agent.py <run_dir> [<run_dir> ...] [--concurrency=2] [--chunk-mb=8]
+    python agents/youtube_agent.py --pending      # every finished run not uploaded yet
+"""
+
+import os
+import sys
+import json
+import time
+import random
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn, span, traced
+from utils.artifact_store import RunArtifacts
+
+load_dotenv()
+YOUTUBE_ACCESS_TOKEN = os.getenv("YOUTUBE_ACCESS_TOKEN")
+YOUTUBE_CLIENT_ID = os.getenv("YOUTUBE_CLIENT_ID")
+YOUTUBE_CLIENT_SECRET = os.getenv("YOUTUBE_CLIENT_SECRET")
+YOUTUBE_REFRESH_TOKEN = os.getenv("YOUTUBE_REFRESH_TOKEN")
+
+# Can be pointed at a local stand-in (see benchmarks/mock_api_server.py)
+YOUTUBE_UPLOAD_BASE = os.getenv("YOUTUBE_UPLOAD_BASE", "https://www.googleapis.com")
+YOUTUBE_UPLOAD_URL = f"{YOUTUBE_UPLOAD_BASE}/upload/youtube/v3/videos"
+OAUTH_TOKEN_URL = os.getenv("YOUTUBE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+
+# Chunks must be multiples of 256 KiB (except the last one).
+CHUNK_UNIT = 256 * 1024
+DEFAULT_CHUNK_MB = int(os.getenv("YOUTUBE_CHUNK_MB", "8"))
+DEFAULT_CONCURRENCY = int(os.getenv("YOUTUBE_UPLOAD_CONCURRENCY", "2"))
+PRIVACY_STATUS = os.getenv("YOUTUBE_PRIVACY", "private")
+CATEGORY_ID = os.getenv("YOUTUBE_CATEGORY_ID", "24")  # Entertainment
+MAX_RETRIES = 8
+TIMEOUT = 120
+
+FINAL_VIDEO = Path("video") / "final_story.mp4"
+SESSION_FILE = "session.json"
+RESULT_FILE = "result.json"
+
+
+class UploadError(RuntimeError):
+    pass
+
+
+class UploadRejected(UploadError):
+    """The server refused the upload (4xx); retrying the same request cannot help."""
+
+
+class _SessionExpired(Exception):
+    pass
+
+
+def _require_credentials():
+    if not YOUTUBE_ACCESS_TOKEN and not (YOUTUBE_CLIENT_ID and YOUTUBE_CLIENT_SECRET and YOUTUBE_REFRESH_TOKEN):
+        raise ValueError("No YouTube credentials (YOUTUBE_ACCESS_TOKEN or client id/secret/refresh token).")
+
+
+_token = {"value": YOUTUBE_ACCESS_TOKEN, "expires": float("inf") if YOUTUBE_ACCESS_TOKEN else 0.0}
+
+
+def access_token(force_refresh: bool = False) -> str:
+    """A valid OAuth access token, refreshed from the refresh token when needed."""
+    import requests
+
+    if not force_refresh and _token["value"] and time.time() < _token["expires"] - 60:
+        return _token["value"]
+    if not YOUTUBE_REFRESH_TOKEN:
+        if _token["value"]:
+            return _token["value"]
+        raise UploadError("Access token expired and no refresh token configured.")
+    r = requests.post(OAUTH_TOKEN_URL, data={
+        "client_id": YOUTUBE_CLIENT_ID, "client_secret": YOUTUBE_CLIENT_SECRET,
+        "refresh_token": YOUTUBE_REFRESH_TOKEN, "grant_type": "refresh_token",
+    }, timeout=TIMEOUT)
+    r.raise_for_status()
+    data = r.json()
+    _token.update(value=data["access_token"], expires=time.time() + data.get("expires_in", 3600))
+    return _token["value"]
+
+
+def _auth_headers(extra=None) -> dict:
+    headers = {"Authorization": f"Bearer {access_token()}"}
+    headers.update(extra or {})
+    return headers
+
+
+def build_metadata(run_dir: Path, title: str = None) -> dict:
+    """Title/description from the run's prompt and script."""
+    scenes = []
+    artifacts = RunArtifacts(run_dir)
+    if artifacts.exists("script", "story.json"):
+        try:
+            scenes = json.loads(artifacts.read_text("script", "story.json"))
+        except ValueError:
+            scenes = []
+    if not title:
+        try:
+            from utils.run_index import RunIndex
+            run = RunIndex().get(run_dir.name)
+            title = json.loads(run["params"]).get("prompt") if run and run["params"] else None
+        except Exception:
+            title = None
+    title = (title or f"Story {run_dir.name}").strip()
+    description = "\n\n".join(s.get("narration", "") for s in scenes if isinstance(s, dict))
+    return {
+        "snippet": {"title": title[:100], "description": description[:5000], "categoryId": CATEGORY_ID},
+        "status": {"privacyStatus": PRIVACY_STATUS, "selfDeclaredMadeForKids": False},
+    }
+
+
+def _backoff(attempt: int):
+    time.sleep(min(60.0, (2 ** attempt) * 0.5) * random.uniform(0.5, 1.0))
+
+
+def _committed_offset(response) -> int:
+    """Bytes the server has persisted, from a 308 ``Range: bytes=0-n`` header."""
+    value = response.headers.get("Range")
+    if not value:
+        return 0
+    return int(value.rsplit("-", 1)[1]) + 1
+
+
+class ResumableUpload:
+    def __init__(self, video_path: Path, upload_dir: Path, metadata: dict, chunk_size: int):
+        self.video_path = Path(video_path)
+        self.upload_dir = Path(upload_dir)
+        self.metadata = metadata
+        self.chunk_size = max(CHUNK_UNIT, chunk_size // CHUNK_UNIT * CHUNK_UNIT)
+        stat = self.video_path.stat()
+        self.total = stat.st_size
+        self._fingerprint = {"path": str(self.video_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+    # --- session persistence ---
+
+    def _load_session(self):
+        path = self.upload_dir / SESSION_FILE
+        if not path.exists():
+            return None
+        try:
+            saved = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            return None
+        # A re-rendered video is a different upload.
+        return saved.get("session_uri") if saved.get("file") == self._fingerprint else None
+
+    def _save_session(self, session_uri: str):
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        (self.upload_dir / SESSION_FILE).write_text(
+            json.dumps({"session_uri": session_uri, "file": self._fingerprint}, indent=2), encoding="utf-8")
+
+    # --- protocol ---
+
+    def _start_session(self) -> str:
+        import requests
+
+        r = requests.post(
+            f"{YOUTUBE_UPLOAD_URL}?uploadType=resumable&part=snippet,status",
+            headers=_auth_headers({
+                "Content-Type": "application/json; charset=UTF-8",
+                "X-Upload-Content-Length": str(self.total),
+                "X-Upload-Content-Type": "video/mp4",
+            }),
+            data=json.dumps(self.metadata).encode("utf-8"), timeout=TIMEOUT)
+        if r.status_code == 401:
+            access_token(force_refresh=True)
+        elif 400 <= r.status_code < 500 and r.status_code not in (408, 429):
+            # Bad metadata, quota or permissions: retrying the same request cannot help.
+            raise UploadRejected(f"Upload session rejected: HTTP {r.status_code} {r.text[:300]}")
+        r.raise_for_status()
+        session_uri = r.headers.get("Location")
+        if not session_uri:
+            raise UploadError("Resumable session response has no Location header.")
+        self._save_session(session_uri)
+        return session_uri
+
+    def _query_offset(self, session_uri: str):
+        """Ask the server how much it has; returns (offset, finished_response_or_None)."""
+        import requests
+
+        r = requests.put(session_uri, headers=_auth_headers({"Content-Range": f"bytes */{self.total}",
+                                                             "Content-Length": "0"}),
+                         timeout=TIMEOUT, allow_redirects=False)
+        if r.status_code in (200, 201):
+            return self.total, r
+        if r.status_code == 308:
+            return _committed_offset(r), None
+        if r.status_code in (404, 410):
+            raise _SessionExpired()
+        r.raise_for_status()
+        raise UploadError(f"Unexpected status {r.status_code} when querying upload offset.")
+
+    def _put_chunk(self, session_uri: str, f, offset: int):
+        import requests
+
+        f.seek(offset)
+        chunk = f.read(self.chunk_size)
+        end = offset + len(chunk) - 1
+        with span("youtube_chunk", stage="upload", offset=offset, bytes=len(chunk)) as sp:
+            r = requests.put(session_uri, data=chunk, headers=_auth_headers({
+                "Content-Length": str(len(chunk)),
+                "Content-Range": f"bytes {offset}-{end}/{self.total}",
+            }), timeout=TIMEOUT, allow_redirects=False)
+            sp.set(status=r.status_code)
+        return r
+
+    def run(self) -> dict:
+        session_uri = self._load_session()
+        offset, attempt, done = 0, 0, None
+        if session_uri:
+            try:
+                offset, done = self._query_offset(session_uri)
+                log_step(f"Resuming upload of {self.video_path} at {offset}/{self.total} bytes")
+            except Exception:
+                session_uri = None
+
+        with open(self.video_path, "rb") as f:
+            while done is None:
+                try:
+                    if session_uri is None:
+                        session_uri, offset = self._start_session(), 0
+                    r = self._put_chunk(session_uri, f, offset)
+                    if r.status_code in (200, 201):
+                        done = r
+                    elif r.status_code == 308:
+                        # The server may have kept less than we sent; trust its offset.
+                        offset, attempt = _committed_offset(r), 0
+                        safe_print(f"   ⬆️ {self.video_path.parent.parent.name}: "
+                                   f"{offset * 100 // max(1, self.total)}% ({offset}/{self.total})")
+                    elif r.status_code in (404, 410):
+                        raise _SessionExpired()
+                    elif r.status_code == 401:
+                        access_token(force_refresh=True)
+                        raise UploadError("HTTP 401")
+                    elif r.status_code in (500, 502, 503, 504, 429):
+                        raise UploadError(f"HTTP {r.status_code}")
+                    else:
+                        raise UploadRejected(f"Upload rejected: HTTP {r.status_code} {r.text[:300]}")
+                except _SessionExpired:
+                    log_warn("Upload session expired; starting a new one.")
+                    session_uri = None
+                except UploadRejected:
+                    raise
+                except Exception as e:
+                    attempt += 1
+                    if attempt > MAX_RETRIES:
+                        raise UploadError(f"Giving up after {MAX_RETRIES} retries: {e}")
+                    log_warn(f"Upload interrupted ({e}); retry {attempt}/{MAX_RETRIES}")
+                    _backoff(attempt)
+                    if session_uri:
+                        try:
+                            offset, done = self._query_offset(session_uri)
+                        except _SessionExpired:
+                            session_uri = None
+                        except Exception:
+                            pass
+
+        result = done.json() if done.content else {}
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        (self.upload_dir / RESULT_FILE).write_text(json.dumps(result, indent=2), encoding="utf-8")
+        (self.upload_dir / SESSION_FILE).unlink(missing_ok=True)
+        return result
+
+
+@traced("youtube_upload", stage="upload")
+def upload_run(run_dir: Path, chunk_mb: int = DEFAULT_CHUNK_MB, title: str = None) -> dict:
+    """Upload ``<run_dir>/video/final_story.mp4``; returns the created video resource."""
+    _require_credentials()
+    run_dir = Path(run_dir)
+    upload_dir = run_dir / "upload"
+    if (upload_dir / RESULT_FILE).exists():
+        log_success(f"Already uploaded: {run_dir}")
+        return json.loads((upload_dir / RESULT_FILE).read_text(encoding="utf-8"))
+    try:
+        video_path = RunArtifacts(run_dir).fetch(FINAL_VIDEO.parent.name, FINAL_VIDEO.name)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No final video in {run_dir}") from None
+
+    log_step(f"Uploading {video_path} ({video_path.stat().st_size / 1e6:.1f} MB)")
+    result = ResumableUpload(video_path, upload_dir, build_metadata(run_dir, title), chunk_mb * 1024 * 1024).run()
+    log_success(f"Uploaded {run_dir.name}: video id {result.get('id', '?')}")
+    return result
+
+
+def upload_runs(run_dirs: list, concurrency: int = DEFAULT_CONCURRENCY, chunk_mb: int = DEFAULT_CHUNK_MB) -> dict:
+    """Upload several runs on a bounded pool; returns ``{run_dir: result or exception}``."""
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="upload") as pool:
+        futures = {pool.submit(upload_run, Path(d), chunk_mb): str(d) for d in run_dirs}
+        for future in as_completed(futures):
+            run_dir = futures[future]
+            try:
+                results[run_dir] = future.result()
+            except Exception as e:
+                log_error(f"Upload failed for {run_dir}: {e}")
+                results[run_dir] = e
+    return results
+
+
+def pending_runs() -> list:
+    """Finished runs (per the run index) with a final video and no completed upload."""
+    from utils.run_index import RunIndex
+
+    pending = []
+    for run in RunIndex().runs(status="done"):
+        run_dir = Path(run["output_dir"])
+        if (run_dir / FINAL_VIDEO).exists() and not (run_dir / "upload" / RESULT_FILE).exists():
+            pending.append(run_dir)
+    return pending
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    if "--pending" in sys.argv:
+        args += [str(p) for p in pending_runs()]
+    if not args:
+        print("Usage: python agents/youtube_agent.py <run_dir> [...] [--pending] [--concurrency=N] [--chunk-mb=N]")
+        sys.exit(1)
+    outcome = upload_runs(args, concurrency=int(options.get("concurrency", DEFAULT_CONCURRENCY)),
+                          chunk_mb=int(options.get("chunk-mb", DEFAULT_CHUNK_MB)))
+    sys.exit(1 if any(isinstance(v, Exception) for v in outcome.values()) else 0)
@@ -1,5 +1,6 @@
 # app.py
 
+import os
 import streamlit as st
 import subprocess
 import sys
@@ -12,7 +13,75 @@ if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
 
 # ✅ Use shared logging utilities
-from utils.log_utils import safe_print, log_step, log_success, log_error
+from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn
+from utils.log_utils import init_tracing, span, trace_env, export_chrome_trace
+from utils import metrics
+from utils.run_index import RunIndex, start_background_gc, request_key, new_run_id
+
+# === Metrics: /metrics on a side port and/or a scrape file ===
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_FILE = os.getenv("METRICS_FILE")
+if METRICS_PORT or METRICS_FILE:
+    os.environ.setdefault(metrics.METRICS_DIR_ENV, "output/metrics")
+    metrics.install()
+if METRICS_PORT:
+    metrics.start_http_server(int(METRICS_PORT))
+
+# === Run index + retention GC (RETENTION_MAX_AGE_DAYS / RETENTION_MAX_GB / RETENTION_KEEP_LAST) ===
+run_index = RunIndex()
+start_background_gc(run_index)
+
+# === Watch-while-rendering: HLS segments under Streamlit's static folder ===
+# (.streamlit/config.toml enables static serving at /app/static/)
+HLS_ROOT = Path("static/hls")
+HLS_PLAYER = """
+<video id="player" controls autoplay muted style="width:100%"></video>
+<script src="https://cdn.jsdelivr.net/npm/hls.js@1"></script>
+<script>
+  const video = document.getElementById("player");
+  const src = "{src}";
+  if (video.canPlayType("application/vnd.apple.mpegurl")) {{
+    video.src = src;
+  }} else if (window.Hls && Hls.isSupported()) {{
+    const hls = new Hls();
+    hls.loadSource(src);
+    hls.attachMedia(video);
+  }}
+</script>
+"""
+
+
+def run_with_live_playlist(cmd, playlist: Path, slot, log_path: Path):
+    """Run the video agent and start HLS playback in ``slot`` once the first segment lands."""
+    import streamlit.components.v1 as components
+
+    shown = False
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, text=True, env=trace_env())
+        while proc.poll() is None:
+            if not shown and playlist.exists() and "#EXTINF" in playlist.read_text(encoding="utf-8", errors="ignore"):
+                with slot.container():
+                    st.caption("📺 Watching while rendering — later scenes are still being encoded.")
+                    components.html(HLS_PLAYER.format(src=f"/app/{playlist.as_posix()}"), height=420)
+                shown = True
+            time.sleep(1.0)
+    output = log_path.read_text(encoding="utf-8", errors="ignore")
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout=output, stderr=output)
+
+
+def show_final_video(final_video, name: str):
+    st.success("✅ Video generated successfully!")
+    st.video(str(final_video))
+
+    with open(final_video, "rb") as f:
+        st.download_button(
+            label="⬇️ Download Video",
+            data=f,
+            file_name=f"story_{name}.mp4",
+            mime="video/mp4",
+        )
+
+
 # === Streamlit UI Setup ===
 st.set_page_config(page_title="AI Story Generator 🎥", layout="centered")
 st.title("🎬 AI Storytelling Video Generator")
@@ -30,15 +99,47 @@ length = st.select_slider(
     "⏳ Select desired video length (minutes)", options=[1, 2, 3, 5, 10], value=3
 )
 
+show_preview = st.checkbox("👀 Show a quick low-res preview before the final render", value=True)
+watch_live = st.checkbox("📺 Start playback while the final video is still rendering", value=True)
+force_fresh = st.checkbox("🔄 Force a fresh generation (don't reuse an identical recent or running request)",
+                          value=False)
+
 if st.button("🚀 Generate Story Video"):
     if not prompt.strip():
         st.warning("Please enter a story idea!")
         st.stop()
 
+    # === Single flight: identical requests (prompt, genre, length) share one pipeline run ===
+    key = request_key(prompt, genre, length)
+    while True:
+        run_id = new_run_id()
+        output_folder = Path(f"output/generated_videos/{run_id}")
+        role, claimed = run_index.claim_run(run_id, output_folder, key, fresh=force_fresh,
+                                            prompt=prompt, genre=genre, length=length)
+        metrics.JOB_REQUESTS.inc(admission=role)
+        if role != "attach":
+            break
+        log_step(f"Identical request in flight; attaching to run {claimed['run_id']}")
+        with st.spinner("⏳ This exact story is already being generated — waiting for that run instead of "
+                        "starting another..."):
+            finished = run_index.wait_for_run(claimed["run_id"])
+        if finished and run_index.final_video(finished["run_id"]):
+            role, claimed = "reuse", finished
+            break
+        # The run we attached to failed or died: claim again, which now starts a new run.
+        log_warn(f"Attached run {claimed['run_id']} produced no video; starting a new run.")
+
+    if role == "reuse":
+        final_video = run_index.final_video(claimed["run_id"])
+        st.info(f"♻️ Served from an identical request (run {claimed['run_id']}). "
+                "Tick \"Force a fresh generation\" to make a new one.")
+        show_final_video(final_video, claimed["run_id"])
+        log_success(f"Reused video of run {claimed['run_id']}: {final_video}")
+        st.stop()
+
     # === Unique output folder per generation ===
-    timestamp = time.strftime("%Y%m%d-%H%M%S")
-    output_folder = Path(f"output/generated_videos/{timestamp}")
     output_folder.mkdir(parents=True, exist_ok=True)
+    trace_dir = init_tracing(output_folder / "trace")
 
     progress = st.progress(0)
     status = st.empty()
@@ -53,57 +154,83 @@ if st.button("🚀 Generate Story Video"):
         ("🎨 Creating Scene Images", "Image Agent"),
         ("🎬 Compiling Final Video", "Video Agent"),
     ]
+    if show_preview:
+        steps.insert(3, ("👀 Rendering Quick Preview", "Preview"))
+    preview_slot = st.empty()
 
     total_steps = len(steps)
     success = True
 
-    for idx, (desc, agent_name) in enumerate(steps, start=1):
-        status.info(f"{desc} ...")
-        progress.progress((idx - 1) / total_steps)
-
-        cmd = [
-            sys.executable,
-            "generate_full_story.py" if agent_name == "Script Agent" else f"agents/{agent_name.lower().replace(' ', '_')}.py",
-            f"{prompt} in {genre} genre, make it approximately {length} minute story"
-            if agent_name == "Script Agent"
-            else str(output_folder),
-        ]
-
-        result = subprocess.run(cmd, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            st.error(f"❌ {agent_name} failed!")
-            st.text("---- STDERR ----")
-            st.code(result.stderr)
-            st.stop()
-            success = False
-            break
-
-        log_success(f"{agent_name} completed successfully.")
-        progress.progress(idx / total_steps)
+    metrics.JOBS_IN_FLIGHT.inc()
+    try:
+        # Identical requests attached to this run wait on it while the heartbeat is fresh.
+        with run_index.heartbeat(run_id):
+            for idx, (desc, agent_name) in enumerate(steps, start=1):
+                status.info(f"{desc} ...")
+                progress.progress((idx - 1) / total_steps)
+
+                cmd = [
+                    sys.executable,
+                    "agents/video_agent.py" if agent_name == "Preview"
+                    else f"agents/{agent_name.lower().replace(' ', '_')}.py",
+                ]
+                if agent_name == "Script Agent":
+                    cmd += [f"{prompt} in {genre} genre, make it approximately {length} minute story",
+                            str(output_folder), f"--minutes={length}"]
+                else:
+                    cmd.append(str(output_folder))
+                if agent_name == "Preview":
+                    cmd.append("--preview")
+                # Long-form stories render in constant memory, scene by scene; after a preview the
+                # streaming renderer also reuses its cached audio mix and normalized images.
+                if agent_name == "Video Agent" and (length >= 10 or show_preview):
+                    cmd.append("--stream")
+
+                hls_dir = HLS_ROOT / run_id
+                if agent_name == "Video Agent" and watch_live:
+                    cmd.append(f"--hls={hls_dir.as_posix()}")
+
+                with span(agent_name, stage="pipeline") as sp:
+                    if agent_name == "Video Agent" and watch_live:
+                        result = run_with_live_playlist(cmd, hls_dir / "stream.m3u8", preview_slot,
+                                                        output_folder / "video_agent.log")
+                    else:
+                        result = subprocess.run(cmd, capture_output=True, text=True, env=trace_env())
+                    sp.set(returncode=result.returncode)
+
+                if result.returncode != 0:
+                    run_index.finish_run(run_id, status="failed", extra_paths=[HLS_ROOT / run_id])
+                    st.error(f"❌ {agent_name} failed!")
+                    st.text("---- STDERR ----")
+                    st.code(result.stderr)
+                    st.stop()
+                    success = False
+                    break
+
+                log_success(f"{agent_name} completed successfully.")
+                progress.progress(idx / total_steps)
+
+                preview_video = output_folder / "video" / "preview.mp4"
+                if agent_name == "Preview" and preview_video.exists():
+                    with preview_slot.container():
+                        st.caption("👀 Draft preview — the full-quality render is on its way.")
+                        st.video(str(preview_video))
+    finally:
+        metrics.JOBS_IN_FLIGHT.dec()
+        if METRICS_FILE:
+            metrics.write_textfile(METRICS_FILE)
 
     if success:
         progress.progress(1.0)
         status.success("✅ All steps completed!")
+        log_success(f"Trace written: {export_chrome_trace(trace_dir)}")
 
-    # === Locate final video ===
-    possible_videos = list(output_folder.rglob("final_story.mp4"))
-    if not possible_videos:
-        possible_videos = list(Path("output").rglob("final_story.mp4"))
-
-    if possible_videos:
-        final_video = possible_videos[0]
-        st.success("✅ Video generated successfully!")
-        st.video(str(final_video))
-
-        with open(final_video, "rb") as f:
-            st.download_button(
-                label="⬇️ Download Video",
-                data=f,
-                file_name=f"story_{timestamp}.mp4",
-                mime="video/mp4",
-            )
+    # === Locate final video (O(1) from the run index, only ever this run's) ===
+    run_index.finish_run(run_id, status="done" if success else "failed", extra_paths=[HLS_ROOT / run_id])
+    final_video = run_index.final_video(run_id)
 
+    if final_video:
+        show_final_video(final_video, run_id)
         log_success(f"Video ready for download: {final_video}")
     else:
         st.error("❌ Something went wrong — no video file found.")
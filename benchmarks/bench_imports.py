@@ -0,0 +1,129 @@
+# benchmarks/bench_imports.py
+"""
+Import-time benchmark with a per-entry-point startup budget.
+
+Every agent runs as its own subprocess, so whatever an entry point imports at module
+level is paid on every pipeline step. This runs ``python -X importtime`` for each
+entry point in a fresh interpreter (best of N) and fails when one exceeds its budget.
+
+    python benchmarks/bench_imports.py                 # check against the budget
+    python benchmarks/bench_imports.py --top 15        # show the slowest imports
+    python benchmarks/bench_imports.py --write-budget  # re-record budget (x1.5 headroom)
+
+The check uses each entry point's fastest run; a re-recorded budget is the median run
+times the headroom, so ordinary scheduling noise does not fail the check.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from utils.log_utils import safe_print, log_success, log_error
+
+BUDGET_FILE = ROOT_DIR / "benchmarks" / "baselines" / "import_budget.json"
+
+ENTRY_POINTS = [
+    "utils.log_utils",
+    "agents.script_agent",
+    "agents.tts_agent",
+    "agents.image_agent",
+    "agents.audio_split_agent",
+    "agents.video_agent",
+    "agents.video_agent_v2",
+    "agents.youtube_agent",
+    "agents.variant_agent",
+    "generate_full_story",
+]
+
+
+def measure(module: str) -> dict:
+    """Import ``module`` in a fresh interpreter; return total ms and per-package cumulative ms."""
+    # No API keys in the environment: config must be validated at call time, not import.
+    env = {k: v for k, v in os.environ.items() if not k.endswith("_API_KEY")}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(ROOT_DIR), env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        last = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "unknown error"
+        return {"ok": False, "error": last, "total_ms": float("inf"), "packages": {}}
+
+    # Lines look like "import time:  self_us | cumulative_us | <2 spaces per nesting level>name",
+    # and children are printed before the module that imported them.
+    total_us, packages, pending = 0, {}, {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        name = name[1:].rstrip()
+        pending[name.strip()] = int(cumulative_us) / 1000.0
+        if name.startswith(" "):
+            continue
+        # A top-level import closes its subtree; interpreter startup (site, encodings, ...)
+        # is not the entry point's cost, so only our own module and its parents count.
+        if name == module or module.startswith(name + "."):
+            total_us += int(cumulative_us)
+            packages.update(pending)
+        pending = {}
+    return {"ok": True, "total_ms": total_us / 1000.0, "packages": packages}
+
+
+def best_of(module: str, repeat: int) -> dict:
+    """Fastest of ``repeat`` runs, with ``median_ms`` across them."""
+    runs = sorted((measure(module) for _ in range(repeat)), key=lambda r: r["total_ms"])
+    return dict(runs[0], median_ms=runs[len(runs) // 2]["total_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entry-point import-time budget check.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=0, help="Show the N slowest imports (cumulative) per entry point.")
+    parser.add_argument("--budget", default=str(BUDGET_FILE))
+    parser.add_argument("--write-budget", action="store_true")
+    parser.add_argument("--headroom", type=float, default=1.5)
+    args = parser.parse_args()
+
+    budget_path = Path(args.budget)
+    budget = json.loads(budget_path.read_text(encoding="utf-8")) if budget_path.exists() else {}
+
+    results, medians, failures = {}, {}, []
+    for module in ENTRY_POINTS:
+        r = best_of(module, args.repeat)
+        if not r["ok"]:
+            log_error(f"{module:<28} import failed: {r['error']}")
+            failures.append(module)
+            continue
+        results[module] = round(r["total_ms"], 1)
+        medians[module] = r["median_ms"]
+        limit = budget.get(module)
+        flag = "" if limit is None or r["total_ms"] <= limit else "  ❌ over budget"
+        safe_print(f"{module:<28} {r['total_ms']:8.1f} ms   budget {limit if limit is not None else '-':>6}{flag}")
+        if flag:
+            failures.append(module)
+        if args.top or flag:
+            slowest = sorted(r["packages"].items(), key=lambda kv: kv[1], reverse=True)[: args.top or 10]
+            for name, ms in slowest:
+                safe_print(f"      {ms:8.1f} ms  {name}")
+
+    if args.write_budget:
+        budget_path.parent.mkdir(parents=True, exist_ok=True)
+        new_budget = {m: round(ms * args.headroom) for m, ms in medians.items()}
+        budget_path.write_text(json.dumps(new_budget, indent=2) + "\n", encoding="utf-8")
+        log_success(f"Import budget written: {budget_path}")
+        return
+
+    if failures:
+        log_error(f"Startup regression: {', '.join(failures)} failed to import or over budget.")
+        sys.exit(1)
+    log_success("All entry points within import budget.")
+
+
+if __name__ == "__main__":
+    main()
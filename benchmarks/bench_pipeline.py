@@ -0,0 +1,219 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end pipeline benchmark against the local mock API server.
+
+Runs the same agent subprocesses as generate_full_story.py for 1/3/5/10-minute
+stories and reports per-stage and end-to-end wall time, requests per second and
+peak RSS. No network or API quota needed. With ``--providers local`` the agents use the
+offline backends instead (no provider latency at all), which isolates rendering and
+orchestration throughput.
+
+Every agent runs with memory profiling (utils/profiling.py), so the report also has
+per-stage and per-scene peaks of the agent plus its ffmpeg children, live ffmpeg
+processes and open files. Memory grows with the story, so
+benchmarks/baselines/memory_budget.json holds budgets per story length (minutes); a
+stage whose peak exceeds the budget for its length fails the run, and lengths without
+a recorded budget are reported but not checked. The x264 calibration (utils/render_settings.py)
+runs as a warm-up before the profiled stages, into a calibration file under the work
+dir, so a host without one measures the same as a host that has it cached.
+
+    python benchmarks/bench_pipeline.py --lengths 1,3 --report output/bench/pipeline.json
+    python benchmarks/bench_pipeline.py --lengths 1,3,5,10 --providers local
+    python benchmarks/bench_pipeline.py --providers local --write-memory-budget   # re-record (x1.5 headroom)
+    python benchmarks/bench_pipeline.py --profile tracemalloc                     # + top Python allocators
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn, trace_env
+from utils.profiling import PROFILE_ENV, write_profile, check_budgets
+from benchmarks.mock_api_server import MockApiServer, ENDPOINTS
+
+MEMORY_BUDGET_FILE = ROOT_DIR / "benchmarks" / "baselines" / "memory_budget.json"
+
+AGENTS_DIR = ROOT_DIR / "agents"
+STAGES = [
+    ("script", AGENTS_DIR / "script_agent.py"),
+    ("tts", AGENTS_DIR / "tts_agent.py"),
+    ("image", AGENTS_DIR / "image_agent.py"),
+    ("video", AGENTS_DIR / "video_agent.py"),
+]
+
+
+def run_stage(cmd, env):
+    """Run one agent; return (returncode, wall seconds, peak RSS in MB of that child)."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=str(ROOT_DIR), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = proc.stderr.read()
+    # wait4 gives the rusage of this child (and the descendants it waited for).
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    return proc.returncode, wall, usage.ru_maxrss / 1024.0, stderr.decode("utf-8", "ignore")
+
+
+def warm_up(work_dir) -> dict:
+    """
+    Environment pointing the agents at caches under ``work_dir``, with the encoder
+    calibration already measured there (seeded from this host's cached one if any).
+
+    Mock and offline runs must never feed production caches: synthetic clips would skew
+    the TTS duration model and procedural images would be reused by real runs.
+    """
+    from utils.render_settings import CALIBRATION_FILE
+
+    cache_dir = Path(work_dir) / "cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    env = {
+        "ENCODER_CALIBRATION_FILE": str(cache_dir / "encoder_calibration.json"),
+        "TTS_DURATION_HISTORY": str(cache_dir / "tts_durations.jsonl"),
+        "IMAGE_CACHE_DIR": str(cache_dir / "images"),
+    }
+    seed = ROOT_DIR / CALIBRATION_FILE  # relative paths are relative to the repo, where the agents run
+    if seed.exists() and not Path(env["ENCODER_CALIBRATION_FILE"]).exists():
+        shutil.copyfile(seed, env["ENCODER_CALIBRATION_FILE"])
+    log_step("Warm-up: encoder calibration")
+    subprocess.run([sys.executable, str(ROOT_DIR / "utils" / "render_settings.py")], cwd=str(ROOT_DIR),
+                   env=dict(os.environ, **env), stdout=subprocess.DEVNULL, check=True)
+    return env
+
+
+def bench_story(server, minutes, stages, work_dir, providers=None, profile="1", cache_env=None):
+    run_dir = Path(work_dir) / f"{minutes}min"
+    run_dir.mkdir(parents=True, exist_ok=True)
+    env = dict(os.environ, **server.env(), **(cache_env or {}))
+    if providers:
+        env["STORY_PROVIDERS"] = providers
+    if profile != "0":
+        env = trace_env(dict(env, **{PROFILE_ENV: profile}), trace_dir=run_dir / "trace")
+    prompt = f"A fox follows a star in Fantasy genre, make it approximately {minutes} minute story"
+
+    report = {"minutes": minutes, "stages": {}, "ok": True}
+    total_start = time.perf_counter()
+    for name, script in STAGES:
+        if name not in stages:
+            continue
+        args = [prompt, str(run_dir), f"--minutes={minutes}"] if name == "script" else [str(run_dir)]
+        if name == "video" and minutes >= 10:
+            args.append("--stream")
+
+        before = server.snapshot()
+        code, wall, rss_mb, stderr = run_stage([sys.executable, str(script)] + args, env)
+        after = server.snapshot()
+        requests = {k: after.get(k, 0) - before.get(k, 0) for k in after if after.get(k, 0) != before.get(k, 0)}
+        total = sum(requests.values())
+        report["stages"][name] = {
+            "wall_s": round(wall, 3),
+            "peak_rss_mb": round(rss_mb, 1),
+            "requests": requests,
+            "rps": round(total / wall, 2) if wall else 0.0,
+        }
+        safe_print(f"  {minutes}min {name:<6} {wall:8.2f}s  {rss_mb:7.1f} MB  {total:4d} req")
+        if code != 0:
+            log_error(f"{name} stage failed for {minutes}min story:\n{stderr[-2000:]}")
+            report["ok"] = False
+            break
+
+    report["total_wall_s"] = round(time.perf_counter() - total_start, 3)
+    report["total_requests"] = sum(sum(s["requests"].values()) for s in report["stages"].values())
+    if profile != "0":
+        report["memory"] = write_profile(run_dir / "trace")
+    return report
+
+
+def stage_peaks(results) -> dict:
+    """Peak (agent + children, MB) per stage, keyed by story length: ``{"3": {"video": 412.0}}``."""
+    return {str(r["minutes"]): {stage: p["mem_total_mb"] for stage, p in r.get("memory", {}).get("stages", {}).items()}
+            for r in results if r.get("memory")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark.")
+    parser.add_argument("--lengths", default="1,3,5,10", help="Comma-separated story lengths in minutes.")
+    parser.add_argument("--stages", default=",".join(name for name, _ in STAGES))
+    parser.add_argument("--chat-latency", default="lognormal:-0.7,0.4")
+    parser.add_argument("--speech-latency", default="uniform:0.3,1.2")
+    parser.add_argument("--image-latency", default="uniform:1.0,3.0")
+    parser.add_argument("--rate-403", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--providers", default=None,
+                        help="Provider chain for every agent, e.g. 'local' for the offline backends.")
+    parser.add_argument("--work-dir", default=None, help="Keep run outputs here (default: temp dir).")
+    parser.add_argument("--report", default=None, help="Write the JSON report to this path.")
+    parser.add_argument("--profile", default="1", choices=("0", "1", "tracemalloc"),
+                        help="Memory profiling in the agents: 0 off, 1 on, tracemalloc adds top allocators.")
+    parser.add_argument("--memory-budget", default=str(MEMORY_BUDGET_FILE))
+    parser.add_argument("--write-memory-budget", action="store_true")
+    parser.add_argument("--headroom", type=float, default=1.5)
+    args = parser.parse_args()
+
+    rates = {ep: {403: args.rate_403, 429: args.rate_429} for ep in ENDPOINTS}
+    latency = {"chat": args.chat_latency, "speech": args.speech_latency, "images": args.image_latency}
+    lengths = [int(v) for v in args.lengths.split(",") if v]
+    stages = set(args.stages.split(","))
+
+    results = []
+    with MockApiServer(latency=latency, error_rates=rates, seed=args.seed) as server, \
+            tempfile.TemporaryDirectory(prefix="bench_pipeline_") as tmp:
+        work_dir = args.work_dir or tmp
+        log_step(f"Mock API at {server.base_url}; outputs in {work_dir}")
+        cache_env = warm_up(work_dir)
+        for minutes in lengths:
+            results.append(bench_story(server, minutes, stages, work_dir, args.providers, args.profile, cache_env))
+
+    budget_path = Path(args.memory_budget)
+    budget = json.loads(budget_path.read_text(encoding="utf-8")) if budget_path.exists() else {}
+    peaks = stage_peaks(results)
+    over_budget = []
+    for minutes, stage_mb in peaks.items():
+        if minutes not in budget:
+            log_warn(f"No memory budget for {minutes}-minute stories; not checked.")
+            continue
+        problems = check_budgets({"stages": {k: {"mem_total_mb": v} for k, v in stage_mb.items()}}, budget[minutes])
+        over_budget += [f"{minutes}min {p}" for p in problems]
+
+    report = {"latency": latency, "error_rates": rates, "providers": args.providers or "default",
+              "results": results, "memory_peaks_mb": peaks, "memory_budget_mb": budget,
+              "over_budget": over_budget}
+    safe_print(json.dumps(report, indent=2))
+    if args.report:
+        Path(args.report).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.report).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        log_success(f"Report written: {args.report}")
+
+    if args.write_memory_budget:
+        if not peaks:
+            log_error("No memory profile recorded (--profile 0?); budget not written.")
+            sys.exit(1)
+        budget_path.parent.mkdir(parents=True, exist_ok=True)
+        # Lengths not run this time keep their recorded budgets.
+        new_budget = dict(budget, **{minutes: {stage: round(max(mb * args.headroom, 64.0))
+                                               for stage, mb in sorted(stage_mb.items())}
+                                     for minutes, stage_mb in peaks.items()})
+        new_budget = dict(sorted(new_budget.items(), key=lambda kv: float(kv[0])))
+        budget_path.write_text(json.dumps(new_budget, indent=2) + "\n", encoding="utf-8")
+        log_success(f"Memory budget written: {budget_path}")
+        return
+
+    for problem in over_budget:
+        log_error(f"Memory budget exceeded: {problem}")
+    sys.exit(0 if all(r["ok"] for r in results) and not over_budget else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# benchmarks/bench_render.py
+"""
+Render-engine microbenchmarks with synthetic media and regression gates.
+
+Generates scene images, sine/noise narration and a music bed, then renders them with
+``video_agent`` (composed or streaming) and ``video_agent_v2`` for each configuration. Every render runs in its own worker process so peak RSS and spawned
+ffmpeg processes are measured per configuration.
+
+    python benchmarks/bench_render.py --save-baseline          # record baselines
+    python benchmarks/bench_render.py --check --threshold 0.2  # fail on regressions
+
+baselines/render.json is recorded with the defaults (4 scenes x 5 s, sine narration);
+--check refuses to compare runs made with other --scenes/--seconds/--audio, and
+configurations whose settings changed since the baseline need it re-recorded.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn
+
+DEFAULT_BASELINE = ROOT_DIR / "benchmarks" / "baselines" / "render.json"
+
+# name -> render configuration
+CONFIGS = {
+    "v1_720p_24fps": {"renderer": "v1", "fps": 24, "height": 720, "fade": 1.0, "music": False},
+    "v1_720p_24fps_music": {"renderer": "v1", "fps": 24, "height": 720, "fade": 1.0, "music": True},
+    "v1_480p_12fps_nofade": {"renderer": "v1", "fps": 12, "height": 480, "fade": 0.0, "music": False},
+    "v1_stream_720p_24fps_music": {"renderer": "v1_stream", "fps": 24, "height": 720, "fade": 1.0, "music": True},
+    # Subtitles (TextClip) need ImageMagick, which build hosts don't have; the v2 renderer is
+    # benchmarked without them.
+    "v2_720p_24fps": {"renderer": "v2", "fps": 24, "height": 720, "fade": 1.0, "music": False},
+}
+
+# Metrics where bigger is worse / smaller is worse, for the regression check.
+HIGHER_IS_WORSE = ("wall_s", "peak_rss_mb")
+LOWER_IS_WORSE = ("encode_fps",)
+# Run parameters that must match the baseline's for timings to be comparable.
+COMPARABLE = ("scenes", "seconds", "audio")
+
+
+def _ffmpeg():
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def make_synthetic_media(media_dir: Path, scenes: int, seconds: float, audio_kind: str = "sine",
+                         image_size=(1024, 1024)) -> dict:
+    """Write scene_N.jpg / scene_N.mp3 plus a music bed into ``media_dir``."""
+    from PIL import Image, ImageDraw
+
+    media_dir.mkdir(parents=True, exist_ok=True)
+    images, audio = [], []
+    for i in range(1, scenes + 1):
+        img_path = media_dir / f"scene_{i}.jpg"
+        img = Image.new("RGB", image_size, ((40 * i) % 255, 90, (255 - 30 * i) % 255))
+        ImageDraw.Draw(img).ellipse((100, 100, image_size[0] - 100, image_size[1] - 100), outline=(255, 255, 255))
+        img.save(img_path, quality=90)
+        images.append(str(img_path))
+
+        aud_path = media_dir / f"scene_{i}.mp3"
+        source = (f"sine=frequency={200 + 40 * i}:duration={seconds}" if audio_kind == "sine"
+                  else f"anoisesrc=color=pink:amplitude=0.1:duration={seconds}")
+        subprocess.run([_ffmpeg(), "-y", "-loglevel", "error", "-f", "lavfi", "-i", source,
+                        "-ac", "1", "-b:a", "64k", str(aud_path)], check=True)
+        audio.append(str(aud_path))
+
+    music = media_dir / "music.mp3"
+    subprocess.run([_ffmpeg(), "-y", "-loglevel", "error", "-f", "lavfi",
+                    "-i", f"sine=frequency=110:duration={scenes * seconds + 2}",
+                    "-ac", "2", "-b:a", "96k", str(music)], check=True)
+    subtitles = [f"Scene {i}: the fox keeps walking toward the star." for i in range(1, scenes + 1)]
+    return {"images": images, "audio": audio, "music": str(music), "subtitles": subtitles,
+            "durations": [seconds] * scenes}
+
+
+def run_worker(spec_path: str):
+    """Worker side: render one configuration and print its metrics as JSON."""
+    spec = json.loads(Path(spec_path).read_text(encoding="utf-8"))
+    cfg, media = spec["config"], spec["media"]
+
+    # Count every ffmpeg process the render spawns (moviepy and our own encoders).
+    spawned = {"ffmpeg": 0}
+    original_init = subprocess.Popen.__init__
+
+    def counting_init(self, args, *a, **kw):
+        first = args[0] if isinstance(args, (list, tuple)) else str(args)
+        if "ffmpeg" in os.path.basename(str(first)):
+            spawned["ffmpeg"] += 1
+        original_init(self, args, *a, **kw)
+
+    subprocess.Popen.__init__ = counting_init
+
+    from utils.timeline import Timeline
+
+    timeline = Timeline.from_paths(
+        media["images"], media["audio"], durations=media.get("durations"),
+        captions=media["subtitles"] if cfg.get("subtitles") else None, fade=cfg["fade"],
+        music=media["music"] if cfg.get("music") else None)
+    start = time.perf_counter()
+    if cfg["renderer"] == "v2":
+        from agents import video_agent_v2
+        video_agent_v2.create_multiscene_video(
+            timeline, output_path=spec["output"], subtitles=bool(cfg.get("subtitles")),
+            fps=cfg["fps"], height=cfg["height"])
+    else:
+        from agents import video_agent
+        render = (video_agent.create_multiscene_video_streaming if cfg["renderer"] == "v1_stream"
+                  else video_agent.create_multiscene_video)
+        render(timeline, spec["output"], fps=cfg["fps"], height=cfg["height"])
+    wall = time.perf_counter() - start
+
+    print(json.dumps({
+        "wall_s": wall,
+        "frames": timeline.compile(cfg["fps"]).total_frames,
+        "ffmpeg_processes": spawned["ffmpeg"],
+        "self_peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+    }))
+
+
+def bench_config(name, cfg, media, duration_s, work_dir: Path):
+    spec_path = work_dir / f"{name}.json"
+    spec_path.write_text(json.dumps({
+        "config": cfg, "media": media, "duration_s": duration_s,
+        "output": str(work_dir / f"{name}.mp4"),
+    }), encoding="utf-8")
+
+    out_path, err_path = work_dir / f"{name}.out", work_dir / f"{name}.err"
+    with open(out_path, "wb") as out, open(err_path, "wb") as err:
+        proc = subprocess.Popen([sys.executable, __file__, "--worker", str(spec_path)], cwd=str(ROOT_DIR),
+                                stdout=out, stderr=err)
+        # wait4 gives the rusage of this worker including the ffmpeg children it reaped.
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        return {"ok": False, "error": err_path.read_text(encoding="utf-8", errors="ignore")[-1500:]}
+
+    # The metrics are the last JSON line; log output flushed at exit may follow it.
+    lines = out_path.read_bytes().decode("utf-8", "ignore").splitlines()
+    metrics = json.loads(next(line for line in reversed(lines) if line.startswith("{")))
+    return {
+        "ok": True,
+        "wall_s": round(metrics["wall_s"], 3),
+        "encode_fps": round(metrics["frames"] / metrics["wall_s"], 2),
+        "peak_rss_mb": round(metrics["self_peak_rss_mb"], 1),
+        "tree_peak_rss_mb": round(usage.ru_maxrss / 1024.0, 1),
+        "ffmpeg_processes": metrics["ffmpeg_processes"],
+        "config": cfg,
+    }
+
+
+def check_regressions(results: dict, baseline: dict, threshold: float) -> list:
+    """Compare results with a stored baseline; return human-readable regressions."""
+    problems = []
+    for name, base in baseline.get("results", {}).items():
+        cur = results.get(name)
+        if cur is None or not base.get("ok"):
+            continue
+        if not cur.get("ok"):
+            problems.append(f"{name}: render failed")
+            continue
+        if cur["config"] != base.get("config"):
+            problems.append(f"{name}: configuration differs from the baseline's; re-record it")
+            continue
+        for key in HIGHER_IS_WORSE:
+            if cur[key] > base[key] * (1 + threshold):
+                problems.append(f"{name}: {key} {cur[key]} > baseline {base[key]} (+{threshold:.0%})")
+        for key in LOWER_IS_WORSE:
+            if cur[key] < base[key] * (1 - threshold):
+                problems.append(f"{name}: {key} {cur[key]} < baseline {base[key]} (-{threshold:.0%})")
+        if cur["ffmpeg_processes"] > base["ffmpeg_processes"]:
+            problems.append(f"{name}: ffmpeg_processes {cur['ffmpeg_processes']} > baseline {base['ffmpeg_processes']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render-engine microbenchmarks.")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="Comma-separated config names.")
+    parser.add_argument("--scenes", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0, help="Narration length per scene.")
+    parser.add_argument("--audio", choices=["sine", "noise"], default="sine")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="Fail if results regress against the baseline.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression.")
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker)
+        return
+
+    baseline = None
+    if args.check:
+        # Refuse before rendering anything: timings are only comparable under the same run parameters.
+        if not Path(args.baseline).exists():
+            log_error(f"No baseline at {args.baseline}; run with --save-baseline first.")
+            sys.exit(2)
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        mismatched = [f"{k}={getattr(args, k)} (baseline {baseline.get(k)})" for k in COMPARABLE
+                      if baseline.get(k) != getattr(args, k)]
+        if mismatched:
+            log_error(f"Not comparable with {args.baseline}: {', '.join(mismatched)}. "
+                      "Run with the baseline's settings or --save-baseline.")
+            sys.exit(2)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_render_") as tmp:
+        work_dir = Path(tmp)
+        log_step(f"Generating synthetic media: {args.scenes} scenes x {args.seconds}s ({args.audio})")
+        media = make_synthetic_media(work_dir / "media", args.scenes, args.seconds, args.audio)
+        duration_s = args.scenes * args.seconds
+        for name in args.configs.split(","):
+            result = bench_config(name, CONFIGS[name], media, duration_s, work_dir)
+            results[name] = result
+            if result["ok"]:
+                safe_print(f"  {name:<30} {result['wall_s']:7.2f}s  {result['encode_fps']:7.1f} fps  "
+                           f"{result['peak_rss_mb']:7.1f} MB  {result['ffmpeg_processes']:3d} ffmpeg")
+            else:
+                log_warn(f"{name} failed: {result['error'].strip().splitlines()[-1] if result['error'].strip() else ''}")
+
+    report = {"scenes": args.scenes, "seconds": args.seconds, "audio": args.audio, "results": results}
+
+    if args.save_baseline:
+        failed = [name for name, r in results.items() if not r["ok"]]
+        if failed:
+            log_error(f"Not saving a baseline with failed renders: {', '.join(failed)}")
+            sys.exit(1)
+        Path(args.baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.baseline).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        log_success(f"Baseline saved: {args.baseline}")
+
+    if args.check:
+        problems = check_regressions(results, baseline, args.threshold)
+        if problems:
+            for p in problems:
+                log_error(p)
+            sys.exit(1)
+        log_success("No render regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+# benchmarks/mock_api_server.py
+"""
+Local stand-in for the Euron / Groq endpoints used by the agents.
+
+Emulates ``chat/completions``, ``audio/speech`` and ``images/generations`` under any
+path prefix, with configurable latency per endpoint, 403/429 injection and synthetic
+mp3/jpg payloads, so the whole pipeline can run offline.
+
+Also implements the YouTube resumable-upload protocol (``/upload/youtube/v3/videos``),
+with optional dropped connections that keep only part of a chunk, to test resuming.
+
+And a path-style S3 subset under ``/s3/<bucket>/<key>`` (PUT/GET/HEAD/DELETE,
+ListObjectsV2, multipart uploads) as the artifact store's stand-in; see ``MockApiServer.s3_env``.
+
+Point the agents at it with EURON_API_BASE / GROQ_API_BASE / YOUTUBE_UPLOAD_BASE
+(see ``MockApiServer.env``).
+"""
+
+import io
+import json
+import uuid
+import hashlib
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import base64
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.sax.saxutils import escape
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from utils.log_utils import safe_print, log_success
+
+ENDPOINTS = ("chat", "speech", "images", "upload", "storage")
+WORDS_PER_SECOND = 2.5
+
+
+def parse_latency(spec: str, rng=random):
+    """
+    Turn a latency spec into a sampler returning seconds, drawn from ``rng``.
+
+    ``fixed:0.2`` | ``uniform:0.1,0.5`` | ``lognormal:mu,sigma`` | ``0.2`` (same as fixed).
+    """
+    kind, _, args = spec.partition(":")
+    if not args:
+        kind, args = "fixed", kind
+    values = [float(v) for v in args.split(",")]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def synthetic_mp3(seconds: float) -> bytes:
+    """A real mp3 of a quiet sine tone, encoded with the ffmpeg bundled by imageio-ffmpeg."""
+    import imageio_ffmpeg
+
+    cmd = [
+        imageio_ffmpeg.get_ffmpeg_exe(), "-loglevel", "error", "-f", "lavfi",
+        "-i", f"sine=frequency=330:duration={seconds:.2f}", "-af", "volume=0.2",
+        "-ac", "1", "-b:a", "64k", "-f", "mp3", "pipe:1",
+    ]
+    return subprocess.run(cmd, capture_output=True, check=True).stdout
+
+
+def synthetic_jpg(prompt: str, size: str = "1024x1024") -> bytes:
+    from PIL import Image, ImageDraw
+
+    w, h = (int(v) for v in size.split("x"))
+    seed = sum(map(ord, prompt))
+    img = Image.new("RGB", (w, h), (seed % 200, (seed // 7) % 200, (seed // 13) % 200))
+    ImageDraw.Draw(img).text((20, 20), prompt[:80], fill=(255, 255, 255))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+def synthetic_scenes(user_prompt: str, system_prompt: str) -> list:
+    """Fake model output shaped like what script_agent asks for."""
+    if "chapter_number" in system_prompt:
+        n = int((re.search(r"exactly (\d+) chapters", user_prompt) or [0, 1])[1])
+        return [{"chapter_number": i, "title": f"Chapter {i}", "summary": "Something happens."}
+                for i in range(1, n + 1)]
+
+    match = re.search(r"exactly (\d+) scenes", user_prompt)
+    if match:
+        n = int(match.group(1))
+    else:
+        minutes = re.search(r"(\d+(?:\.\d+)?)\s*-?\s*min", user_prompt)
+        n = max(3, round(float(minutes.group(1)) * 3)) if minutes else 3
+    words = re.search(r"about (\d+) words", user_prompt)
+    words = int(words.group(1)) if words else 50
+    return [
+        {
+            "scene_number": i,
+            "narration": " ".join(["Once upon a time the story went on."] * max(1, words // 8)),
+            "image_prompt": f"storybook illustration, scene {i}",
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+class MockApiServer:
+    """Threaded mock server. Use as a context manager or call start()/stop()."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None, error_rates=None, seed=None,
+                 upload_drop_rate=0.0):
+        self._rng = random.Random(seed)
+        self.latency = {ep: parse_latency((latency or {}).get(ep, "0"), self._rng) for ep in ENDPOINTS}
+        # {"chat": {403: 0.05, 429: 0.1}, ...}
+        self.error_rates = error_rates or {}
+        # Chance that an upload chunk "drops": only a random prefix is kept and 503 returned.
+        self.upload_drop_rate = upload_drop_rate
+        self.uploads = {}
+        self.objects = {}
+        self.multipart = {}
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._mp3_cache = {}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        """Environment variables that route both providers to this server."""
+        return {
+            "EURON_API_KEY": "mock", "GROQ_API_KEY": "mock",
+            "EURON_API_BASE": f"{self.base_url}/euron", "GROQ_API_BASE": f"{self.base_url}/groq",
+            "YOUTUBE_ACCESS_TOKEN": "mock", "YOUTUBE_UPLOAD_BASE": self.base_url,
+        }
+
+    def s3_env(self, bucket="storygen"):
+        """Environment variables that put run artifacts in this server's object store."""
+        return {
+            "ARTIFACT_STORE": f"s3://{bucket}/runs", "ARTIFACT_S3_ENDPOINT": f"{self.base_url}/s3",
+            "AWS_ACCESS_KEY_ID": "mock", "AWS_SECRET_ACCESS_KEY": "mock",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def _record(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _injected_status(self, endpoint):
+        roll = self._rng.random()
+        for status, rate in sorted(self.error_rates.get(endpoint, {}).items()):
+            if roll < rate:
+                return int(status)
+            roll -= rate
+        return None
+
+    def _speech(self, text):
+        seconds = max(0.5, round(len(text.split()) / WORDS_PER_SECOND * 2) / 2)
+        with self._lock:
+            cached = self._mp3_cache.get(seconds)
+        if cached is None:
+            cached = synthetic_mp3(seconds)
+            with self._lock:
+                self._mp3_cache[seconds] = cached
+        return cached
+
+    # === YouTube resumable upload ===
+
+    def _start_upload(self, headers, metadata):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.uploads[upload_id] = {"total": int(headers.get("X-Upload-Content-Length") or 0),
+                                       "received": 0, "sha256": hashlib.sha256(), "metadata": metadata,
+                                       "video": None}
+        return upload_id
+
+    def _upload_status(self, upload):
+        """(status, headers, body) describing an upload session's progress."""
+        if upload["video"] is not None:
+            return 201, {}, json.dumps(upload["video"]).encode()
+        headers = {"Range": f"bytes=0-{upload['received'] - 1}"} if upload["received"] else {}
+        return 308, headers, b""
+
+    def _put_chunk(self, upload_id, content_range, body):
+        with self._lock:
+            upload = self.uploads.get(upload_id)
+            if upload is None:
+                return 404, {}, b'{"error": "upload session not found"}'
+            if content_range.startswith("bytes */"):
+                return self._upload_status(upload)
+            first, rest = content_range[len("bytes "):].split("-", 1)
+            if int(first) != upload["received"]:
+                return self._upload_status(upload)  # out of sync: tell the client where we are
+            if self._rng.random() < self.upload_drop_rate:
+                kept = body[:self._rng.randrange(0, len(body) + 1)]
+                upload["sha256"].update(kept)
+                upload["received"] += len(kept)
+                self.counts["upload:drop"] += 1
+                return 503, {}, b'{"error": "connection dropped"}'
+            upload["sha256"].update(body)
+            upload["received"] += len(body)
+            self.counts["upload:chunk"] += 1
+            if upload["received"] >= upload["total"]:
+                upload["video"] = {"kind": "youtube#video", "id": upload_id[:11],
+                                   "snippet": upload["metadata"].get("snippet", {}),
+                                   "status": {"uploadStatus": "uploaded"},
+                                   "sha256": upload["sha256"].hexdigest(), "bytes": upload["received"]}
+                self.counts["upload:done"] += 1
+            return self._upload_status(upload)
+
+    # === S3-compatible object storage ===
+
+    def _s3_list(self, bucket, query):
+        prefix = query.get("prefix", [""])[0]
+        after = query.get("continuation-token", [""])[0]
+        max_keys = int(query.get("max-keys", ["1000"])[0])
+        keys = sorted(k for b, k in self.objects if b == bucket and k.startswith(prefix) and k > after)
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+        items = "".join(
+            f"<Contents><Key>{escape(k)}</Key><Size>{len(self.objects[bucket, k][0])}</Size>"
+            f"<ETag>{escape(self.objects[bucket, k][1])}</ETag></Contents>" for k in page)
+        token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+        return (f'<?xml version="1.0" encoding="UTF-8"?><ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+                f"<Name>{bucket}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+                f"<IsTruncated>{str(truncated).lower()}</IsTruncated>{token}{items}</ListBucketResult>").encode()
+
+    def _s3(self, method, path, query, body):
+        """(status, headers, body) for one path-style S3 request under /s3/."""
+        bucket, _, key = path[len("/s3/"):].partition("/")
+        key = unquote(key)
+        query = parse_qs(query, keep_blank_values=True)
+        with self._lock:
+            self.counts[f"s3:{method}"] += 1
+            if method == "GET" and not key:
+                return 200, {}, self._s3_list(bucket, query)
+            if "uploads" in query:
+                upload_id = uuid.uuid4().hex
+                self.multipart[upload_id] = {"bucket": bucket, "key": key, "parts": {}}
+                return 200, {}, f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId>" \
+                                f"</InitiateMultipartUploadResult>".encode()
+            if "uploadId" in query:
+                upload_id = query["uploadId"][0]
+                upload = self.multipart.get(upload_id)
+                if upload is None:
+                    return 404, {}, b"<Error><Code>NoSuchUpload</Code></Error>"
+                if method == "PUT":
+                    etag = f'"{hashlib.md5(body).hexdigest()}"'
+                    upload["parts"][int(query["partNumber"][0])] = (body, etag)
+                    self.counts["s3:part"] += 1
+                    return 200, {"ETag": etag}, b""
+                if method == "DELETE":
+                    del self.multipart[upload_id]
+                    return 204, {}, b""
+                numbers = [int(n) for n in re.findall(rb"<PartNumber>(\d+)</PartNumber>", body)]
+                parts = [upload["parts"][n] for n in numbers]
+                digest = hashlib.md5(b"".join(bytes.fromhex(etag.strip('"')) for _, etag in parts)).hexdigest()
+                etag = f'"{digest}-{len(parts)}"'
+                self.objects[bucket, key] = (b"".join(data for data, _ in parts), etag)
+                del self.multipart[upload_id]
+                return 200, {}, f"<CompleteMultipartUploadResult><Key>{escape(key)}</Key>" \
+                                f"<ETag>{escape(etag)}</ETag></CompleteMultipartUploadResult>".encode()
+            if method == "PUT":
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                self.objects[bucket, key] = (body, etag)
+                return 200, {"ETag": etag}, b""
+            if method == "DELETE":
+                self.objects.pop((bucket, key), None)
+                return 204, {}, b""
+            obj = self.objects.get((bucket, key))
+            if obj is None:
+                return 404, {}, b"<Error><Code>NoSuchKey</Code></Error>"
+            return 200, {"ETag": obj[1]}, obj[0]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body: bytes, content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _storage(self, method):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                time.sleep(max(0.0, server.latency["storage"]()))
+                status = server._injected_status("storage")
+                if status:
+                    server._record(f"storage:{status}")
+                    return self._send(status, b"<Error><Code>Injected</Code></Error>", "application/xml")
+                status, headers, out = server._s3(method, parts.path, parts.query, body)
+                if method == "HEAD":
+                    self.send_response(status)
+                    for k, v in headers.items():
+                        self.send_header(k, v)
+                    self.send_header("Content-Length", str(len(out)))
+                    self.end_headers()
+                    return
+                return self._send(status, out, "application/xml" if out[:1] == b"<" else "application/octet-stream",
+                                  headers=headers)
+
+            def do_GET(self):
+                if self.path.startswith("/s3/"):
+                    return self._storage("GET")
+                server._record("404")
+                return self._send(404, b'{"error": "not found"}')
+
+            def do_HEAD(self):
+                return self._storage("HEAD")
+
+            def do_DELETE(self):
+                return self._storage("DELETE")
+
+            def do_PUT(self):
+                if self.path.startswith("/s3/"):
+                    return self._storage("PUT")
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                time.sleep(max(0.0, server.latency["upload"]()))
+                upload_id = parse_qs(urlsplit(self.path).query).get("upload_id", [""])[0]
+                status, headers, out = server._put_chunk(upload_id, self.headers.get("Content-Range", ""), body)
+                return self._send(status, out, headers=headers)
+
+            def do_POST(self):
+                if self.path.startswith("/s3/"):
+                    return self._storage("POST")
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if urlsplit(self.path).path.endswith("/upload/youtube/v3/videos"):
+                    time.sleep(max(0.0, server.latency["upload"]()))
+                    status = server._injected_status("upload")
+                    if status:
+                        server._record(f"upload:{status}")
+                        return self._send(status, json.dumps({"error": f"injected {status}"}).encode())
+                    server._record("upload:start")
+                    upload_id = server._start_upload(self.headers, payload)
+                    location = f"{server.base_url}/upload/youtube/v3/videos?uploadType=resumable&upload_id={upload_id}"
+                    return self._send(200, b"", headers={"Location": location})
+                if self.path.endswith("/chat/completions"):
+                    endpoint = "chat"
+                elif self.path.endswith("/audio/speech"):
+                    endpoint = "speech"
+                elif self.path.endswith("/images/generations"):
+                    endpoint = "images"
+                else:
+                    server._record("404")
+                    return self._send(404, b'{"error": "not found"}')
+
+                time.sleep(max(0.0, server.latency[endpoint]()))
+                status = server._injected_status(endpoint)
+                if status:
+                    server._record(f"{endpoint}:{status}")
+                    return self._send(status, json.dumps({"error": f"injected {status}"}).encode())
+                server._record(endpoint)
+
+                if endpoint == "chat":
+                    messages = payload.get("messages", [])
+                    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+                    user = next((m["content"] for m in messages if m.get("role") == "user"), "")
+                    content = json.dumps(synthetic_scenes(user, system))
+                    body = {"choices": [{"message": {"role": "assistant", "content": content}}]}
+                    return self._send(200, json.dumps(body).encode())
+                if endpoint == "speech":
+                    return self._send(200, server._speech(payload.get("input", "")), "audio/mpeg")
+                jpg = synthetic_jpg(payload.get("prompt", ""), payload.get("size", "1024x1024"))
+                body = {"data": [{"b64_json": base64.b64encode(jpg).decode("ascii")}]}
+                return self._send(200, json.dumps(body).encode())
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the mock Euron/Groq API server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--chat-latency", default="lognormal:-0.7,0.4")
+    parser.add_argument("--speech-latency", default="uniform:0.3,1.2")
+    parser.add_argument("--image-latency", default="uniform:1.0,3.0")
+    parser.add_argument("--storage-latency", default="0")
+    parser.add_argument("--rate-403", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--upload-drop-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    # Quota/rate errors are a provider thing; the object store is left alone.
+    rates = {ep: {403: args.rate_403, 429: args.rate_429} for ep in ENDPOINTS if ep != "storage"}
+    latency = {"chat": args.chat_latency, "speech": args.speech_latency, "images": args.image_latency,
+               "storage": args.storage_latency}
+    server = MockApiServer(port=args.port, latency=latency, error_rates=rates, upload_drop_rate=args.upload_drop_rate,
+                           seed=args.seed)
+    log_success(f"Mock API listening on {server.base_url}")
+    for k, v in {**server.env(), **server.s3_env()}.items():
+        safe_print(f"  {k}={v}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,17 +1,21 @@
+from pathlib import Path
+
 from agents.image_agent import generate_scene_image
-from utils.text_splitter import split_script_into_scenes
-from agents.script_agent import generate_script
+from utils.text_splitter import segment_scenes
+from agents.script_agent import generate_story_script
 
 # 1. Generate story (or you can hardcode your own text)
-story_text = generate_script("The Little Fox and the Star")
+story_text = " ".join(scene.get("narration", "") for scene in generate_story_script("The Little Fox and the Star"))
 
-# 2. Split into scenes
-scenes = split_script_into_scenes(story_text, max_chars=220)
+# 2. Split into scenes of balanced narration length
+scenes = segment_scenes(story_text)
 
 # 3. Generate one image per scene
+image_dir = Path("output/images")
+image_dir.mkdir(parents=True, exist_ok=True)
 image_paths = []
 for idx, scene in enumerate(scenes, start=1):
-    img_path = generate_scene_image(scene_text=scene, scene_index=idx)
+    img_path, _ = generate_scene_image(scene, scene_number=idx, image_dir=image_dir)
     image_paths.append(img_path)
 
 print("\n✅ Image generation complete!")
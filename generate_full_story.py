@@ -1,10 +1,13 @@
 # generate_full_story.py
 
+import os
+import json
 import subprocess
 import sys
 from pathlib import Path
 import time
 import textwrap
+from functools import partial
 
 # Ensure root directory (project base) is in sys.path for imports
 ROOT_DIR = Path(__file__).resolve().parents[1]
@@ -12,7 +15,9 @@ if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
 
 # ✅ Use shared logging utilities
-from utils.log_utils import safe_print, log_step, log_success, log_error
+from utils.log_utils import safe_print, log_step, log_success, log_error, log_warn, flush_logs
+from utils.log_utils import init_tracing, span, trace_env, export_chrome_trace, load_trace, critical_path
+from utils.run_index import RunIndex, request_key, new_run_id, HEARTBEAT_S
 
 
 # === Agent script paths ===
@@ -21,6 +26,8 @@ SCRIPT_AGENT = AGENTS_DIR / "script_agent.py"
 TTS_AGENT = AGENTS_DIR / "tts_agent.py"
 IMAGE_AGENT = AGENTS_DIR / "image_agent.py"
 VIDEO_AGENT = AGENTS_DIR / "video_agent.py"
+VARIANT_AGENT = AGENTS_DIR / "variant_agent.py"
+YOUTUBE_AGENT = AGENTS_DIR / "youtube_agent.py"
 
 
 def run_step(name: str, script_path: Path, extra_args=None):
@@ -30,7 +37,10 @@ def run_step(name: str, script_path: Path, extra_args=None):
     if extra_args:
         cmd.extend(extra_args)
 
-    result = subprocess.run(cmd)
+    flush_logs()  # the agent writes to the same console
+    with span(name, stage="pipeline") as sp:
+        result = subprocess.run(cmd, env=trace_env())
+        sp.set(returncode=result.returncode)
     if result.returncode != 0:
         log_error(f"{name} failed. Stopping pipeline.")
         sys.exit(1)
@@ -38,40 +48,375 @@ def run_step(name: str, script_path: Path, extra_args=None):
     log_success(f"{name} completed.")
 
 
+def start_background_upload(base_output_dir: Path):
+    """Upload in a detached process so a long upload never holds up the next render."""
+    upload_dir = base_output_dir / "upload"
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    with open(upload_dir / "upload.log", "ab") as log:
+        proc = subprocess.Popen([sys.executable, str(YOUTUBE_AGENT), str(base_output_dir)],
+                                stdout=log, stderr=subprocess.STDOUT, env=trace_env(), start_new_session=True)
+    log_step(f"YouTube upload started in background (pid {proc.pid}); log: {upload_dir / 'upload.log'}")
+
+
+# === Batch mode ===
+# Provider slots shared by every story in a batch: how many agent stages may use each
+# provider kind at once. Override with --limits=llm:2,tts:3,image:2 or BATCH_LIMITS.
+DEFAULT_LIMITS = {"llm": 2, "tts": 3, "image": 2}
+# CPU slots a render holds; the batch CPU budget (--cpu) defaults to this machine's cores.
+RENDER_CPU = int(os.getenv("BATCH_RENDER_CPU", "2"))
+DEFAULT_LENGTH = 3
+
+# (stage, agent, runs after, resources held while it runs)
+BATCH_STAGES = (
+    ("script", SCRIPT_AGENT, (), {"llm": 1}),
+    ("tts", TTS_AGENT, ("script",), {"tts": 1}),
+    ("image", IMAGE_AGENT, ("script",), {"image": 1}),
+    ("video", VIDEO_AGENT, ("tts", "image"), {"cpu": RENDER_CPU}),
+    ("variants", VARIANT_AGENT, ("video",), {"llm": 1, "tts": 1, "cpu": RENDER_CPU}),
+)
+
+
+def _parse_limits(spec: str) -> dict:
+    limits = dict(DEFAULT_LIMITS)
+    for item in filter(None, (spec or "").split(",")):
+        kind, _, n = item.partition(":")
+        limits[kind.strip()] = int(n)
+    return limits
+
+
+def _as_list(value) -> list:
+    if isinstance(value, str):
+        value = value.split(",")
+    return [str(v).strip() for v in value or [] if str(v).strip()]
+
+
+def load_batch(path: Path):
+    """Stories from a JSONL file (prompt, genre, length, priority, formats, languages); returns (stories, invalid)."""
+    stories, invalid = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                item = json.loads(line)
+                prompt = str(item["prompt"]).strip()
+                if not prompt:
+                    raise ValueError("empty prompt")
+                stories.append({
+                    "id": str(item.get("id") or line_no), "line": line_no, "seq": len(stories), "prompt": prompt,
+                    "genre": item.get("genre"), "length": float(item.get("length") or DEFAULT_LENGTH),
+                    "priority": int(item.get("priority") or 0),
+                    "formats": _as_list(item.get("formats")), "languages": _as_list(item.get("languages")),
+                })
+            except KeyError as e:
+                invalid.append({"line": line_no, "error": f"invalid request: missing {e}"})
+            except (ValueError, TypeError, AttributeError) as e:
+                invalid.append({"line": line_no, "error": f"invalid request: {e}"})
+    return stories, invalid
+
+
+def _run_agent(script_path: Path, args: list, env: dict, log_path: Path):
+    """One stage of one story, its output going to the story's log instead of the shared console."""
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "ab") as log:
+        result = subprocess.run([sys.executable, str(script_path)] + args, env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+    if result.returncode != 0:
+        lines = log_path.read_text(encoding="utf-8", errors="replace").strip().splitlines()
+        raise RuntimeError(f"{script_path.stem} exited with {result.returncode}: "
+                           f"{lines[-1] if lines else 'no output'} (log: {log_path})")
+
+
+class BatchRun:
+    """Schedules every story of a batch through one Scheduler and reports on the result."""
+
+    def __init__(self, stories: list, limits: dict, cpu: int, fresh: bool = False, upload: bool = False):
+        from utils.batch_scheduler import Scheduler
+
+        self.batch_id = new_run_id()
+        self.stories = stories
+        self.fresh, self.upload = fresh, upload
+        self.run_index = RunIndex()
+        self.scheduler = Scheduler({**limits, "cpu": cpu}, on_event=self._on_event)
+
+    def _story_prompt(self, story: dict) -> str:
+        genre = f" in {story['genre']} genre" if story["genre"] else ""
+        return f"{story['prompt']}{genre}, make it approximately {story['length']:g} minute story"
+
+    def _claim(self, story: dict):
+        # A story reclaimed after its attached run produced nothing gets a numbered retry id;
+        # the batch id makes these unique, however many times the story is reclaimed.
+        story["attempt"] = story.get("attempt", 0) + 1
+        retry = f"-r{story['attempt'] - 1}" if story["attempt"] > 1 else ""
+        run_id = f"{self.batch_id}-{story['seq'] + 1:03d}{retry}"
+        run_dir = Path(f"output/generated_videos/{run_id}")
+        role, claimed = self.run_index.claim_run(
+            run_id, run_dir, story["key"], fresh=self.fresh or bool(story.get("run_id")),
+            prompt=story["prompt"], genre=story["genre"], length=story["length"], batch=self.batch_id)
+        story["role"], story["run_id"] = role, claimed["run_id"]
+        if role == "lead":
+            self._schedule(story, run_dir)
+        elif role == "attach":
+            self.scheduler.add(f"{story['id']}:attach", partial(self._attach, story),
+                               priority=(-story["priority"], story["seq"]), story=story["id"], stage="attach")
+
+    def _attach(self, story: dict):
+        """Wait on an identical run started elsewhere; rerun the story here if it produced nothing."""
+        finished = self.run_index.wait_for_run(story["run_id"])
+        if finished and self.run_index.final_video(finished["run_id"]):
+            story["role"] = "reuse"
+            return
+        log_warn(f"[{story['id']}] attached run {story['run_id']} produced no video; generating it here.")
+        self._claim(story)
+
+    def _schedule(self, story: dict, run_dir: Path):
+        run_dir.mkdir(parents=True, exist_ok=True)
+        env = trace_env(trace_dir=run_dir / "trace")
+        story_prompt = self._story_prompt(story)
+        args = {
+            "script": [story_prompt, str(run_dir), f"--minutes={story['length']:g}"],
+            "video": [str(run_dir)] + (["--stream"] if story["length"] >= 10 else [])
+                     + ([f"--formats={','.join(story['formats'])}"] if story["formats"] else []),
+            "variants": [str(run_dir), f"--languages={','.join(story['languages'])}"],
+        }
+        tasks = story["tasks"] = {}
+        for name, agent, after, resources in BATCH_STAGES:
+            if name == "variants" and not story["languages"]:
+                continue
+            tasks[name] = self.scheduler.add(
+                f"{story['id']}:{name}",
+                partial(_run_agent, agent, args.get(name, [str(run_dir)]), env, run_dir / "logs" / f"{name}.log"),
+                resources, priority=(-story["priority"], story["seq"]), after=[tasks[a] for a in after],
+                story=story["id"], stage=name)
+
+    def _on_event(self, event: str, task):
+        story = next(s for s in self.stories if s["id"] == task.info["story"])
+        label = f"[{story['id']}] {task.info['stage']}"
+        if event == "start":
+            log_step(f"{label} started", emoji="▶️")
+        elif event == "done":
+            log_success(f"{label} done in {task.run_s:.1f}s")
+        elif event == "failed":
+            log_error(f"{label} failed: {task.error}")
+        elif event == "skipped":
+            log_warn(f"{label} skipped (an earlier stage failed)")
+
+        if task.info["stage"] == "video" and event == "done" and self.upload:
+            start_background_upload(Path(self.run_index.get(story["run_id"])["output_dir"]))
+        tasks = story.get("tasks", {})
+        if event != "start" and tasks and all(t.end for t in tasks.values()):
+            ok = all(t.state == "done" for t in tasks.values())
+            self.run_index.finish_run(story["run_id"], status="done" if ok else "failed")
+
+    def _heartbeat(self):
+        """Keep this batch's in-flight runs visible as alive to identical requests elsewhere."""
+        for story in self.stories:
+            tasks = story.get("tasks", {})
+            if story.get("role") == "lead" and tasks and not all(t.end for t in tasks.values()):
+                self.run_index.touch(story["run_id"])
+
+    def run(self):
+        seen = {}
+        for story in sorted(self.stories, key=lambda s: (-s["priority"], s["seq"])):
+            story["key"] = request_key(story["prompt"], story["genre"], story["length"])
+            if story["key"] in seen:
+                # The same request twice in one file: make it once.
+                story["role"], story["same_as"] = "coalesced", seen[story["key"]]["id"]
+                continue
+            seen[story["key"]] = story
+            self._claim(story)
+        log_step(f"Batch {self.batch_id}: {len(self.stories)} stories, "
+                 f"limits {self.scheduler.capacity}", emoji="📦")
+        self.scheduler.run(tick=self._heartbeat, tick_s=HEARTBEAT_S)
+
+    def report(self, invalid: list, source: str) -> dict:
+        sched = self.scheduler
+        wall = (sched.finished_at or time.time()) - (sched.started_at or time.time())
+        by_id = {s["id"]: s for s in self.stories}
+        runs, failures, stage_stats = [], list(invalid), {}
+        for story in self.stories:
+            origin = by_id[story["same_as"]] if story.get("role") == "coalesced" else story
+            tasks = origin.get("tasks", {})
+            failed = next((t for t in tasks.values() if t.state == "failed"), None)
+            if origin.get("role") == "reuse" or tasks and all(t.state == "done" for t in tasks.values()):
+                status = "done"
+            else:
+                status = "failed"
+            run = self.run_index.get(origin["run_id"]) if origin.get("run_id") else None
+            memory = None
+            if profiling_enabled() and story is origin and origin.get("role") == "lead" and run:
+                from utils.profiling import write_profile
+                memory = write_profile(Path(run["output_dir"]) / "trace")["stages"]
+            runs.append({
+                "id": story["id"], "run_id": origin.get("run_id"), "role": story.get("role"),
+                "priority": story["priority"], "length": story["length"], "status": status,
+                "final_video": run["final_video"] if run else None,
+                "wall_s": round(max(t.end for t in tasks.values()) - min(t.start for t in tasks.values() if t.start), 2)
+                if tasks and any(t.start for t in tasks.values()) else 0.0,
+                **({"memory": memory} if memory else {}),
+            })
+            if failed is not None and story is origin:
+                failures.append({"id": story["id"], "line": story["line"], "stage": failed.info["stage"],
+                                 "error": str(failed.error)})
+        for task in sched.tasks:
+            if task.state in ("done", "failed") and task.info["stage"] != "attach":
+                stats = stage_stats.setdefault(task.info["stage"], {"count": 0, "run_s": 0.0, "wait_s": 0.0})
+                stats["count"] += 1
+                stats["run_s"] += task.run_s
+                stats["wait_s"] += task.wait_s
+        serial_s = sum(s["run_s"] for s in stage_stats.values())
+        done = [r for r in runs if r["status"] == "done"]
+        generated = [r for r in done if r["role"] == "lead"]
+        utilization = sched.utilization()
+        return {
+            "batch_id": self.batch_id, "source": source, "wall_s": round(wall, 2),
+            "limits": sched.capacity,
+            "stories": {"total": len(runs) + len(invalid), "done": len(done),
+                        "failed": len(runs) - len(done) + len(invalid),
+                        "reused": sum(r["role"] == "reuse" for r in runs),
+                        "coalesced": sum(r["role"] == "coalesced" for r in runs)},
+            # Generated here: reused and coalesced stories cost no work.
+            "throughput": {"stories_per_hour": round(len(generated) * 3600 / wall, 1) if generated else 0.0,
+                           "video_minutes_per_hour": round(sum(r["length"] for r in generated) * 60 / wall, 1)
+                           if generated else 0.0},
+            # Sum of stage times is what running the stories one after another would take.
+            "serial_s": round(serial_s, 2), "speedup": round(serial_s / wall, 2) if wall else 0.0,
+            "utilization": utilization, "bottleneck": max(utilization, key=utilization.get) if any(utilization.values()) else None,
+            "stages": {name: {"count": s["count"], "mean_s": round(s["run_s"] / s["count"], 2),
+                              "mean_wait_s": round(s["wait_s"] / s["count"], 2)}
+                       for name, s in stage_stats.items()},
+            "runs": runs, "failures": failures,
+        }
+
+
+def run_batch(path: Path, limits: dict, cpu: int, report_path: Path = None, fresh: bool = False,
+              upload: bool = False) -> dict:
+    stories, invalid = load_batch(path)
+    for bad in invalid:
+        log_error(f"{path}:{bad['line']}: {bad['error']}")
+    batch = BatchRun(stories, limits, cpu, fresh=fresh, upload=upload)
+    batch.run()
+    report = batch.report(invalid, str(path))
+
+    report_path = Path(report_path or f"output/batches/{batch.batch_id}/report.json")
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    counts = report["stories"]
+    safe_print(f"\n📦 Batch {batch.batch_id}: {counts['done']}/{counts['total']} stories done "
+               f"({counts['reused']} reused, {counts['coalesced']} coalesced, {counts['failed']} failed) "
+               f"in {report['wall_s']:.1f}s")
+    safe_print(f"   throughput: {report['throughput']['stories_per_hour']} stories/h, "
+               f"{report['throughput']['video_minutes_per_hour']} video min/h; "
+               f"{report['speedup']}x the serial time ({report['serial_s']:.1f}s)")
+    safe_print("   utilization: " + ", ".join(f"{k} {v:.0%}" for k, v in report["utilization"].items())
+               + f" (bottleneck: {report['bottleneck']})")
+    for failure in report["failures"]:
+        log_error(f"line {failure['line']}: {failure.get('stage', 'request')}: {failure['error']}")
+    log_success(f"Batch report: {report_path}")
+    return report
+
+
+def batch_main(argv: list):
+    from utils.render_settings import available_cores
+
+    options = dict(a[2:].split("=", 1) for a in argv if a.startswith("--") and "=" in a)
+    report = run_batch(
+        Path(options["batch"]), _parse_limits(options.get("limits", os.getenv("BATCH_LIMITS", ""))),
+        int(options.get("cpu") or available_cores()), report_path=options.get("report"),
+        fresh="--fresh" in argv, upload="--upload" in argv)
+    sys.exit(1 if report["failures"] else 0)
+
+
+def enable_profiling(argv: list):
+    """``--profile`` / ``--profile=tracemalloc``: profile memory per stage here and in every agent."""
+    flag = next((a for a in argv if a == "--profile" or a.startswith("--profile=")), None)
+    if flag:
+        from utils import profiling
+        os.environ[profiling.PROFILE_ENV] = flag.partition("=")[2] or "1"
+        profiling.install()
+
+
+def profiling_enabled() -> bool:
+    from utils.profiling import PROFILE_ENV
+    return os.environ.get(PROFILE_ENV, "0") not in ("", "0")
+
+
+def print_profile(report: dict):
+    for stage, peaks in report["stages"].items():
+        safe_print(f"   🧠 {stage}: {peaks['mem_total_mb']:.0f} MB peak (process {peaks.get('mem_rss_mb', 0):.0f} MB"
+                   f" + children {peaks.get('mem_children_mb', 0):.0f} MB), ffmpeg x{peaks.get('ffmpeg_peak', 0)}, "
+                   f"{peaks.get('fds_peak', 0)} fds")
+
+
 def main():
+    enable_profiling(sys.argv[1:])
+    if any(a.startswith("--batch=") for a in sys.argv[1:]):
+        batch_main(sys.argv[1:])
     if len(sys.argv) < 2:
         safe_print(textwrap.dedent("""
         ❌ Missing story prompt.
 
         👉 Example usage:
-           python generate_full_story.py "grandmother telling a story of Arjun and Karna fight"
+           python generate_full_story.py "grandmother telling a story of Arjun and Karna fight" [--upload]
+               [--formats=landscape,vertical,square] [--languages=hi,es,en]
+           python generate_full_story.py --batch=stories.jsonl [--limits=llm:2,tts:3,image:2] [--cpu=N]
+               [--report=report.json] [--fresh] [--upload]
+
+           --profile[=tracemalloc] records peak memory, ffmpeg processes and open files per
+           stage and scene into <run>/trace/profile.json (or set STORY_PROFILE).
         """))
         sys.exit(1)
 
     story_prompt = sys.argv[1]
 
     # Create unique folder
-    timestamp = time.strftime("%Y%m%d-%H%M%S")
-    base_output_dir = Path(f"output/generated_videos/{timestamp}")
+    run_id = new_run_id()
+    base_output_dir = Path(f"output/generated_videos/{run_id}")
     base_output_dir.mkdir(parents=True, exist_ok=True)
 
     log_step(f"Base output folder created: {base_output_dir}")
+    trace_dir = init_tracing(base_output_dir / "trace")
+    run_index = RunIndex()
+    run_index.start_run(run_id, base_output_dir, prompt=story_prompt)
 
     # Sequentially run the agents
     try:
-        run_step("Script Agent", SCRIPT_AGENT, [story_prompt, str(base_output_dir)])
-        run_step("TTS Agent", TTS_AGENT, [str(base_output_dir)])
-        run_step("Image Agent", IMAGE_AGENT, [str(base_output_dir)])
-        run_step("Video Agent", VIDEO_AGENT, [str(base_output_dir)])
+        with span("pipeline", stage="pipeline", prompt=story_prompt):
+            run_step("Script Agent", SCRIPT_AGENT, [story_prompt, str(base_output_dir)])
+            run_step("TTS Agent", TTS_AGENT, [str(base_output_dir)])
+            run_step("Image Agent", IMAGE_AGENT, [str(base_output_dir)])
+            video_args = [a for a in sys.argv[2:] if a.startswith("--formats=")]
+            run_step("Video Agent", VIDEO_AGENT, [str(base_output_dir)] + video_args)
+            # Dubbed versions reuse this run's images; each costs TTS plus one encode.
+            variant_args = [a for a in sys.argv[2:] if a.startswith("--languages=")]
+            if variant_args:
+                run_step("Variant Agent", VARIANT_AGENT, [str(base_output_dir)] + variant_args)
     except KeyboardInterrupt:
         log_error("🛑 Pipeline interrupted by user.")
+        run_index.finish_run(run_id, status="failed")
         sys.exit(1)
+    except SystemExit:
+        run_index.finish_run(run_id, status="failed")
+        raise
     except Exception as e:
         log_error(f"Unexpected error: {e}")
+        run_index.finish_run(run_id, status="failed")
         sys.exit(1)
 
+    run_index.finish_run(run_id)
+
     safe_print("\n✨ ✅ Full pipeline completed successfully.")
+    log_success(f"Trace written: {export_chrome_trace(trace_dir)} (open in https://ui.perfetto.dev)")
+    for r in critical_path(load_trace(trace_dir)):
+        safe_print(f"   ⏱ {r['name']}: {r['end'] - r['start']:.2f}s")
+    if profiling_enabled():
+        from utils.profiling import write_profile
+        print_profile(write_profile(trace_dir))
+        log_success(f"Memory profile written: {os.path.join(trace_dir, 'profile.json')}")
     log_success(f"Final video saved at: {base_output_dir}/video/final_story.mp4")
+    if "--upload" in sys.argv[2:]:
+        start_background_upload(base_output_dir)
 
 
 if __name__ == "__main__":
@@ -16,76 +16,78 @@ if not hasattr(PIL.Image, "ANTIALIAS"):
 
 import moviepy.editor as mpy
 
+from utils.render_settings import encoder_settings
+from utils.timeline import Timeline
+
 
 def create_multiscene_video(
-    image_paths: list,
-    audio_paths: list,
+    timeline: Timeline,
     output_path: str = "output/video/final_story.mp4",
-    bg_music_path: str = "assets/bg_music.mp3",
-    bg_music_volume: float = 0.15,
-    fade_duration: float = 1.0,
     fps: int = 24,
-    height: int = 720
+    height: int = 720,
+    profile: str = None
 ) -> str:
     """
-    Create final video with:
+    Create final video from a timeline with:
     - image clips
     - audio narration
     - smooth fade transitions
     - optional background music
     """
 
-    # ✅ Validation
-    if not (len(image_paths) == len(audio_paths)):
-        raise ValueError("❌ image_paths and audio_paths lengths must match.")
+    # ✅ Validation + exact frame ranges
+    plan = timeline.compile(fps)
 
     # Ensure output directory exists
     Path(os.path.dirname(output_path)).mkdir(parents=True, exist_ok=True)
 
     scene_clips = []
 
-    for idx, (img_path, aud_path) in enumerate(zip(image_paths, audio_paths), 1):
-        # 🖼 Load image & audio
-        audio_clip = mpy.AudioFileClip(aud_path)
-        img_clip = mpy.ImageClip(img_path).set_duration(audio_clip.duration).resize(height=height)
+    for idx, scene in enumerate(plan.scenes):
+        # 🖼 Load image & audio for exactly the planned frames
+        duration = plan.frame_count(idx) / fps
+        audio_clip = mpy.AudioFileClip(scene.audio)
+        img_clip = mpy.ImageClip(scene.image).set_duration(duration).resize(height=height)
 
         # 🪄 Combine image + audio
-        composite_clip = img_clip.set_audio(audio_clip)
+        composite_clip = img_clip.set_audio(audio_clip.subclip(0, min(duration, audio_clip.duration)))
 
         # 🌊 Smooth fade transitions (only visual)
-        if idx > 1:
-            composite_clip = composite_clip.fadein(fade_duration)
-        if idx < len(audio_paths):
-            composite_clip = composite_clip.fadeout(fade_duration)
+        if scene.fade_in:
+            composite_clip = composite_clip.fadein(scene.fade_in)
+        if scene.fade_out:
+            composite_clip = composite_clip.fadeout(scene.fade_out)
 
         scene_clips.append(composite_clip)
-        print(f"🎬 Scene {idx} added — duration: {audio_clip.duration:.2f}s")
+        print(f"🎬 Scene {scene.number} added — duration: {duration:.2f}s")
 
     # 📽️ Concatenate scenes
     final_clip = mpy.concatenate_videoclips(scene_clips, method="compose")
 
     # 🎼 Optional background music
-    if bg_music_path and os.path.exists(bg_music_path):
+    for layer in plan.layers:
         try:
-            bg_music = mpy.AudioFileClip(bg_music_path).volumex(bg_music_volume)
+            bg_music = mpy.AudioFileClip(layer.path).volumex(layer.volume)
             bg_music = bg_music.set_duration(final_clip.duration)
             combined_audio = mpy.CompositeAudioClip([final_clip.audio, bg_music])
             final_clip = final_clip.set_audio(combined_audio)
-            print(f"🎼 Background music added: {bg_music_path}")
+            print(f"🎼 Background music added: {layer.path}")
         except Exception as e:
             print(f"⚠️ Could not add background music: {e}")
 
     # 🧾 Export final video
-    final_clip.write_videofile(
-        output_path,
-        fps=fps,
-        codec="libx264",
-        audio_codec="aac",
-        threads=4,
-        preset="medium",
-        temp_audiofile="output/video/_temp_audio.m4a",
-        remove_temp=True
-    )
+    with encoder_settings(profile, fps=fps, height=height) as enc:
+        final_clip.write_videofile(
+            output_path,
+            fps=fps,
+            codec="libx264",
+            audio_codec="aac",
+            threads=enc["threads"],
+            preset=enc["preset"],
+            ffmpeg_params=enc["ffmpeg_params"],
+            temp_audiofile="output/video/_temp_audio.m4a",
+            remove_temp=True
+        )
 
     print(f"✅ Final video created (no subtitles): {output_path}")
     return output_path
@@ -104,10 +106,7 @@ if __name__ == "__main__":
         "output/audio_segments/scene_3.mp3",
     ]
 
-    create_multiscene_video(
-        image_paths=test_images,
-        audio_paths=test_audio,
-        bg_music_path="assets/bg_music.mp3",
-        bg_music_volume=0.18,
-        fade_duration=1.0
-    )
+    create_multiscene_video(Timeline.from_paths(
+        test_images, test_audio,
+        fade=1.0, music="assets/bg_music.mp3", music_volume=0.18,
+    ))
@@ -0,0 +1,78 @@
+import subprocess
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils.audio_stitch import (SAMPLE_RATE, SILENCE_LEVEL, EDGE_MARGIN_S, _ffmpeg, decode_pcm, encode_mp3,
+                                encoder_lead, mp3_bytes, stitch, trim_silence)
+
+
+def tone(seconds, freq=440.0, level=8000):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (level * np.sin(2 * np.pi * freq * t)).astype(np.int16)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.int16)
+
+
+def test_trim_silence_keeps_a_margin_around_the_sound():
+    clip = np.concatenate([silence(0.5), tone(1.0), silence(0.3)])
+
+    trimmed = trim_silence(clip)
+
+    margin = int(EDGE_MARGIN_S * SAMPLE_RATE)
+    assert len(trimmed) == pytest.approx(SAMPLE_RATE + 2 * margin, abs=3)
+    assert len(trim_silence(silence(1.0))) == 0
+
+
+def test_stitch_with_pauses_reports_exact_spans():
+    clips = [tone(1.0), tone(0.5), tone(2.0)]
+
+    pcm, spans = stitch(clips, pause_s=0.25, crossfade_s=0.015)
+
+    assert spans == [(0.0, 1.0), (1.25, 1.75), (2.0, 4.0)]
+    assert len(pcm) == int(4.0 * SAMPLE_RATE)
+    assert not pcm[SAMPLE_RATE + 10:int(1.25 * SAMPLE_RATE) - 10].any()  # the pause is silent
+    assert pcm[0] == 0 and abs(int(pcm[-1])) < SILENCE_LEVEL  # faded in and out
+
+
+def test_stitch_with_crossfade_overlaps_neighbours():
+    pcm, spans = stitch([tone(1.0), tone(1.0)], pause_s=0, crossfade_s=0.1)
+
+    assert spans == [(0.0, 1.0), (0.9, 1.9)]
+    assert len(pcm) == int(1.9 * SAMPLE_RATE)
+
+
+def onset(pcm) -> float:
+    return np.flatnonzero(np.abs(pcm.astype(np.int32)) > SILENCE_LEVEL)[0] / SAMPLE_RATE
+
+
+def test_encode_decode_round_trip_keeps_timing(tmp_path):
+    pcm = np.concatenate([silence(0.5), tone(1.0), silence(0.5)])
+    encode_mp3(pcm, tmp_path / "a.mp3")
+
+    assert onset(decode_pcm((tmp_path / "a.mp3").read_bytes())) == pytest.approx(0.5, abs=0.002)
+
+
+def test_streamed_mp3_keeps_the_encoder_delay_that_trimming_removes():
+    # Piped output cannot carry the gapless tag, so decoded audio starts late ...
+    decoded = decode_pcm(mp3_bytes(np.concatenate([silence(0.5), tone(1.0)])))
+    assert onset(decoded) == pytest.approx(0.5 + 1105 / SAMPLE_RATE, abs=0.002)
+
+    # ... which does not matter for stitched shards: their leading silence is trimmed.
+    assert onset(trim_silence(decoded)) == pytest.approx(EDGE_MARGIN_S, abs=0.001)
+
+
+def test_encoder_lead(tmp_path):
+    pcm = np.concatenate([silence(0.5), tone(1.0), silence(0.5)])
+    tagged, untagged = tmp_path / "tagged.mp3", tmp_path / "untagged.mp3"
+    encode_mp3(pcm, tagged)
+    subprocess.run([_ffmpeg(), "-y", "-loglevel", "error", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+                    "-i", "pipe:0", "-write_xing", "0", "-b:a", "128k", str(untagged)],
+                   input=pcm.tobytes(), check=True)
+
+    # The gapless tag cancels the encoder delay; without it, LAME's 1105-sample delay remains.
+    assert encoder_lead(pcm, tagged) == pytest.approx(0.0, abs=0.001)
+    assert encoder_lead(pcm, untagged) == pytest.approx(1105 / SAMPLE_RATE, abs=0.001)
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """An empty registry holding only the metrics a test registers, with no METRICS_DIR."""
+    monkeypatch.setattr(metrics, "REGISTRY", {})
+    monkeypatch.setattr(metrics, "_folded", {})
+    monkeypatch.delenv(metrics.METRICS_DIR_ENV, raising=False)
+    return metrics.REGISTRY
+
+
+def _samples(text: str, name: str) -> list:
+    return [line for line in text.splitlines() if line.startswith(name) and not line.startswith("#")]
+
+
+def test_label_values_are_escaped(registry):
+    counter = metrics._register(metrics.Counter("t_requests_total", "Test."))
+    counter.inc(provider='say "hi"\\now\nthen')
+
+    assert _samples(metrics.render_prometheus(), "t_requests_total") == [
+        't_requests_total{provider="say \\"hi\\"\\\\now\\nthen"} 1.0'
+    ]
+
+
+def test_counter_merges_thread_shards(registry):
+    import threading
+
+    counter = metrics._register(metrics.Counter("t_total", "Test."))
+    threads = [threading.Thread(target=lambda: [counter.inc(kind="a") for _ in range(100)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    counter.inc(2, kind="b")
+
+    assert counter.snapshot() == {metrics._key({"kind": "a"}): 400.0, metrics._key({"kind": "b"}): 2.0}
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    hist = metrics._register(metrics.Histogram("t_seconds", "Test.", buckets=(1, 5)))
+    for value in (0.5, 3, 3, 10):
+        hist.observe(value, stage="x")
+
+    text = metrics.render_prometheus()
+    assert "# TYPE t_seconds histogram" in text
+    assert _samples(text, "t_seconds") == [
+        't_seconds_bucket{stage="x",le="1"} 1',
+        't_seconds_bucket{stage="x",le="5"} 3',
+        't_seconds_bucket{stage="x",le="+Inf"} 4',
+        't_seconds_sum{stage="x"} 16.5',
+        't_seconds_count{stage="x"} 4',
+    ]
+
+
+def test_provider_status_is_the_outcome_and_code_is_separate(registry, monkeypatch):
+    requests = metrics._register(metrics.Counter("t_provider_requests_total", "Test."))
+    monkeypatch.setattr(metrics, "PROVIDER_REQUESTS", requests)
+    latency = metrics._register(metrics.Histogram("t_provider_seconds", "Test."))
+    monkeypatch.setattr(metrics, "PROVIDER_LATENCY", latency)
+
+    def span(name, **attrs):
+        return SimpleNamespace(name=name, start=0.0, end=0.2, attrs=attrs)
+
+    metrics._on_span(span("llm_request", stage="script", provider="groq", status=200, outcome="ok"))
+    metrics._on_span(span("tts_request", stage="tts", provider="euron", outcome="error"))
+
+    assert requests.snapshot() == {
+        metrics._key({"provider": "groq", "endpoint": "script", "status": "ok", "code": 200}): 1.0,
+        metrics._key({"provider": "euron", "endpoint": "tts", "status": "error", "code": ""}): 1.0,
+    }
+
+
+def test_dumps_of_finished_processes_are_folded_in(registry, tmp_path, monkeypatch):
+    counter = metrics._register(metrics.Counter("t_total", "Test."))
+    monkeypatch.setenv(metrics.METRICS_DIR_ENV, str(tmp_path))
+    counter.inc(3, kind="a")
+    metrics.dump(tmp_path / "12345.json")  # another (exited) process's totals
+    counter.inc(1, kind="a")
+
+    assert _samples(metrics.render_prometheus(), "t_total") == ['t_total{kind="a"} 7.0']
+    assert not (tmp_path / "12345.json").exists()
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from utils.prompt_index import PromptIndex, INDEX_FILE, jaccard, shingles
+
+VOCAB = ("fox star forest river lake hill moon lantern warrior chariot battlefield dawn dusk storm "
+         "temple village king queen sword bow arrow horse elephant garden palace mountain cave owl "
+         "tiger river boat market festival snow desert sun cloud bridge tower ship island").split()
+
+
+def random_prompt(rng) -> str:
+    return " ".join(rng.choice(VOCAB) for _ in range(12))
+
+
+def variant(rng, prompt: str) -> str:
+    """A near-duplicate: one word changed, or one appended."""
+    words = prompt.split()
+    if rng.random() < 0.5:
+        words[rng.randrange(len(words))] = rng.choice(VOCAB)
+    else:
+        words.append(rng.choice(VOCAB))
+    return " ".join(words)
+
+
+@pytest.fixture
+def files(tmp_path):
+    def make(name):
+        path = tmp_path / name
+        path.write_bytes(b"img")
+        return path
+    return make
+
+
+def test_lsh_recall_matches_brute_force(files):
+    rng = random.Random(7)
+    index = PromptIndex()
+    prompts = [random_prompt(rng) for _ in range(300)]
+    for i, prompt in enumerate(prompts):
+        index.add(prompt, files(f"{i}.jpg"))
+
+    threshold, found, expected = 0.7, 0, 0
+    for prompt in prompts:
+        query = variant(rng, prompt)
+        best = max(jaccard(shingles(query), shingles(p)) for p in prompts)
+        if best < threshold:
+            continue
+        expected += 1
+        match = index.query(query, threshold)
+        if match is not None and match.similarity == pytest.approx(best):
+            found += 1
+
+    assert expected > 100
+    assert found / expected >= 0.98
+
+
+def test_query_respects_threshold_and_namespaces(files):
+    index = PromptIndex()
+    index.add("Arjun and Karna face each other on the battlefield", files("a.jpg"), "euron:flux")
+
+    assert index.query("Arjun and Karna face each other on the battlefield at dawn", 0.6).namespace == "euron:flux"
+    assert index.query("Arjun and Karna face each other on the battlefield at dawn", 0.6,
+                       namespaces={"groq:other"}) is None
+    assert index.query("a lantern floats over the village market", 0.6) is None
+
+
+def test_persisted_index_keeps_the_most_recently_used_entries(tmp_path):
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    index = PromptIndex.load(cache, max_entries=3)
+    for i in range(4):
+        path = cache / f"{i}.jpg"
+        path.write_bytes(b"img")
+        index.add(f"scene {i} the fox watches the star over lake {i}", path)
+    index.touch(index.query("scene 0 the fox watches the star over lake 0", 0.9))
+
+    reloaded = PromptIndex.load(cache, max_entries=3)
+
+    assert len(reloaded) == 3
+    assert not (cache / "1.jpg").exists()  # least recently used: evicted with its file
+    assert reloaded.query("scene 0 the fox watches the star over lake 0", 0.9) is not None
+    assert len((cache / INDEX_FILE).read_text(encoding="utf-8").splitlines()) == 3
@@ -0,0 +1,139 @@
+import sqlite3
+import time
+
+import pytest
+
+from utils.run_index import HEARTBEAT_TIMEOUT_S, RunIndex, RetentionPolicy, new_run_id, request_key
+
+
+@pytest.fixture
+def index(tmp_path):
+    return RunIndex(tmp_path / "runs.sqlite")
+
+
+def make_run(index, tmp_path, run_id, created_at, intermediate=100, final=1000):
+    """A finished run with one intermediate and one final artifact of the given sizes."""
+    run_dir = tmp_path / "runs" / run_id
+    (run_dir / "images").mkdir(parents=True)
+    (run_dir / "video").mkdir()
+    (run_dir / "images" / "scene_1.jpg").write_bytes(b"x" * intermediate)
+    (run_dir / "video" / "final_story.mp4").write_bytes(b"x" * final)
+    index.start_run(run_id, run_dir)
+    index.finish_run(run_id)
+    with index._connect() as db:
+        db.execute("UPDATE runs SET created_at = ? WHERE run_id = ?", (created_at, run_id))
+    return run_dir
+
+
+def test_finish_run_records_artifacts_and_final_video(index, tmp_path):
+    run_dir = make_run(index, tmp_path, "r1", time.time())
+
+    assert index.final_video("r1") == str(run_dir / "video" / "final_story.mp4")
+    assert index.total_bytes() == 1100
+
+
+def test_gc_expires_old_runs_but_keeps_the_newest(index, tmp_path):
+    now = time.time()
+    old = [make_run(index, tmp_path, f"old{i}", now - (10 + i) * 86400) for i in range(3)]
+    make_run(index, tmp_path, "new", now)
+
+    stats = index.gc(RetentionPolicy(max_age_days=7, keep_last=1))
+
+    assert stats["runs_expired"] == 3
+    assert not any(d.exists() for d in old)
+    assert {r["run_id"] for r in index.runs(status="evicted")} == {"old0", "old1", "old2"}
+    assert index.final_video("new")
+
+
+def test_keep_last_protects_runs_regardless_of_age(index, tmp_path):
+    make_run(index, tmp_path, "ancient", time.time() - 100 * 86400)
+
+    assert index.gc(RetentionPolicy(max_age_days=1, keep_last=1))["runs_expired"] == 0
+    assert index.final_video("ancient")
+
+
+def test_byte_budget_evicts_intermediates_of_oldest_runs_first(index, tmp_path):
+    now = time.time()
+    for i in range(3):
+        make_run(index, tmp_path, f"r{i}", now - (3 - i) * 60)
+
+    # 3300 bytes in total; dropping two runs' intermediates (200) is enough.
+    stats = index.gc(RetentionPolicy(max_total_bytes=3100, keep_last=0))
+
+    assert stats == {"runs_expired": 0, "intermediate_bytes": 200, "final_bytes": 0}
+    assert not (tmp_path / "runs" / "r0" / "images" / "scene_1.jpg").exists()
+    assert (tmp_path / "runs" / "r2" / "images" / "scene_1.jpg").exists()
+    assert all(index.final_video(f"r{i}") for i in range(3))
+
+
+def test_byte_budget_evicts_finals_when_intermediates_are_not_enough(index, tmp_path):
+    now = time.time()
+    for i in range(2):
+        make_run(index, tmp_path, f"r{i}", now - (2 - i) * 60)
+
+    stats = index.gc(RetentionPolicy(max_total_bytes=1500, keep_last=0))
+
+    assert stats["final_bytes"] == 1000
+    assert index.get("r0")["status"] == "evicted"
+    assert index.final_video("r1")
+
+
+def test_stale_running_runs_are_marked_failed(index, tmp_path):
+    index.start_run("dead", tmp_path / "dead")
+    with index._connect() as db:
+        db.execute("UPDATE runs SET updated_at = 0 WHERE run_id = 'dead'")
+
+    index.gc(RetentionPolicy(keep_last=5))
+
+    assert index.get("dead")["status"] == "failed"
+
+
+def test_claim_run_leads_then_attaches_then_reuses(index, tmp_path):
+    key = request_key("The Fox and the Star", "fable", 1)
+    assert request_key("  the fox and the STAR!", "Fable", 1) == key
+
+    role, run = index.claim_run("r1", tmp_path / "r1", key, prompt="The Fox and the Star")
+    assert (role, run["run_id"]) == ("lead", "r1")
+
+    role, run = index.claim_run("r2", tmp_path / "r2", key)
+    assert (role, run["run_id"]) == ("attach", "r1")
+    assert index.get("r2") is None
+
+    (tmp_path / "r1" / "video").mkdir(parents=True)
+    (tmp_path / "r1" / "video" / "final_story.mp4").write_bytes(b"mp4")
+    index.finish_run("r1")
+    assert index.claim_run("r3", tmp_path / "r3", key)[0] == "reuse"
+    assert index.claim_run("r4", tmp_path / "r4", key, fresh=True)[0] == "lead"
+
+
+def test_claim_run_does_not_attach_to_dead_runs_or_reuse_missing_and_expired_videos(index, tmp_path):
+    key = request_key("A lantern festival")
+    index.claim_run("dead", tmp_path / "dead", key)
+    with index._connect() as db:
+        db.execute("UPDATE runs SET updated_at = ? WHERE run_id = 'dead'", (time.time() - HEARTBEAT_TIMEOUT_S - 1,))
+    assert index.claim_run("r1", tmp_path / "r1", key)[0] == "lead"
+
+    index.finish_run("r1")  # finished without a final video
+    assert index.claim_run("r2", tmp_path / "r2", key)[0] == "lead"
+
+    (tmp_path / "r2" / "video").mkdir(parents=True)
+    (tmp_path / "r2" / "video" / "final_story.mp4").write_bytes(b"mp4")
+    index.finish_run("r2")
+    assert index.claim_run("r3", tmp_path / "r3", key, ttl_s=0)[0] == "lead"
+
+
+def test_concurrent_identical_claims_elect_one_leader(index, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    key = request_key("The same story")
+    with ThreadPoolExecutor(8) as pool:
+        roles = list(pool.map(lambda i: index.claim_run(new_run_id(), tmp_path / str(i), key)[0], range(16)))
+
+    assert roles.count("lead") == 1 and roles.count("attach") == 15
+
+
+def test_claiming_an_existing_run_id_raises(index, tmp_path):
+    index.claim_run("r1", tmp_path / "r1", request_key("x"))
+
+    with pytest.raises(sqlite3.IntegrityError):
+        index.claim_run("r1", tmp_path / "r1", request_key("y"))
@@ -0,0 +1,118 @@
+import json
+import random
+import subprocess
+
+import pytest
+
+from utils.speech_duration import (DurationModel, PRIOR, VOICE_FILE, backfill, features, holdout_errors,
+                                   mp3_duration, syllables)
+
+
+def encode(path, seconds, *args, sample_rate=44100):
+    ffmpeg = pytest.importorskip("imageio_ffmpeg").get_ffmpeg_exe()
+    subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=duration={seconds}",
+                    "-ar", str(sample_rate), "-ac", "1", *args, str(path)], check=True)
+    return path
+
+
+@pytest.mark.parametrize("args", [
+    ("-b:a", "64k"),                                   # CBR with a gapless Info tag
+    ("-q:a", "4"),                                     # VBR with a Xing tag
+    ("-b:a", "128k", "-write_xing", "0"),              # no tag: encoder delay stays in
+    ("-b:a", "64k", "-id3v2_version", "3", "-metadata", "title=Story"),  # ID3 header first
+])
+def test_mp3_duration(tmp_path, args):
+    path = encode(tmp_path / "a.mp3", 3.0, *args)
+
+    tolerance = 0.06 if "-write_xing" in args else 0.001
+    assert mp3_duration(path) == pytest.approx(3.0, abs=tolerance)
+
+
+def test_mp3_duration_of_mpeg2_audio(tmp_path):
+    path = encode(tmp_path / "a.mp3", 2.0, "-b:a", "32k", sample_rate=22050)
+
+    assert mp3_duration(path) == pytest.approx(2.0, abs=0.001)
+
+
+def test_syllables_and_features():
+    assert [syllables(w) for w in ("fox", "shining", "little", "the", "horizon")] == [1, 2, 2, 1, 3]
+    # bias, syllables, words, sentence pauses, clause pauses, digits
+    assert features("In 1947, the fox ran. It stopped!") == [1.0, 7.0, 6.0, 2.0, 1.0, 4.0]
+
+
+def test_empty_model_uses_the_prior():
+    model = DurationModel(history_file=None)
+    text = "The fox ran home."
+
+    assert model.predict(text) == pytest.approx(sum(c * x for c, x in zip(PRIOR, features(text))))
+    assert model.predict("   ") == 0.0
+
+
+def test_fit_recovers_a_voice_from_its_history():
+    rng = random.Random(1)
+    words = "the fox ran over quiet hills toward a bright star shining above old river".split()
+    true = [0.3, 0.18, 0.12, 0.4, 0.2, 0.0]  # a slower voice than the prior
+    model = DurationModel(history_file=None)
+    for _ in range(200):
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(5, 30))) + rng.choice([".", ", and more."])
+        model.observe(text, "slow", sum(c * x for c, x in zip(true, features(text))) * rng.uniform(0.97, 1.03))
+
+    text = "The fox ran over the quiet hills, toward a bright star."
+    expected = sum(c * x for c, x in zip(true, features(text)))
+    assert model.samples("slow") == 200
+    assert model.predict(text, "slow") == pytest.approx(expected, rel=0.05)
+    assert model.predict(text, "unseen-voice") == pytest.approx(expected, rel=0.05)  # pooled fit
+
+
+def test_history_round_trip_and_source_dedupe(tmp_path):
+    history = tmp_path / "history.jsonl"
+    model = DurationModel.load(history)
+
+    assert model.observe("The fox ran.", "v", 1.5, source="run/scene_1:aa")
+    assert not model.observe("The fox ran.", "v", 1.5, source="run/scene_1:aa")
+    history.write_text(history.read_text(encoding="utf-8") + '{"text": "torn', encoding="utf-8")
+
+    reloaded = DurationModel.load(history)
+    assert reloaded.samples("v") == 1
+    assert not reloaded.observe("The fox ran.", "v", 1.5, source="run/scene_1:aa")
+
+
+def make_run(root, name, voice=None, seconds=(2.0, 3.0)):
+    run = root / "generated_videos" / name
+    (run / "script").mkdir(parents=True)
+    (run / "audio_segments").mkdir()
+    scenes = [{"scene_number": i, "narration": f"Scene {i} of {name}: the fox walks on."} for i in (1, 2)]
+    (run / "script" / "story.json").write_text(json.dumps(scenes), encoding="utf-8")
+    for i, s in zip((1, 2), seconds):
+        encode(run / "audio_segments" / f"scene_{i}.mp3", s, "-b:a", "64k")
+    if voice:
+        (run / "audio_segments" / VOICE_FILE).write_text(voice, encoding="utf-8")
+
+
+def test_backfill_is_idempotent_and_needs_a_real_voice(tmp_path):
+    make_run(tmp_path, "a", voice="euron:playai-tts")
+    make_run(tmp_path, "b")  # made before voices were recorded
+    make_run(tmp_path, "c", voice="local:tone")
+    history = tmp_path / "history.jsonl"
+
+    assert backfill(tmp_path, DurationModel.load(history)) == 2
+    assert backfill(tmp_path, DurationModel.load(history)) == 0
+
+    rows = [json.loads(line) for line in history.read_text(encoding="utf-8").splitlines()]
+    assert {row["voice"] for row in rows} == {"euron:playai-tts"}
+    assert sorted(row["seconds"] for row in rows) == [2.0, 3.0]
+
+
+def test_holdout_errors_score_each_row_before_it_is_fitted(tmp_path):
+    history = tmp_path / "history.jsonl"
+    model = DurationModel.load(history)
+    for i in range(20):
+        text = " ".join(["word"] * (5 + i)) + "."
+        model.observe(text, "v", 0.5 * (5 + i))
+
+    errors = holdout_errors(history)
+
+    n, mape = errors["v"]
+    assert n == 20 and errors["*"][0] == 20
+    assert 0 < mape < 0.2
+    assert holdout_errors(tmp_path / "missing.jsonl") == {}
@@ -0,0 +1,79 @@
+import itertools
+import random
+
+import pytest
+
+from utils.text_splitter import (_balanced_boundaries, _segment_cost, iter_scenes, segment_scenes,
+                                 split_script_into_scenes, split_sentences)
+
+
+def cost(durations, ends, target, min_s):
+    starts = [0] + ends[:-1]
+    return sum(_segment_cost(sum(durations[s:e]), target, min_s) for s, e in zip(starts, ends))
+
+
+def brute_force(durations, target, min_s, max_s):
+    n, best = len(durations), None
+    for cuts in itertools.product((False, True), repeat=n - 1):
+        ends = [i + 1 for i, cut in enumerate(cuts) if cut] + [n]
+        starts = [0] + ends[:-1]
+        if any(e - s > 1 and sum(durations[s:e]) > max_s for s, e in zip(starts, ends)):
+            continue
+        c = cost(durations, ends, target, min_s)
+        if best is None or c < best:
+            best = c
+    return best
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_dp_finds_the_optimal_partition(seed):
+    rng = random.Random(seed)
+    durations = [rng.uniform(1, 12) for _ in range(rng.randint(1, 11))]
+
+    ends = _balanced_boundaries(durations, target=20, min_s=8, max_s=30)
+
+    assert ends[-1] == len(durations) and ends == sorted(set(ends))
+    assert cost(durations, ends, 20, 8) == pytest.approx(brute_force(durations, 20, 8, 30))
+
+
+def test_a_sentence_longer_than_max_is_its_own_scene():
+    assert _balanced_boundaries([5, 40, 5], target=20, min_s=8, max_s=30) == [1, 2, 3]
+
+
+def test_streaming_segmentation_keeps_every_sentence_in_order():
+    rng = random.Random(3)
+    sentences = [" ".join(["word"] * rng.randint(3, 25)) + f" {i}." for i in range(400)]
+    script = " ".join(sentences)
+    # Arbitrary chunk boundaries, including mid-sentence.
+    cuts = sorted(rng.sample(range(1, len(script)), 50))
+    chunks = [script[a:b] for a, b in zip([0] + cuts, cuts + [len(script)])]
+
+    scenes = list(iter_scenes(chunks, target_s=20, min_s=8, max_s=30, duration_fn=lambda s: len(s.split()) / 2.5))
+
+    assert " ".join(scenes) == script
+    assert all(len(scene.split()) / 2.5 <= 30 or scene.count(".") == 1 for scene in scenes)
+
+
+def test_segment_scenes_balances_spoken_length():
+    script = " ".join(f"The fox walked past tree number {i} and kept going." for i in range(30))
+
+    scenes = segment_scenes(script, target_s=20, min_s=8, max_s=30)
+
+    assert " ".join(scenes) == script
+    lengths = [len(s.split()) for s in scenes]
+    assert max(lengths) - min(lengths) <= 10
+
+
+def test_split_script_into_scenes_respects_max_chars():
+    script = "\n".join(f"Sentence number {i} is here." for i in range(50))
+
+    scenes = split_script_into_scenes(script, max_chars=120)
+
+    assert " ".join(scenes) == " ".join(script.split())
+    assert all(len(scene) <= 120 for scene in scenes)
+    assert split_script_into_scenes("") == []
+
+
+def test_split_sentences_merges_short_fragments():
+    assert split_sentences("Hi. Then the fox ran far away. Ok.", min_chars=10) == ["Hi. Then the fox ran far away. Ok."]
+    assert split_sentences("The fox ran. The star shone.") == ["The fox ran.", "The star shone."]
@@ -0,0 +1,135 @@
+import json
+import subprocess
+
+import pytest
+
+from utils.timeline import DURATIONS_FILE, RenderPlan, Timeline, TimelineError, diff, run_timeline
+
+
+def timeline(durations, fade=0.0, music=None):
+    tl = Timeline()
+    for i, d in enumerate(durations, 1):
+        tl.add_scene(i, f"scene_{i}.jpg", f"scene_{i}.mp3", d, caption=f"caption {i}")
+    if music:
+        tl.add_layer(music, 0.15)
+    return tl.crossfade(fade)
+
+
+def test_scene_bounds_round_cumulative_times_without_drift():
+    plan = timeline([1 / 3] * 30).compile(fps=24)
+
+    assert plan.total_frames == 240
+    assert [plan.frame_count(i) for i in range(3)] == [8, 8, 8]
+    assert all(7 <= plan.frame_count(i) <= 9 for i in range(30))
+    assert plan.duration == pytest.approx(10.0)
+
+
+def test_scene_at_and_samples():
+    plan = timeline([1.0, 2.0, 0.5]).compile(fps=10)
+
+    assert [plan.scene_at(f) for f in (0, 9, 10, 29, 30, 34)] == [0, 0, 1, 1, 2, 2]
+    assert plan.frames(1) == range(10, 30)
+    assert plan.samples(1, 8000) == (8000, 24000)
+    with pytest.raises(IndexError):
+        plan.scene_at(35)
+
+
+def test_fades_go_through_black_between_scenes_only():
+    plan = timeline([2.0, 2.0], fade=0.5).compile(fps=10)
+
+    assert plan.gain(0, 0) == 1.0  # no fade into the first scene
+    assert plan.gain(0, 19) == pytest.approx(1 / 5)
+    assert plan.gain(1, 0) == 0.0
+    assert plan.gain(1, 2) == pytest.approx(2 / 5)
+    assert plan.gain(1, 19) == 1.0  # nor out of the last
+
+
+def test_compile_reports_every_problem():
+    tl = timeline([1.0, 0.0])
+    tl.add_scene(1, "", "x.mp3", float("nan"))
+
+    with pytest.raises(TimelineError) as e:
+        tl.compile(fps=0)
+    assert len(e.value.problems) == 5
+
+
+def test_plan_round_trips_through_dict():
+    plan = timeline([1.0, 2.5], fade=0.5, music="music.mp3").compile(fps=24)
+
+    again = RenderPlan.from_dict(json.loads(json.dumps(plan.to_dict())))
+
+    assert diff(plan, again) == {"spans": [], "scenes": [], "removed": [], "audio": False}
+    assert list(again.bounds) == list(plan.bounds)
+
+
+def test_diff_of_a_changed_duration_covers_that_scene_and_the_shifted_ones():
+    old = timeline([2.0, 2.0, 2.0, 2.0]).compile(fps=10)
+    new = timeline([2.0, 3.0, 2.0, 2.0]).compile(fps=10)
+
+    changes = diff(old, new)
+
+    assert changes["scenes"] == [2, 3, 4]
+    assert changes["spans"] == [[20, 90]]
+    assert changes["audio"] is True
+
+
+def test_diff_of_a_new_image_is_picture_only():
+    old_tl, new_tl = timeline([2.0, 2.0, 2.0]), timeline([2.0, 2.0, 2.0])
+    new_tl.scenes[1].image = "scene_2_v2.jpg"
+
+    changes = diff(old_tl.compile(10), new_tl.compile(10))
+
+    assert changes == {"spans": [[20, 40]], "scenes": [2], "removed": [], "audio": False}
+
+
+def test_diff_reports_removed_scenes_layers_and_fps_changes():
+    old = timeline([2.0, 2.0, 2.0]).compile(fps=10)
+
+    assert diff(old, timeline([2.0, 2.0]).compile(fps=10))["removed"] == [3]
+    assert diff(old, timeline([2.0, 2.0, 2.0], music="m.mp3").compile(fps=10)) == {
+        "spans": [], "scenes": [], "removed": [], "audio": True}
+    assert diff(old, timeline([2.0, 2.0, 2.0]).compile(fps=12))["spans"] == [[0, 72]]
+    assert diff(None, old)["scenes"] == [1, 2, 3]
+
+
+@pytest.fixture
+def run_dir(tmp_path):
+    """A run with two scenes of 1 s and 2 s narration, and a durations manifest."""
+    ffmpeg = pytest.importorskip("imageio_ffmpeg").get_ffmpeg_exe()
+    (tmp_path / "images").mkdir()
+    (tmp_path / "audio_segments").mkdir()
+    manifest = {}
+    for n, seconds in ((1, 1.0), (2, 2.0)):
+        (tmp_path / "images" / f"scene_{n}.jpg").write_bytes(b"jpg")
+        mp3 = tmp_path / "audio_segments" / f"scene_{n}.mp3"
+        subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=duration={seconds}",
+                        "-ac", "1", "-b:a", "64k", str(mp3)], check=True)
+        manifest[n] = {"seconds": seconds, "size": mp3.stat().st_size}
+    (tmp_path / "audio_segments" / DURATIONS_FILE).write_text(json.dumps(manifest), encoding="utf-8")
+    return tmp_path
+
+
+def test_run_timeline_uses_the_manifest_only_for_unchanged_clips(run_dir):
+    from utils.artifact_store import RunArtifacts
+
+    manifest = json.loads((run_dir / "audio_segments" / DURATIONS_FILE).read_text(encoding="utf-8"))
+    manifest["1"]["seconds"] = 1.5  # distinguishable from the clip's measured 1.0 s
+    manifest["2"]["seconds"] = 2.5
+    (run_dir / "audio_segments" / DURATIONS_FILE).write_text(json.dumps(manifest), encoding="utf-8")
+    # Scene 2 was re-synthesized after the manifest was written.
+    (run_dir / "audio_segments" / "scene_2.mp3").write_bytes(
+        (run_dir / "audio_segments" / "scene_1.mp3").read_bytes())
+
+    tl = run_timeline(RunArtifacts(run_dir), fade=0.0)
+
+    assert [s.duration for s in tl.scenes] == [1.5, pytest.approx(1.0, abs=0.001)]
+
+
+def test_run_timeline_measures_clips_of_old_manifests(run_dir):
+    from utils.artifact_store import RunArtifacts
+
+    (run_dir / "audio_segments" / DURATIONS_FILE).write_text(json.dumps({"1": 9.0, "2": 9.0}), encoding="utf-8")
+
+    tl = run_timeline(RunArtifacts(run_dir), fade=0.0)
+
+    assert [round(s.duration, 3) for s in tl.scenes] == [1.0, 2.0]
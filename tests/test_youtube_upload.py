@@ -0,0 +1,151 @@
+import json
+import os
+import sys
+import types
+
+import pytest
+
+from agents import youtube_agent
+from agents.youtube_agent import CHUNK_UNIT, ResumableUpload, SESSION_FILE, RESULT_FILE, _committed_offset
+
+
+class Response:
+    def __init__(self, status_code, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(body).encode() if body is not None else b""
+        self.text = self.content.decode()
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeUploadServer:
+    """The resumable-upload protocol with knobs for partial commits and failures."""
+
+    def __init__(self):
+        self.sessions = {}
+        self.puts = []  # Content-Range of every PUT
+        self.keep_at_most = None  # bytes of a chunk the server persists
+        self.fail_next = []  # status codes to answer the next PUTs with
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        uri = f"https://upload.test/session/{len(self.sessions)}"
+        self.sessions[uri] = {"total": int(headers["X-Upload-Content-Length"]), "data": b""}
+        return Response(200, {"Location": uri})
+
+    def put(self, url, data=None, headers=None, timeout=None, allow_redirects=True):
+        session = self.sessions.get(url)
+        if session is None:
+            return Response(404)
+        content_range = headers["Content-Range"]
+        self.puts.append(content_range)
+        if self.fail_next:
+            return Response(self.fail_next.pop(0))
+        if not content_range.startswith("bytes */"):
+            start = int(content_range.split()[1].split("-")[0])
+            assert start == len(session["data"]), "chunk does not continue at the committed offset"
+            session["data"] += data[:self.keep_at_most] if self.keep_at_most else data
+        if len(session["data"]) == session["total"]:
+            return Response(200, body={"id": "vid123", "bytes": len(session["data"])})
+        committed = len(session["data"])
+        return Response(308, {"Range": f"bytes=0-{committed - 1}"} if committed else {})
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeUploadServer()
+    monkeypatch.setitem(sys.modules, "requests", types.SimpleNamespace(post=server.post, put=server.put))
+    monkeypatch.setattr(youtube_agent, "access_token", lambda force_refresh=False: "token")
+    monkeypatch.setattr(youtube_agent, "_backoff", lambda attempt: None)
+    return server
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "run" / "video" / "final_story.mp4"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(os.urandom(3 * CHUNK_UNIT + 1000))
+    return path
+
+
+def upload(video, chunk_size=CHUNK_UNIT):
+    return ResumableUpload(video, video.parent.parent / "upload", {"snippet": {}}, chunk_size)
+
+
+def uploaded(server):
+    (session,) = server.sessions.values()
+    return session["data"]
+
+
+def test_committed_offset_is_one_past_the_range_end():
+    assert _committed_offset(Response(308, {"Range": "bytes=0-262143"})) == CHUNK_UNIT
+    assert _committed_offset(Response(308)) == 0
+
+
+def test_chunks_are_rounded_to_the_chunk_unit(video):
+    assert upload(video, CHUNK_UNIT + 5).chunk_size == CHUNK_UNIT
+    assert upload(video, 1).chunk_size == CHUNK_UNIT
+
+
+def test_upload_sends_consecutive_ranges(server, video):
+    result = upload(video).run()
+
+    total = video.stat().st_size
+    assert result["id"] == "vid123"
+    assert uploaded(server) == video.read_bytes()
+    assert server.puts == [f"bytes {i * CHUNK_UNIT}-{min(total, (i + 1) * CHUNK_UNIT) - 1}/{total}" for i in range(4)]
+    assert (video.parent.parent / "upload" / RESULT_FILE).exists()
+    assert not (video.parent.parent / "upload" / SESSION_FILE).exists()
+
+
+def test_partial_commits_continue_from_the_server_offset(server, video):
+    server.keep_at_most = 100_000  # less than a chunk: the client must resend the rest
+
+    upload(video).run()
+
+    assert uploaded(server) == video.read_bytes()
+    assert server.puts[1].startswith("bytes 100000-")
+
+
+def test_errors_query_the_offset_and_resume(server, video):
+    server.fail_next = [503]
+
+    upload(video).run()
+
+    assert uploaded(server) == video.read_bytes()
+    assert server.puts[1].startswith("bytes */")  # asked how much arrived before continuing
+
+
+def test_restarted_process_resumes_the_saved_session(server, video):
+    server.fail_next = [503] * 100  # the server is down until this process gives up
+    with pytest.raises(youtube_agent.UploadError):
+        upload(video).run()
+    server.fail_next = []
+    (uri,) = server.sessions
+    server.sessions[uri]["data"] = video.read_bytes()[:2 * CHUNK_UNIT]  # what arrived before the crash
+    server.puts.clear()
+
+    upload(video).run()
+
+    assert len(server.sessions) == 1
+    assert server.puts[0] == f"bytes */{video.stat().st_size}"
+    assert server.puts[1].startswith(f"bytes {2 * CHUNK_UNIT}-")
+    assert uploaded(server) == video.read_bytes()
+
+
+def test_a_re_rendered_video_starts_a_new_session(server, video):
+    server.fail_next = [503] * 100
+    with pytest.raises(youtube_agent.UploadError):
+        upload(video).run()
+    server.fail_next = []
+    video.write_bytes(os.urandom(CHUNK_UNIT + 10))
+
+    upload(video).run()
+
+    assert len(server.sessions) == 2
+    assert list(server.sessions.values())[1]["data"] == video.read_bytes()
@@ -0,0 +1,513 @@
+# utils/artifact_store.py
+"""
+Artifact store for run outputs (scripts, narration, images, videos).
+
+Agents address artifacts by run, stage and name instead of globbing a shared directory,
+so stages can run on different machines. Keys are ``<run_id>/<stage>/<name>``, e.g.
+``20261019-094342/images/scene_3.jpg`` (a stage may be nested: ``variants/hi/audio_segments``).
+
+    ARTIFACT_STORE=                    # default: the run directories themselves (output/generated_videos)
+    ARTIFACT_STORE=/mnt/shared/runs    # another local/shared directory
+    ARTIFACT_STORE=s3://bucket/prefix  # S3-compatible; ARTIFACT_S3_ENDPOINT for MinIO, R2 or the
+                                       # stand-in in benchmarks/mock_api_server.py
+    ARTIFACT_CACHE_DIR=output/cache/artifacts   # read-through cache for remote stores
+
+Credentials come from AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY (AWS_REGION, default
+us-east-1). Requests are signed with SigV4 over ``requests``, so no SDK is needed.
+
+Agents still work on local files (ffmpeg needs paths): ``RunArtifacts`` writes into the
+run's working directory and publishes to the store, and ``fetch`` returns a local path,
+which for a remote store is a cached copy validated by ETag, so repeated reads of an
+unchanged object never download it again. Large files are uploaded as multipart
+streams, one part in memory at a time.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import quote, unquote, urlsplit
+
+from utils.log_utils import span
+
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "output/cache/artifacts")
+# S3 multipart parts must be >= 5 MiB except the last one.
+MIN_PART_SIZE = 5 * 1024 * 1024
+PART_SIZE = max(MIN_PART_SIZE, int(float(os.getenv("ARTIFACT_PART_MB", "8")) * 1024 * 1024))
+STREAM_CHUNK = 1024 * 1024
+MAX_ATTEMPTS = 4
+TIMEOUT = 120
+
+
+def _atomic_write(path: Path, chunks):
+    """Write ``chunks`` to a temp file next to ``path`` and move it into place."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _file_chunks(path, chunk_size=STREAM_CHUNK):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+class ArtifactStore:
+    """Interface shared by the backends; keys are ``<run_id>/<stage>/<name>``."""
+
+    def put(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    def put_file(self, key: str, path):
+        """Store the file at ``path`` under ``key``, streamed rather than read whole."""
+        raise NotImplementedError
+
+    @contextmanager
+    def writer(self, key: str):
+        """File-like object for streaming writes; the object appears when the block exits cleanly."""
+        raise NotImplementedError
+        yield
+
+    def get(self, key: str) -> bytes:
+        return self.local_path(key).read_bytes()
+
+    def stream(self, key: str, chunk_size: int = STREAM_CHUNK):
+        """Iterate over the object's bytes in chunks."""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Path:
+        """A local file with the object's content; raises FileNotFoundError if there is none."""
+        raise NotImplementedError
+
+    def list_run(self, run_id: str, stage: str = "") -> list:
+        """Every key under ``run_id`` (and ``stage``), sorted."""
+        raise NotImplementedError
+
+
+class LocalStore(ArtifactStore):
+    """Objects are plain files under ``root``; the default store, with zero-copy reads."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def __repr__(self):
+        return f"LocalStore({str(self.root)!r})"
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    def put(self, key, data):
+        _atomic_write(self.path(key), [data])
+
+    def put_file(self, key, path):
+        dest = self.path(key)
+        if dest.exists() and os.path.samefile(dest, path):
+            return  # written in place by the agent
+        _atomic_write(dest, _file_chunks(path))
+
+    @contextmanager
+    def writer(self, key):
+        dest = self.path(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                yield f
+            os.replace(tmp, dest)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def stream(self, key, chunk_size=STREAM_CHUNK):
+        return _file_chunks(self.local_path(key), chunk_size)
+
+    def exists(self, key):
+        return self.path(key).is_file()
+
+    def local_path(self, key):
+        path = self.path(key)
+        if not path.is_file():
+            raise FileNotFoundError(f"Artifact not found: {path}")
+        return path
+
+    def list_run(self, run_id, stage=""):
+        base = self.root / run_id / stage if stage else self.root / run_id
+        if not base.is_dir():
+            return []
+        return sorted(p.relative_to(self.root).as_posix() for p in base.rglob("*")
+                      if p.is_file() and not p.name.startswith("."))
+
+
+class S3Store(ArtifactStore):
+    """S3-compatible object store with multipart uploads and an ETag-validated read-through cache."""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint: str = None, region: str = None,
+                 access_key: str = None, secret_key: str = None, cache_dir=ARTIFACT_CACHE_DIR,
+                 part_size: int = PART_SIZE):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.region = region or os.getenv("AWS_REGION") or os.getenv("AWS_DEFAULT_REGION") or "us-east-1"
+        self.access_key = access_key or os.getenv("AWS_ACCESS_KEY_ID", "")
+        self.secret_key = secret_key or os.getenv("AWS_SECRET_ACCESS_KEY", "")
+        endpoint = endpoint or os.getenv("ARTIFACT_S3_ENDPOINT")
+        if endpoint:
+            # Path-style addressing: what MinIO, R2 and local stand-ins expect.
+            parts = urlsplit(endpoint)
+            self._base, self._host = f"{parts.scheme}://{parts.netloc}", parts.netloc
+            self._bucket_path = f"{parts.path.rstrip('/')}/{bucket}"
+        else:
+            self._host = f"{bucket}.s3.{self.region}.amazonaws.com"
+            self._base, self._bucket_path = f"https://{self._host}", ""
+        self.cache_dir = Path(cache_dir) / bucket / self.prefix if cache_dir else None
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self._local = threading.local()
+
+    def __repr__(self):
+        return f"S3Store('s3://{self.bucket}/{self.prefix}', endpoint={self._base + self._bucket_path!r})"
+
+    # --- HTTP ---
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+        return session
+
+    def _object_path(self, key: str = "") -> str:
+        name = f"{self.prefix}/{key}" if self.prefix and key else key or ""
+        return f"{self._bucket_path}/{quote(name, safe='/~')}"
+
+    def _signed_headers(self, method: str, path: str, query: str, payload_hash: str) -> dict:
+        """SigV4 ``Authorization`` for one request (host, x-amz-date and payload hash signed)."""
+        # Imported here, like requests: every agent imports this module, few talk to S3.
+        import hmac
+        import hashlib
+        from datetime import datetime, timezone
+
+        now = datetime.now(timezone.utc)
+        amz_date, day = now.strftime("%Y%m%dT%H%M%SZ"), now.strftime("%Y%m%d")
+        headers = {"host": self._host, "x-amz-content-sha256": payload_hash, "x-amz-date": amz_date}
+        signed = ";".join(sorted(headers))
+        canonical = "\n".join([method, path, query, "".join(f"{k}:{headers[k]}\n" for k in sorted(headers)),
+                               signed, payload_hash])
+        scope = f"{day}/{self.region}/s3/aws4_request"
+        to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical.encode()).hexdigest()])
+        key = ("AWS4" + self.secret_key).encode()
+        for part in (day, self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, to_sign.encode(), hashlib.sha256).hexdigest()
+        del headers["host"]
+        headers["Authorization"] = (f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                                    f"SignedHeaders={signed}, Signature={signature}")
+        return headers
+
+    def _request(self, method: str, key: str = "", params: dict = None, data: bytes = b"",
+                 stream: bool = False, ok=(200,)):
+        """Signed request, retried on connection errors and 5xx; returns the response or raises."""
+        import hashlib
+        import requests
+
+        path = self._object_path(key)
+        query = "&".join(f"{quote(str(k), safe='~')}={quote(str(v), safe='~')}"
+                         for k, v in sorted((params or {}).items()))
+        url = f"{self._base}{path}" + (f"?{query}" if query else "")
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            headers = self._signed_headers(method, path, query, hashlib.sha256(data).hexdigest())
+            try:
+                r = self._session().request(method, url, data=data or None, headers=headers,
+                                            stream=stream, timeout=TIMEOUT)
+            except requests.ConnectionError:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+            else:
+                if r.status_code in ok:
+                    return r
+                if r.status_code == 404:
+                    raise FileNotFoundError(f"Artifact not found: s3://{self.bucket}/{unquote(path[len(self._bucket_path) + 1:])}")
+                if r.status_code < 500 or attempt == MAX_ATTEMPTS:
+                    raise RuntimeError(f"S3 {method} {path} failed ({r.status_code}): {r.text[:200]}")
+            time.sleep(0.5 * 2 ** (attempt - 1))
+
+    # --- writes ---
+
+    def put(self, key, data):
+        with span("artifact_put", stage="artifacts", key=key, bytes=len(data)):
+            r = self._request("PUT", key, data=data)
+        return r.headers.get("ETag", "")
+
+    @contextmanager
+    def writer(self, key):
+        upload = _MultipartUpload(self, key)
+        try:
+            yield upload
+            upload.close()
+        except BaseException:
+            upload.abort()
+            raise
+
+    def put_file(self, key, path):
+        path = Path(path)
+        size = path.stat().st_size
+        with span("artifact_put", stage="artifacts", key=key, bytes=size) as sp:
+            if size <= self.part_size:
+                etag = self._request("PUT", key, data=path.read_bytes()).headers.get("ETag", "")
+            else:
+                with self.writer(key) as w:
+                    for chunk in _file_chunks(path, self.part_size):
+                        w.write(chunk)
+                etag = w.etag
+                sp.set(parts=w.parts_sent)
+        self._remember(key, path, etag)
+
+    # --- reads ---
+
+    def _cache_path(self, key: str):
+        return self.cache_dir / key if self.cache_dir else None
+
+    def _cached_etag(self, cached: Path) -> str:
+        marker = cached.with_name(cached.name + ".etag")
+        return marker.read_text(encoding="utf-8") if cached.is_file() and marker.is_file() else None
+
+    def _remember(self, key: str, path: Path, etag: str):
+        """Seed the cache with a file just uploaded from here, so reading it back costs no download."""
+        cached = self._cache_path(key)
+        if cached is None or not etag:
+            return
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            # A copy, not a link: ffmpeg re-renders overwrite the working file in place.
+            _atomic_write(cached, _file_chunks(path))
+            cached.with_name(cached.name + ".etag").write_text(etag, encoding="utf-8")
+        except OSError:
+            pass
+
+    def head(self, key: str) -> dict:
+        r = self._request("HEAD", key)
+        return {"etag": r.headers.get("ETag", ""), "size": int(r.headers.get("Content-Length") or 0)}
+
+    def exists(self, key):
+        try:
+            self.head(key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _stream_through(self, key, chunk_size=STREAM_CHUNK):
+        """Stream the object from the store, teeing it into the cache when one is configured."""
+        from utils.metrics import record_cache
+
+        record_cache("artifact", False)
+        r = self._request("GET", key, stream=True)
+        cached = self._cache_path(key)
+        if cached is None:
+            yield from r.iter_content(chunk_size)
+            return
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_name(f".{cached.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in r.iter_content(chunk_size):
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp, cached)
+            cached.with_name(cached.name + ".etag").write_text(r.headers.get("ETag", ""), encoding="utf-8")
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def _fresh_cache(self, key):
+        """The cached copy if its ETag still matches the object's (one HEAD, no body)."""
+        cached = self._cache_path(key)
+        known = self._cached_etag(cached) if cached is not None else None
+        if known is None:
+            return None
+        if self.head(key)["etag"] != known:
+            return None
+        from utils.metrics import record_cache
+        record_cache("artifact", True)
+        return cached
+
+    def stream(self, key, chunk_size=STREAM_CHUNK):
+        cached = self._fresh_cache(key)
+        if cached is not None:
+            return _file_chunks(cached, chunk_size)
+        return self._stream_through(key, chunk_size)
+
+    def local_path(self, key):
+        cached = self._fresh_cache(key)
+        if cached is not None:
+            return cached
+        if self.cache_dir is None:
+            raise ValueError("S3Store.local_path needs a cache_dir")
+        with span("artifact_get", stage="artifacts", key=key) as sp:
+            received = sum(len(chunk) for chunk in self._stream_through(key))
+            sp.set(bytes=received)
+        return self._cache_path(key)
+
+    def list_run(self, run_id, stage=""):
+        import xml.etree.ElementTree as ET
+
+        prefix = "/".join(p for p in (self.prefix, run_id, stage) if p) + "/"
+        keys, token = [], None
+        while True:
+            params = {"list-type": "2", "prefix": prefix}
+            if token:
+                params["continuation-token"] = token
+            root = ET.fromstring(self._request("GET", params=params).content)
+            ns = root.tag[:root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+            for item in root.iter(f"{ns}Contents"):
+                keys.append(item.findtext(f"{ns}Key")[len(self.prefix) + 1 if self.prefix else 0:])
+            token = root.findtext(f"{ns}NextContinuationToken")
+            if root.findtext(f"{ns}IsTruncated") != "true" or not token:
+                return sorted(keys)
+
+
+class _MultipartUpload:
+    """Write target for ``S3Store.writer``: buffers one part, uploads it, keeps the part ETags."""
+
+    def __init__(self, store: S3Store, key: str):
+        self.store, self.key = store, key
+        self.upload_id = None
+        self.parts = []
+        self.parts_sent = 0
+        self.etag = ""
+        self._buffer = bytearray()
+
+    def write(self, data: bytes):
+        self._buffer += data
+        while len(self._buffer) >= self.store.part_size:
+            part = bytes(self._buffer[:self.store.part_size])
+            del self._buffer[:self.store.part_size]
+            self._send(part)
+        return len(data)
+
+    def _send(self, part: bytes):
+        if self.upload_id is None:
+            import xml.etree.ElementTree as ET
+            root = ET.fromstring(self.store._request("POST", self.key, params={"uploads": ""}).content)
+            self.upload_id = next(el.text for el in root.iter() if el.tag.endswith("UploadId"))
+        number = len(self.parts) + 1
+        r = self.store._request("PUT", self.key, params={"partNumber": number, "uploadId": self.upload_id},
+                                data=part)
+        self.parts.append((number, r.headers.get("ETag", "")))
+        self.parts_sent += 1
+
+    def close(self):
+        if self.upload_id is None:
+            # Small enough for a single PUT.
+            self.etag = self.store._request("PUT", self.key, data=bytes(self._buffer)).headers.get("ETag", "")
+            return
+        if self._buffer:
+            self._send(bytes(self._buffer))
+            self._buffer.clear()
+        body = "<CompleteMultipartUpload>" + "".join(
+            f"<Part><PartNumber>{n}</PartNumber><ETag>{etag}</ETag></Part>" for n, etag in self.parts
+        ) + "</CompleteMultipartUpload>"
+        r = self.store._request("POST", self.key, params={"uploadId": self.upload_id}, data=body.encode())
+        # S3 can report a failed completion inside a 200 response.
+        if b"<Error>" in r.content:
+            raise RuntimeError(f"Multipart upload of {self.key} failed: {r.text[:200]}")
+        import xml.etree.ElementTree as ET
+        self.etag = next((el.text for el in ET.fromstring(r.content).iter() if el.tag.endswith("ETag")), "")
+
+    def abort(self):
+        if self.upload_id is not None:
+            try:
+                self.store._request("DELETE", self.key, params={"uploadId": self.upload_id}, ok=(200, 204))
+            except Exception:
+                pass
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(local_root=None) -> ArtifactStore:
+    """
+    The store selected by ARTIFACT_STORE. Without it, artifacts live in ``local_root``
+    (the directory holding the run directories), i.e. exactly where agents write them.
+    """
+    spec = os.getenv("ARTIFACT_STORE", "").strip()
+    cache_key = (spec, str(local_root) if not spec else None)
+    with _stores_lock:
+        store = _stores.get(cache_key)
+        if store is None:
+            if spec.startswith("s3://"):
+                bucket, _, prefix = spec[len("s3://"):].partition("/")
+                store = S3Store(bucket, prefix)
+            elif spec:
+                store = LocalStore(spec[len("file://"):] if spec.startswith("file://") else spec)
+            else:
+                store = LocalStore(local_root or "output/generated_videos")
+            _stores[cache_key] = store
+    return store
+
+
+class RunArtifacts:
+    """
+    One run's artifacts by stage and name. ``base_output_dir`` is the working copy the
+    agent writes into; its name is the run id. ``scope`` nests stages, e.g. a language
+    variant's ``variants/hi/audio_segments``.
+    """
+
+    def __init__(self, base_output_dir, store: ArtifactStore = None, scope: str = ""):
+        self.base_dir = Path(base_output_dir)
+        self.run_id = self.base_dir.name
+        self.scope = scope.strip("/")
+        self.dir = self.base_dir / self.scope if self.scope else self.base_dir
+        self.store = store or get_store(self.base_dir.parent)
+
+    def scoped(self, scope: str) -> "RunArtifacts":
+        return RunArtifacts(self.base_dir, self.store, "/".join(p for p in (self.scope, scope) if p))
+
+    def key(self, stage: str, name: str = "") -> str:
+        return "/".join(p for p in (self.run_id, self.scope, stage, name) if p)
+
+    def path(self, stage: str, name: str) -> Path:
+        """Working-copy path for a new artifact (its directory is created)."""
+        path = self.dir / stage / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def save(self, stage: str, name: str, data) -> Path:
+        """Write ``data`` (bytes or str) to the working copy and publish it; returns the local path."""
+        path = self.path(stage, name)
+        _atomic_write(path, [data.encode("utf-8") if isinstance(data, str) else data])
+        self.publish(stage, path)
+        return path
+
+    def publish(self, stage: str, path) -> str:
+        """Publish a file the agent produced in the working copy; returns its key."""
+        key = self.key(stage, Path(path).name)
+        self.store.put_file(key, path)
+        return key
+
+    def fetch(self, stage: str, name: str) -> Path:
+        """Local path to an artifact, downloaded (and cached) if the store is remote."""
+        return self.store.local_path(self.key(stage, name))
+
+    def read_text(self, stage: str, name: str) -> str:
+        return self.fetch(stage, name).read_text(encoding="utf-8")
+
+    def exists(self, stage: str, name: str) -> bool:
+        return self.store.exists(self.key(stage, name))
+
+    def names(self, stage: str, pattern: str = "*") -> list:
+        """Names of the artifacts directly in ``stage`` matching ``pattern``."""
+        import fnmatch
+
+        prefix = self.key(stage) + "/"
+        keys = self.store.list_run(self.run_id, prefix[len(self.run_id) + 1:-1])
+        return sorted(n for n in (k[len(prefix):] for k in keys) if "/" not in n and fnmatch.fnmatch(n, pattern))
@@ -0,0 +1,108 @@
+# utils/audio_stitch.py
+"""
+PCM helpers for assembling narration from several TTS clips.
+
+Clips are decoded to mono int16 PCM with the bundled ffmpeg, trimmed of leading and
+trailing silence, joined with a fixed pause (or an overlap) and short fades so the
+seams are inaudible, and encoded back to mp3. The join reports the exact start/end of
+every clip in the result, which gives per-sentence timestamps for free; ``encoder_lead``
+measures how far the encoded file shifts them.
+"""
+
+import subprocess
+
+SAMPLE_RATE = 44100
+# Samples quieter than this (int16) count as silence when trimming clip edges.
+SILENCE_LEVEL = 300
+# Keep a few milliseconds of the original edge so consonants are not clipped.
+EDGE_MARGIN_S = 0.02
+
+
+def _ffmpeg():
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def decode_pcm(audio_bytes: bytes, sample_rate: int = SAMPLE_RATE):
+    """Decode any ffmpeg-readable audio to a mono int16 numpy array."""
+    import numpy as np
+
+    cmd = [_ffmpeg(), "-loglevel", "error", "-i", "pipe:0",
+           "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"]
+    out = subprocess.run(cmd, input=audio_bytes, capture_output=True, check=True).stdout
+    return np.frombuffer(out, dtype=np.int16)
+
+
+def encode_mp3(pcm, path, sample_rate: int = SAMPLE_RATE, bitrate: str = "128k"):
+    cmd = [_ffmpeg(), "-y", "-loglevel", "error", "-f", "s16le", "-ac", "1", "-ar", str(sample_rate),
+           "-i", "pipe:0", "-b:a", bitrate, str(path)]
+    subprocess.run(cmd, input=pcm.tobytes(), capture_output=True, check=True)
+
+
+def mp3_bytes(pcm, sample_rate: int = SAMPLE_RATE, bitrate: str = "128k") -> bytes:
+    """Like ``encode_mp3`` but returns the encoded bytes."""
+    cmd = [_ffmpeg(), "-loglevel", "error", "-f", "s16le", "-ac", "1", "-ar", str(sample_rate),
+           "-i", "pipe:0", "-b:a", bitrate, "-f", "mp3", "pipe:1"]
+    return subprocess.run(cmd, input=pcm.tobytes(), capture_output=True, check=True).stdout
+
+
+def encoder_lead(pcm, path, sample_rate: int = SAMPLE_RATE) -> float:
+    """
+    Seconds by which audio in the encoded file ``path`` starts later than in ``pcm``, as
+    the bundled decoder plays it: the mp3 encoder delay that a gapless (LAME/Info) tag did
+    not cancel. Found by aligning the first non-silent sample of both.
+    """
+    import numpy as np
+
+    with open(path, "rb") as f:
+        decoded = decode_pcm(f.read(), sample_rate)
+    loud = np.flatnonzero(np.abs(pcm.astype(np.int32)) > SILENCE_LEVEL)
+    loud_decoded = np.flatnonzero(np.abs(decoded.astype(np.int32)) > SILENCE_LEVEL)
+    if loud.size == 0 or loud_decoded.size == 0:
+        return 0.0
+    return (int(loud_decoded[0]) - int(loud[0])) / sample_rate
+
+
+def trim_silence(pcm, sample_rate: int = SAMPLE_RATE):
+    import numpy as np
+
+    loud = np.flatnonzero(np.abs(pcm.astype(np.int32)) > SILENCE_LEVEL)
+    if loud.size == 0:
+        return pcm[:0]
+    margin = int(EDGE_MARGIN_S * sample_rate)
+    return pcm[max(0, loud[0] - margin):loud[-1] + 1 + margin]
+
+
+def stitch(clips: list, pause_s: float = 0.25, crossfade_s: float = 0.015, sample_rate: int = SAMPLE_RATE):
+    """
+    Join PCM clips in order; return ``(pcm, [(start_s, end_s), ...])``.
+
+    With ``pause_s > 0`` every clip gets ``crossfade_s`` fade-in/out ramps and clips are
+    separated by ``pause_s`` of silence; with ``pause_s == 0`` neighbours overlap by
+    ``crossfade_s`` with a linear crossfade.
+    """
+    import numpy as np
+
+    fade = int(crossfade_s * sample_rate)
+    gap = np.zeros(int(pause_s * sample_rate), dtype=np.float32)
+    out = np.zeros(0, dtype=np.float32)
+    spans = []
+    for i, clip in enumerate(clips):
+        clip = clip.astype(np.float32)
+        n = min(fade, len(clip) // 2)
+        if i and pause_s <= 0 and n:
+            overlap = min(n, len(out))
+            ramp = np.linspace(0.0, 1.0, overlap, dtype=np.float32)
+            start = len(out) - overlap
+            out[start:] = out[start:] * (1.0 - ramp) + clip[:overlap] * ramp
+            out = np.concatenate([out, clip[overlap:]])
+        else:
+            if n:
+                clip[:n] *= np.linspace(0.0, 1.0, n, dtype=np.float32)
+                clip[-n:] *= np.linspace(1.0, 0.0, n, dtype=np.float32)
+            if i:
+                out = np.concatenate([out, gap])
+            start = len(out)
+            out = np.concatenate([out, clip])
+        spans.append((round(start / sample_rate, 3), round(len(out) / sample_rate, 3)))
+    return np.clip(out, -32768, 32767).astype(np.int16), spans
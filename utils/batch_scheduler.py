@@ -0,0 +1,167 @@
+# utils/batch_scheduler.py
+"""
+Priority scheduler for batch generation with shared resource limits.
+
+Every task declares what it holds while it runs, e.g. ``{"tts": 1, "cpu": 1}``
+for a TTS stage or ``{"cpu": 2}`` for a render. Resources are counted slots: provider
+concurrency (``llm``, ``tts``, ``image``) and a CPU budget. Whenever a slot frees
+up, the highest-priority ready task whose resources are all free is started, so
+one story's render overlaps the next story's TTS and image requests. A higher-priority
+task that is waiting for a resource reserves it: lower-priority tasks may use other
+resources meanwhile but never take that one, so big renders are not starved by a
+stream of small tasks.
+
+The scheduler also integrates busy slots over time; ``utilization()`` shows which
+resource bounded the batch.
+"""
+
+import time
+import threading
+import itertools
+
+PENDING, RUNNING, DONE, FAILED, SKIPPED = "pending", "running", "done", "failed", "skipped"
+
+
+class Task:
+    __slots__ = ("name", "fn", "resources", "priority", "after", "seq", "state", "result", "error",
+                 "ready_at", "start", "end", "info")
+
+    def __init__(self, name, fn, resources, priority, after, seq, info):
+        self.name = name
+        self.fn = fn
+        self.resources = resources
+        self.priority = priority
+        self.after = after
+        self.seq = seq
+        self.state = PENDING
+        self.result = self.error = None
+        self.ready_at = self.start = self.end = None
+        self.info = info
+
+    @property
+    def wait_s(self) -> float:
+        """Time spent ready but waiting for resources."""
+        return (self.start - self.ready_at) if self.start and self.ready_at else 0.0
+
+    @property
+    def run_s(self) -> float:
+        return (self.end - self.start) if self.end and self.start else 0.0
+
+
+class Scheduler:
+    def __init__(self, capacity: dict, on_event=None):
+        """``capacity``: slots per resource. ``on_event(event, task)`` is called on start/done/failed/skipped."""
+        self.capacity = {k: max(1, int(v)) for k, v in capacity.items()}
+        self.in_use = {k: 0 for k in self.capacity}
+        self.tasks = []
+        self.on_event = on_event
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._busy = {k: 0.0 for k in self.capacity}
+        self._last = None
+        self.started_at = self.finished_at = None
+
+    def add(self, name: str, fn, resources: dict = None, priority=0, after=(), **info) -> Task:
+        """
+        Queue ``fn()`` to run once every task in ``after`` is done. Lower ``priority``
+        values run first (ties in submission order). Safe to call while ``run()`` is active.
+        """
+        resources = {k: min(int(v), self.capacity[k]) for k, v in (resources or {}).items() if v}
+        unknown = set(resources) - set(self.capacity)
+        if unknown:
+            raise ValueError(f"Unknown resource(s) {sorted(unknown)}; known: {sorted(self.capacity)}")
+        with self._cond:
+            task = Task(name, fn, resources, priority, list(after), next(self._seq), info)
+            self.tasks.append(task)
+            self._cond.notify_all()
+        return task
+
+    # --- bookkeeping (caller holds the lock) ---
+
+    def _account(self):
+        now = time.monotonic()
+        if self._last is not None:
+            for k, n in self.in_use.items():
+                self._busy[k] += n * (now - self._last)
+        self._last = now
+
+    def _emit(self, event, task):
+        if self.on_event:
+            try:
+                self.on_event(event, task)
+            except Exception:
+                pass
+
+    def _fits(self, task) -> bool:
+        return all(self.in_use[k] + n <= self.capacity[k] for k, n in task.resources.items())
+
+    def _start_ready(self):
+        now = time.time()
+        ready = []
+        for task in self.tasks:
+            if task.state != PENDING:
+                continue
+            states = {dep.state for dep in task.after}
+            if states & {FAILED, SKIPPED}:
+                task.state, task.end = SKIPPED, now
+                self._emit("skipped", task)
+            elif states <= {DONE}:
+                task.ready_at = task.ready_at or now
+                ready.append(task)
+        reserved = set()
+        for task in sorted(ready, key=lambda t: (t.priority, t.seq)):
+            if reserved & set(task.resources):
+                continue
+            if not self._fits(task):
+                reserved |= set(task.resources)
+                continue
+            self._account()
+            for k, n in task.resources.items():
+                self.in_use[k] += n
+            task.state, task.start = RUNNING, time.time()
+            self._emit("start", task)
+            threading.Thread(target=self._execute, args=(task,), name=f"batch-{task.name}", daemon=True).start()
+
+    def _execute(self, task):
+        try:
+            task.result = task.fn()
+            state = DONE
+        except BaseException as e:
+            task.error = e
+            state = FAILED
+        with self._cond:
+            self._account()
+            for k, n in task.resources.items():
+                self.in_use[k] -= n
+            task.state, task.end = state, time.time()
+            self._emit("done" if state == DONE else "failed", task)
+            self._cond.notify_all()
+
+    def run(self, tick=None, tick_s: float = 5.0) -> list:
+        """Run every task (including ones added meanwhile) to completion; ``tick()`` runs every ``tick_s``."""
+        self.started_at = time.time()
+        next_tick = time.monotonic() + tick_s
+        with self._cond:
+            self._account()
+            while True:
+                self._start_ready()
+                if all(t.state in (DONE, FAILED, SKIPPED) for t in self.tasks):
+                    break
+                self._cond.wait(timeout=max(0.0, next_tick - time.monotonic()) if tick else None)
+                if tick and time.monotonic() >= next_tick:
+                    next_tick = time.monotonic() + tick_s
+                    self._cond.release()
+                    try:
+                        tick()
+                    finally:
+                        self._cond.acquire()
+            self._account()
+        self.finished_at = time.time()
+        return self.tasks
+
+    def utilization(self) -> dict:
+        """Mean share of each resource's slots that were busy over the run."""
+        wall = (self.finished_at or time.time()) - (self.started_at or time.time())
+        if wall <= 0:
+            return {k: 0.0 for k in self.capacity}
+        return {k: round(self._busy[k] / (self.capacity[k] * wall), 3) for k in self.capacity}
@@ -0,0 +1,195 @@
+# utils/local_backends.py
+"""
+Offline provider backends: a template script writer, synthetic TTS and procedural images.
+
+They need no network or API key and return real artifacts (a parseable JSON script,
+playable mp3, decodable JPEG) in milliseconds. Output is deterministic for a given
+input, so reruns hit the same caches as they would with a remote provider. Selected
+through the provider registry (``utils/providers.py``), e.g. ``STORY_PROVIDERS=local``.
+"""
+
+import io
+import re
+import json
+import random
+import hashlib
+import subprocess
+
+DEFAULT_SCENES = 3
+DEFAULT_WORDS_PER_SCENE = 50
+
+SCENE_SENTENCES = (
+    "The story of {idea} begins again in a quiet place.",
+    "{hero} took a careful step and looked toward the horizon.",
+    "Nobody expected what {hero} would find next.",
+    "A soft wind carried old memories across the land.",
+    "Grandmother paused, smiled, and continued the tale.",
+    "Every choice now seemed to matter more than before.",
+    "Far away, drums echoed through the evening hills.",
+    "{hero} remembered a promise made many years ago.",
+    "The stars watched silently, as they always had.",
+    "For a moment, everything was still, and then the world moved on.",
+)
+SETTINGS = ("at dawn", "under a starry sky", "in a misty forest", "beside a river", "on a windswept hill",
+            "in golden evening light", "inside an ancient hall", "during a storm")
+
+
+def _rng(*parts) -> random.Random:
+    return random.Random(hashlib.sha1("\x1f".join(map(str, parts)).encode("utf-8")).hexdigest())
+
+
+# === Script (llm) ===
+
+def _story_idea(prompt: str) -> str:
+    match = re.search(r"Story idea:\s*(.+)", prompt)
+    idea = match.group(1) if match else prompt
+    idea = re.sub(r"\s+in [\w-]+ genre\b.*$", "", idea.strip(), flags=re.IGNORECASE | re.DOTALL)
+    words = idea.split()
+    return " ".join(words[:12]).rstrip(".,;:!?") or "a forgotten legend"
+
+
+def _hero(idea: str) -> str:
+    names = [w.strip(".,;:!?'\"") for w in idea.split()[1:] if w[:1].isupper()]
+    return names[0] if names else "the hero"
+
+
+def _narration(idea: str, hero: str, words: int, rng: random.Random) -> str:
+    sentences, count = [], 0
+    while count < words:
+        sentence = rng.choice(SCENE_SENTENCES).format(idea=idea, hero=hero)
+        sentence = sentence[0].upper() + sentence[1:]
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+
+def _pseudo_translation(prompt: str) -> str:
+    """Translation request: every scene once per requested language code, tagged "[code] ..."."""
+    header, _, scenes = prompt.partition("Scenes:")
+    match = re.search(r"languages:\s*(.+?)\.\n", header)
+    codes = re.findall(r"([\w-]+) \(", match.group(1)) if match else []
+    items = json.loads(scenes.strip() or "[]")
+    return json.dumps([
+        {"language": code, "scene_number": item["scene_number"], "narration": f"[{code}] {item['narration']}"}
+        for code in codes for item in items
+    ], ensure_ascii=False)
+
+
+def template_script(prompt: str, system_prompt: str = "", max_tokens: int = None) -> str:
+    """
+    Model-shaped JSON text for the script agent's requests: a chapter outline when the
+    system prompt asks for chapters, a pseudo-translation for translation requests,
+    otherwise scenes (count and length read from the prompt's "exactly N scenes" /
+    "about N words" when present).
+    """
+    if "translator" in system_prompt:
+        return _pseudo_translation(prompt)
+    idea = _story_idea(prompt)
+    hero = _hero(idea)
+    rng = _rng(prompt, system_prompt)
+
+    if "chapter_number" in system_prompt:
+        match = re.search(r"exactly (\d+) chapters", prompt)
+        chapters = int(match.group(1)) if match else 1
+        return json.dumps([
+            {"chapter_number": i, "title": f"Chapter {i}: {rng.choice(SETTINGS).capitalize()}",
+             "summary": f"{hero[0].upper() + hero[1:]} faces a new turn in the story of {idea}."}
+            for i in range(1, chapters + 1)
+        ])
+
+    match = re.search(r"exactly (\d+) scenes", prompt)
+    num_scenes = int(match.group(1)) if match else DEFAULT_SCENES
+    match = re.search(r"about (\d+) words", prompt)
+    words = int(match.group(1)) if match else DEFAULT_WORDS_PER_SCENE
+    return json.dumps([
+        {"scene_number": i,
+         "narration": _narration(idea, hero, words, rng),
+         "image_prompt": f"Storybook illustration of {idea}, scene {i}, {rng.choice(SETTINGS)}"}
+        for i in range(1, num_scenes + 1)
+    ], ensure_ascii=False)
+
+
+# === Speech (tts) ===
+
+WORD_SYLLABLE_S = 0.13
+WORD_GAP_S = 0.06
+CLAUSE_PAUSE_S = 0.15
+SENTENCE_PAUSE_S = 0.3
+
+
+def tone_tts(text: str, sample_rate: int = 22050) -> bytes:
+    """
+    Speech-shaped synthetic audio as mp3: one voiced tone per syllable with word gaps and
+    punctuation pauses, so durations track the text like real narration does.
+    """
+    import numpy as np
+    from utils.audio_stitch import mp3_bytes
+    from utils.speech_duration import syllables
+
+    pieces = []
+    for token in re.findall(r"[\w']+|[.!?]+|[,;:]", text):
+        if token[0] in ".!?":
+            pieces.append(np.zeros(int(SENTENCE_PAUSE_S * sample_rate), dtype=np.float32))
+            continue
+        if token in ",;:":
+            pieces.append(np.zeros(int(CLAUSE_PAUSE_S * sample_rate), dtype=np.float32))
+            continue
+        pitch = 110 + int(hashlib.md5(token.lower().encode("utf-8")).hexdigest()[:2], 16) / 255 * 90
+        units = len(token) if token.isdigit() else syllables(token)  # digits are read one by one
+        n = int(WORD_SYLLABLE_S * sample_rate * units)
+        t = np.arange(n, dtype=np.float32) / sample_rate
+        # A fundamental plus two harmonics under a raised-sine envelope, per word.
+        voice = (np.sin(2 * np.pi * pitch * t) + 0.5 * np.sin(4 * np.pi * pitch * t)
+                 + 0.25 * np.sin(6 * np.pi * pitch * t))
+        envelope = np.sqrt(np.clip(np.sin(np.pi * t / t[-1]), 0.0, None))
+        pieces.append((voice * envelope * 6000).astype(np.float32))
+        pieces.append(np.zeros(int(WORD_GAP_S * sample_rate), dtype=np.float32))
+    pcm = np.concatenate(pieces) if pieces else np.zeros(int(0.5 * sample_rate), dtype=np.float32)
+    return mp3_bytes(np.clip(pcm, -32768, 32767).astype(np.int16), sample_rate=sample_rate, bitrate="64k")
+
+
+def espeak_tts(text: str) -> bytes:
+    """Real (robotic) speech from espeak-ng/espeak, re-encoded to mp3."""
+    import shutil
+    from utils.audio_stitch import decode_pcm, mp3_bytes
+
+    exe = shutil.which("espeak-ng") or shutil.which("espeak")
+    wav = subprocess.run([exe, "--stdout", "-s", "160", text], capture_output=True, check=True).stdout
+    return mp3_bytes(decode_pcm(wav))
+
+
+# === Images ===
+
+def _size(size: str) -> tuple:
+    w, _, h = str(size).partition("x")
+    return int(w), int(h or w)
+
+
+def procedural_image(prompt: str, size: str = "1024x1024") -> bytes:
+    """A deterministic landscape-style picture (sky gradient, sun, hills) seeded by the prompt, as JPEG."""
+    import numpy as np
+    import PIL.Image
+    import PIL.ImageDraw
+
+    width, height = _size(size)
+    rng = _rng(prompt)
+    top, bottom = np.array([rng.randrange(256) for _ in range(3)]), np.array([rng.randrange(256) for _ in range(3)])
+    ramp = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    sky = (top * (1 - ramp) + bottom * ramp).astype(np.uint8)
+    im = PIL.Image.fromarray(np.repeat(sky[:, None, :], width, axis=1), "RGB")
+
+    draw = PIL.ImageDraw.Draw(im)
+    r = rng.randint(height // 14, height // 7)
+    cx, cy = rng.randint(r, width - r), rng.randint(r, height // 2)
+    draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=tuple(rng.randint(180, 255) for _ in range(3)))
+    xs = np.arange(0, width + 8, 8)
+    for layer in range(3):
+        base = height * (0.55 + 0.15 * layer)
+        amp, freq, phase = height * rng.uniform(0.03, 0.1), rng.uniform(1.0, 4.0), rng.uniform(0, 6.28)
+        ys = base + amp * np.sin(xs / width * freq * 6.28 + phase)
+        shade = tuple(int(c * (0.6 - 0.15 * layer)) for c in bottom)
+        draw.polygon([(0, height)] + list(zip(xs.tolist(), ys.tolist())) + [(width, height)], fill=shade)
+
+    buf = io.BytesIO()
+    im.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
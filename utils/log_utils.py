@@ -1,47 +1,426 @@
 # utils/log_utils.py
 """
 Cross-platform safe logging utilities.
-Prevents UnicodeEncodeError (emojis) on Windows and provides simple helpers.
+Prevents UnicodeEncodeError (emojis) on Windows and provides simple helpers backed by a
+non-blocking structured logger, plus lightweight tracing spans for per-stage / per-scene
+timing.
 """
 
+import os
 import sys
+import json
+import time
+import uuid
+import queue
+import atexit
 import datetime
+import threading
+import functools
+import contextlib
+import contextvars
 
-def safe_print(*args, sep=" ", end="\n", file=sys.stdout, flush=True):
-    """Print safely — if UnicodeEncodeError occurs, strip non-ascii chars."""
-    try:
-        print(*args, sep=sep, end=end, file=file, flush=flush)
-    except UnicodeEncodeError:
+# === Logging ===
+# Callers enqueue structured records (level, stage, scene, message, fields); one
+# background thread per process drains the queue in batches and writes each batch to
+# the console with a single write/flush and, when the run is traced, appends it to the
+# run's log.jsonl next to the trace. Records below LOG_LEVEL are dropped at the call
+# site, so debug logging in hot loops costs one comparison when it is off.
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+_LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+LOG_FILE = "log.jsonl"
+LOG_BATCH = 512
+# Probe used once per console sink to decide whether it can take emoji.
+_EMOJI_PROBE = "🚀✅⚠️❌"
+
+
+def _parse_level(value) -> int:
+    if isinstance(value, int):
+        return value
+    value = str(value).strip().lower()
+    if value.isdigit():
+        return int(value)
+    return {"debug": DEBUG, "info": INFO, "warn": WARNING, "warning": WARNING, "error": ERROR}.get(value, INFO)
+
+
+_log_level = _parse_level(os.getenv("LOG_LEVEL", "info"))
+# LOG_ASYNC=0 writes every record inline (handy when debugging a crash that kills the writer).
+_log_async = os.getenv("LOG_ASYNC", "1") != "0"
+
+
+def set_log_level(level):
+    global _log_level
+    _log_level = _parse_level(level)
+
+
+def log_enabled(level: int) -> bool:
+    """Guard for log calls whose message itself is expensive to build."""
+    return level >= _log_level
+
+
+class _LogWriter:
+    """Background writer: batches queued records to their console stream and the run's JSONL log."""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self._ascii_only = {}  # id(stream) -> bool, decided on first write to that sink
+        self._lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < LOG_BATCH:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            self.write(batch)
+
+    def _needs_ascii(self, stream) -> bool:
+        key = id(stream)
+        if key not in self._ascii_only:
+            try:
+                _EMOJI_PROBE.encode(getattr(stream, "encoding", None) or "ascii")
+                self._ascii_only[key] = False
+            except (UnicodeEncodeError, LookupError):
+                self._ascii_only[key] = True
+        return self._ascii_only[key]
+
+    def _write_console(self, stream, text):
+        if self._needs_ascii(stream):
+            text = text.encode("ascii", "ignore").decode("ascii")
         try:
-            text = sep.join(str(a) for a in args)
-            text_clean = text.encode("ascii", "ignore").decode("ascii", "ignore")
-            print(text_clean, end=end, file=file, flush=flush)
-        except Exception:
-            print("[LOG_ERROR] (could not print line safely)", file=file, flush=flush)
+            stream.write(text)
+            stream.flush()
+        except UnicodeEncodeError:
+            self._ascii_only[id(stream)] = True  # encoding lied; fall back for good
+            stream.write(text.encode("ascii", "ignore").decode("ascii"))
+            stream.flush()
+        except (ValueError, OSError):
+            pass  # stream closed (interpreter shutdown, detached pipe)
+
+    def write(self, batch):
+        with self._lock:
+            console, lines, waiters = {}, [], []
+            for record in batch:
+                if isinstance(record, threading.Event):
+                    waiters.append(record)
+                    continue
+                created, level, message, prefix, end, stream, fields = record
+                ts = datetime.datetime.fromtimestamp(created).strftime("%Y-%m-%d %H:%M:%S")
+                text = f"{prefix} [{ts}] {message}" if prefix else message
+                if fields:
+                    extra = {k: v for k, v in fields.items() if k not in ("stage", "scene") and v is not None}
+                    if extra:
+                        text += "  " + " ".join(f"{k}={v}" for k, v in extra.items())
+                parts = console.setdefault(id(stream), (stream, []))[1]
+                parts.append(text + end)
+                if _trace_dir:
+                    row = {"ts": round(created, 6), "level": _LEVEL_NAMES.get(level, level), "pid": os.getpid(),
+                           **(fields or {}), "msg": message}
+                    lines.append(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+            for stream, parts in console.values():
+                self._write_console(stream, "".join(parts))
+            if lines:
+                try:
+                    with open(os.path.join(_trace_dir, LOG_FILE), "a", encoding="utf-8") as f:
+                        f.write("".join(lines))
+                except OSError:
+                    pass
+            for waiter in waiters:
+                waiter.set()
+
+
+_writer = _LogWriter()
+_writer_lock = threading.Lock()
+
+
+def _enqueue(record):
+    if not _log_async:
+        _writer.write([record])
+        return
+    if _writer.thread is None:
+        with _writer_lock:
+            if _writer.thread is None:
+                _writer.start()
+                atexit.register(flush_logs)
+                _chain_excepthook()
+    _writer.queue.put(record)
+
+
+def _chain_excepthook():
+    """Write queued records before a crash traceback, so the log reads in order."""
+    previous = sys.excepthook
+
+    def hook(*exc_info):
+        flush_logs()
+        previous(*exc_info)
+
+    sys.excepthook = hook
+
+
+def flush_logs(timeout: float = 5.0):
+    """Block until every record queued so far has been written."""
+    if _writer.thread is None or not _writer.thread.is_alive():
+        return
+    done = threading.Event()
+    _writer.queue.put(done)
+    done.wait(timeout)
+
+
+def log(level: int, message: str, prefix: str = "", stage=None, scene=None, end: str = "\n", file=None, **fields):
+    """
+    Queue one structured record. ``stage``/``scene`` default to those of the innermost span;
+    extra keyword ``fields`` land in the JSONL log (and after the message on the console).
+    """
+    if level >= _log_level:
+        _emit(level, message, prefix, stage, scene, end, file, fields)
+
+
+def _emit(level, message, prefix, stage, scene, end, file, fields):
+    current = _current_span.get()
+    if current is not None:
+        stage = stage if stage is not None else current.attrs.get("stage")
+        scene = scene if scene is not None else current.attrs.get("scene")
+    if stage is not None:
+        fields["stage"] = stage
+    if scene is not None:
+        fields["scene"] = scene
+    _enqueue((time.time(), level, message, prefix, end, file or sys.stdout, fields))
+
+
+def safe_print(*args, sep=" ", end="\n", file=None, flush=False):
+    """
+    Print a plain line through the log writer (emoji-safe on any console). This is program
+    output, not a log message: LOG_LEVEL never drops it. ``flush`` waits until it is written.
+    """
+    _emit(INFO, sep.join(str(a) for a in args), "", None, None, end, file, {})
+    if flush:
+        flush_logs()
 
 
 def timestamp():
     return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 
-def log_step(step_name: str, emoji: str = "🚀"):
-    ts = timestamp()
+def log_debug(msg: str, **fields):
+    if _log_level <= DEBUG:  # checked here too: debug calls sit in hot loops
+        log(DEBUG, msg, "🔎", **fields)
+
+
+def log_step(step_name: str, emoji: str = "🚀", **fields):
+    log(INFO, step_name, emoji, **fields)
+
+
+def log_success(msg: str, **fields):
+    log(INFO, msg, "✅", **fields)
+
+
+def log_error(msg: str, **fields):
+    log(ERROR, msg, "❌", **fields)
+
+
+def log_warn(msg: str, **fields):
+    log(WARNING, msg, "⚠️", **fields)
+
+
+# === Tracing ===
+# Nested spans written as JSONL (one line per finished span) plus a Chrome trace-event
+# export that opens in Perfetto / chrome://tracing. The trace directory and the parent
+# span travel to agent subprocesses through the TRACE_CONTEXT env var.
+
+TRACE_ENV = "TRACE_CONTEXT"
+TRACE_FILE = "trace.jsonl"
+CHROME_TRACE_FILE = "trace.chrome.json"
+
+_trace_dir = None
+_trace_lock = threading.Lock()
+_current_span = contextvars.ContextVar("current_span", default=None)
+_inherited_parent = None
+_span_listeners = []
+_span_start_hooks = []
+_span_end_hooks = []
+
+
+class Span:
+    """A timed unit of work. Use ``set()`` to attach attributes such as bytes or outcome."""
+
+    __slots__ = ("name", "span_id", "parent_id", "attrs", "start", "end")
+
+    def __init__(self, name, parent_id, attrs):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self.end = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+
+def init_tracing(trace_dir=None):
+    """Enable tracing for this process; inherit the caller's trace if TRACE_CONTEXT is set."""
+    global _trace_dir, _inherited_parent
+    ctx = json.loads(os.environ.get(TRACE_ENV) or "{}")
+    _trace_dir = str(trace_dir or ctx.get("dir") or "") or None
+    _inherited_parent = ctx.get("parent")
+    if _trace_dir:
+        os.makedirs(_trace_dir, exist_ok=True)
+    return _trace_dir
+
+
+def tracing_enabled():
+    return _trace_dir is not None
+
+
+def trace_env(env=None, trace_dir=None):
+    """
+    Environment for a child process so its spans nest under the current span, or, with
+    ``trace_dir``, so they start a trace of their own there (one per story in a batch).
+    """
+    env = dict(os.environ if env is None else env)
+    if trace_dir:
+        os.makedirs(trace_dir, exist_ok=True)
+        env[TRACE_ENV] = json.dumps({"dir": str(trace_dir), "parent": None})
+    elif _trace_dir:
+        current = _current_span.get()
+        parent = current.span_id if current else _inherited_parent
+        env[TRACE_ENV] = json.dumps({"dir": _trace_dir, "parent": parent})
+    return env
+
+
+def _write_span(span):
+    record = {
+        "name": span.name, "id": span.span_id, "parent": span.parent_id,
+        "start": span.start, "end": span.end, "pid": os.getpid(),
+        "tid": threading.get_ident(), **span.attrs,
+    }
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _trace_lock, open(os.path.join(_trace_dir, TRACE_FILE), "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs):
+    """
+    Time a block as a nested span. Common attributes: stage, scene, provider, attempt,
+    bytes, outcome. An exception marks the span ``outcome="error"`` and propagates.
+    """
+    parent = _current_span.get()
+    s = Span(name, parent.span_id if parent else _inherited_parent, attrs)
+    for hook in _span_start_hooks:
+        hook(s)
+    token = _current_span.set(s)
     try:
-        print(f"{emoji} [{ts}] {step_name}")
-    except UnicodeEncodeError:
-        print(f"[{ts}] {step_name}")
+        yield s
+        s.attrs.setdefault("outcome", "ok")
+    except BaseException as e:
+        s.attrs["outcome"] = "error"
+        s.attrs.setdefault("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        s.end = time.time()
+        for hook in _span_end_hooks:
+            hook(s)
+        if _trace_dir:
+            _write_span(s)
+        for listener in _span_listeners:
+            listener(s)
+
+
+def current_span():
+    """The innermost open span in this context, or None."""
+    return _current_span.get()
+
+
+def add_span_listener(fn):
+    """Call ``fn(span)`` whenever a span finishes (used by utils.metrics)."""
+    if fn not in _span_listeners:
+        _span_listeners.append(fn)
+
+
+def add_span_hook(on_start=None, on_end=None):
+    """
+    Call ``on_start(span)`` when a span opens and ``on_end(span)`` when it closes, before
+    it is written, so the hook can still attach attributes (used by utils.profiling).
+    """
+    if on_start and on_start not in _span_start_hooks:
+        _span_start_hooks.append(on_start)
+    if on_end and on_end not in _span_end_hooks:
+        _span_end_hooks.append(on_end)
+
+
+def traced(name: str = None, **attrs):
+    """Decorator form of ``span``."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name or fn.__qualname__, **attrs):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def load_trace(trace_dir):
+    path = os.path.join(str(trace_dir), TRACE_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def export_chrome_trace(trace_dir, output_path=None):
+    """Convert the run's JSONL spans into Chrome trace-event JSON; return its path."""
+    records = load_trace(trace_dir)
+    reserved = {"name", "id", "parent", "start", "end", "pid", "tid"}
+    events = [
+        {
+            "name": r["name"], "cat": r.get("stage", "pipeline"), "ph": "X",
+            "ts": r["start"] * 1e6, "dur": (r["end"] - r["start"]) * 1e6,
+            "pid": r["pid"], "tid": r["tid"],
+            "args": {k: v for k, v in r.items() if k not in reserved} | {"id": r["id"], "parent": r["parent"]},
+        }
+        for r in records
+    ]
+    output_path = output_path or os.path.join(str(trace_dir), CHROME_TRACE_FILE)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return output_path
 
 
-def log_success(msg: str):
-    ts = timestamp()
-    safe_print(f"✅ [{ts}] {msg}")
+def critical_path(records):
+    """From the root span that ends last, keep following the child that finishes last."""
+    children = {}
+    ids = {r["id"] for r in records}
+    for r in records:
+        children.setdefault(r["parent"] if r["parent"] in ids else None, []).append(r)
+    path = []
+    level = children.get(None, [])
+    while level:
+        last = max(level, key=lambda r: r["end"])
+        path.append(last)
+        level = children.get(last["id"], [])
+    return path
 
 
-def log_error(msg: str):
-    ts = timestamp()
-    safe_print(f"❌ [{ts}] {msg}")
+# Agent subprocesses join the caller's trace automatically.
+if os.environ.get(TRACE_ENV):
+    init_tracing()
 
+# ...and report metrics when the deployment collects them.
+if os.environ.get("METRICS_DIR"):
+    from utils import metrics as _metrics
+    _metrics.install()
 
-def log_warn(msg: str):
-    ts = timestamp()
-    safe_print(f"⚠️ [{ts}] {msg}")
+# ...and profile memory per span when asked to.
+if os.environ.get("STORY_PROFILE", "0") not in ("", "0"):
+    from utils import profiling as _profiling
+    _profiling.install()
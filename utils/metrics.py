@@ -0,0 +1,322 @@
+# utils/metrics.py
+"""
+Prometheus-format metrics for the generator.
+
+Counters and histograms are recorded into per-thread shards, so the hot path (scene
+loops, provider calls) never takes a lock; shards are only merged when scraped.
+Agents run as subprocesses, so with METRICS_DIR set every process dumps its totals
+there on exit and the long-lived process (app.py) folds them into its own on scrape.
+
+Most values come from tracing spans (see ``utils.log_utils.span``):
+  *_request spans with a provider -> provider latency / status (ok/error) and HTTP code
+  stage="pipeline" spans          -> stage durations
+  spans carrying a ``frames`` attr -> encode frames per second
+"""
+
+import os
+import json
+import glob
+import atexit
+import threading
+
+METRICS_DIR_ENV = "METRICS_DIR"
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+STAGE_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 2400)
+FPS_BUCKETS = (5, 10, 15, 24, 30, 48, 60, 90, 120, 240)
+
+REGISTRY = {}
+_registry_lock = threading.Lock()
+
+
+def _key(labels: dict) -> str:
+    return json.dumps(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value) -> str:
+    """Label value escaping of the text exposition format: backslash, double quote, newline."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: str, extra=()) -> str:
+    pairs = [tuple(p) for p in json.loads(key)] + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Sharded:
+    """Per-thread value dicts. Registering a new thread's shard is the only locked step."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def shard(self) -> dict:
+        d = getattr(self._local, "d", None)
+        if d is None:
+            d = self._local.d = {}
+            with self._lock:
+                self._shards.append(d)
+        return d
+
+    def shards(self):
+        with self._lock:
+            return list(self._shards)
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        super().__init__()
+        self.name, self.help = name, help_text
+
+    def inc(self, amount: float = 1.0, **labels):
+        d = self.shard()
+        k = _key(labels)
+        d[k] = d.get(k, 0.0) + amount
+
+    def snapshot(self) -> dict:
+        total = {}
+        for d in self.shards():
+            for k, v in list(d.items()):
+                total[k] = total.get(k, 0.0) + v
+        return total
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__()
+        self.name, self.help, self.buckets = name, help_text, tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        d = self.shard()
+        k = _key(labels)
+        row = d.get(k)
+        if row is None:
+            # [bucket counts..., +Inf count, sum]
+            row = d[k] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+                break
+        else:
+            row[len(self.buckets)] += 1
+        row[-1] += value
+
+    def snapshot(self) -> dict:
+        total = {}
+        for d in self.shards():
+            for k, row in list(d.items()):
+                acc = total.setdefault(k, [0] * len(row))
+                for i, v in enumerate(row):
+                    acc[i] += v
+        return total
+
+
+class Gauge:
+    """Process-local gauge (e.g. in-flight jobs); not merged across processes."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text):
+        self.name, self.help = name, help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        k = _key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_key(labels)] = value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+
+def _register(metric):
+    with _registry_lock:
+        return REGISTRY.setdefault(metric.name, metric)
+
+
+PROVIDER_REQUESTS = _register(Counter("storygen_provider_requests_total",
+                                      "Provider API requests by endpoint, status (ok/error) and HTTP code."))
+PROVIDER_LATENCY = _register(Histogram("storygen_provider_request_seconds", "Provider API request latency."))
+CACHE_LOOKUPS = _register(Counter("storygen_cache_lookups_total", "Cache lookups by cache and result (hit/miss)."))
+STAGE_DURATION = _register(Histogram("storygen_stage_seconds", "Pipeline stage duration.", STAGE_BUCKETS))
+ENCODE_FPS = _register(Histogram("storygen_encode_fps", "Video encode throughput in frames per second.", FPS_BUCKETS))
+JOBS_IN_FLIGHT = _register(Gauge("storygen_jobs_in_flight", "Story generations currently running."))
+JOB_REQUESTS = _register(Counter("storygen_job_requests_total", "Story requests by admission (lead/attach/reuse)."))
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def _on_span(span):
+    duration = span.end - span.start
+    attrs = span.attrs
+    if span.name.endswith("_request") and "provider" in attrs:
+        # status is the span outcome for every provider; the HTTP code, where the call
+        # recorded one (as the span's "status"), is its own label.
+        labels = {"provider": attrs["provider"], "endpoint": attrs.get("stage", span.name),
+                  "status": attrs.get("outcome", "ok"), "code": attrs.get("status", "")}
+        PROVIDER_REQUESTS.inc(**labels)
+        PROVIDER_LATENCY.observe(duration, **labels)
+    if attrs.get("stage") == "pipeline":
+        STAGE_DURATION.observe(duration, stage=span.name)
+    if attrs.get("frames") and duration > 0:
+        ENCODE_FPS.observe(attrs["frames"] / duration, renderer=span.name)
+
+
+# === Multi-process aggregation ===
+
+_folded = {}
+_fold_lock = threading.Lock()
+_installed = False
+
+
+def _metrics_dir():
+    return os.environ.get(METRICS_DIR_ENV)
+
+
+def local_snapshot() -> dict:
+    return {name: m.snapshot() for name, m in REGISTRY.items() if m.kind != "gauge"}
+
+
+def dump(path=None):
+    """Atomically write this process's counters/histograms to METRICS_DIR/<pid>.json."""
+    metrics_dir = _metrics_dir()
+    if not path and not metrics_dir:
+        return None
+    path = path or os.path.join(metrics_dir, f"{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(local_snapshot(), f)
+    os.replace(tmp, path)
+    return path
+
+
+def _merge_into(acc: dict, snap: dict):
+    for name, values in snap.items():
+        target = acc.setdefault(name, {})
+        for k, v in values.items():
+            if isinstance(v, list):
+                row = target.setdefault(k, [0] * len(v))
+                for i, x in enumerate(v):
+                    row[i] += x
+            else:
+                target[k] = target.get(k, 0.0) + v
+
+
+def _fold_finished_processes():
+    """Absorb dumps left by exited agent processes, then delete them."""
+    metrics_dir = _metrics_dir()
+    if not metrics_dir:
+        return
+    own = os.path.join(metrics_dir, f"{os.getpid()}.json")
+    with _fold_lock:
+        for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+            if path == own:
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    _merge_into(_folded, json.load(f))
+                os.remove(path)
+            except (OSError, ValueError):
+                continue
+
+
+def collect() -> dict:
+    _fold_finished_processes()
+    merged = {}
+    with _fold_lock:
+        _merge_into(merged, _folded)
+    _merge_into(merged, local_snapshot())
+    return merged
+
+
+def render_prometheus() -> str:
+    """All metrics in Prometheus text exposition format."""
+    merged = collect()
+    lines = []
+    for name, metric in REGISTRY.items():
+        values = metric.snapshot() if metric.kind == "gauge" else merged.get(name, {})
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for k, v in sorted(values.items()):
+            if metric.kind != "histogram":
+                lines.append(f"{name}{_format_labels(k)} {v}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets, v):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(k, [('le', bound)])} {cumulative}")
+            cumulative += v[len(metric.buckets)]
+            lines.append(f"{name}_bucket{_format_labels(k, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(k)} {v[-1]}")
+            lines.append(f"{name}_count{_format_labels(k)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path):
+    """Write a scrape file (e.g. for node_exporter's textfile collector)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)
+
+
+_server = None
+
+
+def start_http_server(port: int, addr: str = "0.0.0.0"):
+    """Serve /metrics on a side port. Safe to call on every Streamlit rerun."""
+    global _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    with _registry_lock:
+        if _server is not None:
+            return _server
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                body = render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        _server = ThreadingHTTPServer((addr, port), Handler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
+
+
+def install():
+    """Derive metrics from spans and dump them at exit when METRICS_DIR is set."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    from utils.log_utils import add_span_listener
+
+    add_span_listener(_on_span)
+    if _metrics_dir():
+        os.makedirs(_metrics_dir(), exist_ok=True)
+        atexit.register(dump)
@@ -0,0 +1,213 @@
+# utils/profiling.py
+"""
+Memory and process profiling per tracing span (stage, scene, request).
+
+Enabled with ``STORY_PROFILE=1`` (``STORY_PROFILE=tracemalloc`` also traces Python
+allocations), or ``--profile`` on generate_full_story.py / bench_pipeline.py, which
+set it for every agent. A sampler thread reads /proc every STORY_PROFILE_INTERVAL
+seconds (default 0.1) and every open span keeps the peaks it saw:
+
+    mem_rss_mb       this process
+    mem_children_mb  all descendant processes together (ffmpeg encoders, agents)
+    mem_total_mb     both at the same instant, i.e. what the OOM killer sees
+    ffmpeg_peak      live ffmpeg processes among the descendants
+    fds_peak         open file descriptors of this process
+    py_peak_mb       Python heap (tracemalloc only)
+
+The outermost span of each process also gets ``top_allocators`` under tracemalloc.
+Values land in the span records of trace.jsonl, and ``write_profile`` folds them into
+``trace/profile.json`` per stage and per scene. ``check_budgets`` compares the stage
+peaks with a budget file (see benchmarks/bench_pipeline.py).
+
+Outside Linux only the process's own peak RSS is available.
+"""
+
+import os
+import sys
+import json
+import threading
+
+PROFILE_ENV = "STORY_PROFILE"
+PROFILE_FILE = "profile.json"
+INTERVAL_S = float(os.getenv("STORY_PROFILE_INTERVAL", "0.1"))
+TOP_ALLOCATORS = int(os.getenv("STORY_PROFILE_TOP", "8"))
+METRICS = ("mem_rss_mb", "mem_children_mb", "mem_total_mb", "ffmpeg_peak", "fds_peak", "py_peak_mb")
+
+_PAGE_MB = (os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096) / (1024 * 1024)
+_profiler = None
+
+
+def _proc_table() -> dict:
+    """``{pid: (ppid, comm, rss_mb)}`` for every process visible in /proc."""
+    table = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read().decode("utf-8", "replace")
+        except OSError:
+            continue  # exited while we looked
+        # "pid (comm) state ppid ... rss" -- comm may contain spaces and parentheses.
+        comm = stat[stat.index("(") + 1:stat.rindex(")")]
+        fields = stat[stat.rindex(")") + 2:].split()
+        table[int(entry)] = (int(fields[1]), comm, int(fields[21]) * _PAGE_MB)
+    return table
+
+
+def sample() -> dict:
+    """One reading of this process and its descendants."""
+    pid = os.getpid()
+    if not os.path.isdir("/proc"):
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+        return {"mem_rss_mb": rss_mb, "mem_total_mb": rss_mb}
+
+    table = _proc_table()
+    children = {}
+    for child, (ppid, _, _) in table.items():
+        children.setdefault(ppid, []).append(child)
+    descendants, stack = [], list(children.get(pid, ()))
+    while stack:
+        child = stack.pop()
+        descendants.append(child)
+        stack.extend(children.get(child, ()))
+
+    rss_mb = table[pid][2] if pid in table else 0.0
+    children_mb = sum(table[c][2] for c in descendants)
+    try:
+        fds = len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        fds = 0
+    reading = {
+        "mem_rss_mb": rss_mb, "mem_children_mb": children_mb, "mem_total_mb": rss_mb + children_mb,
+        "ffmpeg_peak": sum("ffmpeg" in table[c][1] for c in descendants), "fds_peak": fds,
+    }
+    import tracemalloc
+    if tracemalloc.is_tracing():
+        reading["py_peak_mb"] = tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+    return reading
+
+
+class _Profiler:
+    def __init__(self, interval_s: float, trace_python: bool):
+        self.interval_s = interval_s
+        self.trace_python = trace_python
+        self.open = {}  # span_id -> peaks
+        self.last = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="profiler", daemon=True)
+
+    def start(self):
+        if self.trace_python:
+            import tracemalloc
+            tracemalloc.start(10)
+        self._fold(sample())
+        self._thread.start()
+
+    def _fold(self, reading: dict):
+        with self._lock:
+            self.last = reading
+            for peaks in self.open.values():
+                for k, v in reading.items():
+                    if v > peaks.get(k, -1):
+                        peaks[k] = v
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self._fold(sample())
+            except Exception:
+                pass  # profiling must never break a run
+
+    def on_start(self, span):
+        with self._lock:
+            outermost = span.parent_id not in self.open
+            # Spans shorter than one interval still get the reading in effect when they ran.
+            self.open[span.span_id] = dict(self.last, _outermost=outermost)
+
+    def on_end(self, span):
+        with self._lock:
+            peaks = self.open.pop(span.span_id, None)
+        if peaks is None:
+            return
+        outermost = peaks.pop("_outermost")
+        span.set(**{k: round(v, 1) if isinstance(v, float) else v for k, v in peaks.items()})
+        if outermost and self.trace_python:
+            span.set(top_allocators=top_allocators())
+
+
+def top_allocators(limit: int = TOP_ALLOCATORS) -> list:
+    """Largest live Python allocations by source line (tracemalloc must be tracing)."""
+    import tracemalloc
+    if not tracemalloc.is_tracing():
+        return []
+    stats = tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen *>"))
+    ).statistics("lineno")
+    return [{"where": f"{s.traceback[0].filename}:{s.traceback[0].lineno}", "mb": round(s.size / (1024 * 1024), 2),
+             "blocks": s.count} for s in stats[:limit]]
+
+
+def enabled() -> bool:
+    return _profiler is not None
+
+
+def install(mode: str = None):
+    """Start profiling this process (idempotent). ``mode``: "1" or "tracemalloc"; default from STORY_PROFILE."""
+    global _profiler
+    from utils.log_utils import add_span_hook
+
+    mode = (mode or os.getenv(PROFILE_ENV, "1")).strip().lower()
+    if _profiler is not None or mode in ("", "0", "false", "no"):
+        return _profiler
+    _profiler = _Profiler(INTERVAL_S, trace_python=mode == "tracemalloc")
+    _profiler.start()
+    add_span_hook(on_start=_profiler.on_start, on_end=_profiler.on_end)
+    return _profiler
+
+
+# === Reports ===
+
+def _merge(into: dict, record: dict):
+    for k in METRICS:
+        if k in record and record[k] > into.get(k, -1):
+            into[k] = record[k]
+
+
+def memory_report(records: list) -> dict:
+    """Peaks per stage and per (stage, scene), from span records carrying profiling attributes."""
+    stages, scenes, allocators = {}, {}, {}
+    for r in records:
+        if "mem_total_mb" not in r:
+            continue
+        stage = r.get("stage") or r["name"]
+        _merge(stages.setdefault(stage, {}), r)
+        if r.get("scene") is not None:
+            _merge(scenes.setdefault(stage, {}).setdefault(str(r["scene"]), {}), r)
+        if r.get("top_allocators"):
+            allocators[r["name"]] = r["top_allocators"]
+    return {"stages": stages, "scenes": scenes, "top_allocators": allocators}
+
+
+def write_profile(trace_dir) -> dict:
+    """Fold the run's trace into ``<trace_dir>/profile.json``; returns the report."""
+    from utils.log_utils import load_trace
+
+    report = memory_report(load_trace(trace_dir))
+    path = os.path.join(str(trace_dir), PROFILE_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def check_budgets(report: dict, budgets: dict, metric: str = "mem_total_mb") -> list:
+    """Stages whose peak ``metric`` exceeds their budget in MB, as messages."""
+    problems = []
+    for stage, limit in budgets.items():
+        peak = report["stages"].get(stage, {}).get(metric)
+        if peak is not None and peak > limit:
+            problems.append(f"{stage}: peak {metric} {peak:.1f} MB > budget {limit:.0f} MB")
+    return problems
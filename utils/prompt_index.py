@@ -0,0 +1,196 @@
+# utils/prompt_index.py
+"""
+Near-duplicate detection for image prompts (MinHash + LSH banding).
+
+Consecutive scenes often ask for almost the same picture ("Arjun and Karna face each
+other on the battlefield" / "... on the battlefield at dawn"). Prompts are normalized
+into word shingles, summarized by a MinHash signature and bucketed by LSH bands, so a
+lookup only compares against the few prompts that share a band, whatever the index size.
+
+    index = PromptIndex.load("output/cache/images")               # persistent, LRU-bounded
+    hit = index.query(prompt, 0.8, namespaces={"euron:flux"})      # -> (PromptMatch | None)
+    index.add(prompt, "output/cache/images/ab12.jpg", "euron:flux")  # incremental
+
+Entries carry a namespace (the image provider that made them), so a query only matches
+artifacts from the providers it would accept. Band keys are stored with each entry, so
+loading the index does not recompute MinHash for the whole history. The persistent
+index keeps the ``max_entries`` most recently added or reused entries; older ones, and
+their cached files, are dropped when the index is loaded.
+"""
+
+import os
+import re
+import json
+import struct
+import hashlib
+from pathlib import Path
+
+NUM_PERM = 64
+BANDS = 16  # 16 bands x 4 rows: pairs above ~0.5 Jaccard almost always share a bucket
+ROWS = NUM_PERM // BANDS
+INDEX_FILE = "index.jsonl"
+MAX_ENTRIES = 2000
+
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 64) - 1
+
+# Fixed (seeded) permutations so signatures stay comparable across runs and processes.
+_PERMS = [
+    (int.from_bytes(hashlib.blake2b(b"a%d" % i, digest_size=8).digest(), "big") % (_PRIME - 1) + 1,
+     int.from_bytes(hashlib.blake2b(b"b%d" % i, digest_size=8).digest(), "big") % _PRIME)
+    for i in range(NUM_PERM)
+]
+
+_STOPWORDS = frozenset(
+    "a an the of and or in on at to with for from by is are was were be as its his her their "
+    "this that these those into onto while very".split()
+)
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize(prompt: str) -> list:
+    """Lowercased content words of a prompt, punctuation and filler words removed."""
+    return [w for w in _WORD.findall(prompt.lower()) if w not in _STOPWORDS]
+
+
+def shingles(prompt: str) -> set:
+    """Words plus adjacent word pairs, so both vocabulary and word order count."""
+    words = normalize(prompt)
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def _hash(shingle: str) -> int:
+    return struct.unpack("<Q", hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest())[0]
+
+
+def minhash(shingle_set: set) -> tuple:
+    if not shingle_set:
+        return (_MASK,) * NUM_PERM
+    hashes = [_hash(s) for s in shingle_set]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS)
+
+
+def band_keys(signature: tuple) -> list:
+    """One short hash per LSH band of a MinHash signature."""
+    return [hashlib.blake2b(struct.pack(f"<{ROWS}Q", *signature[band * ROWS:(band + 1) * ROWS]),
+                            digest_size=8).hexdigest() for band in range(BANDS)]
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class PromptMatch:
+    __slots__ = ("prompt", "path", "similarity", "namespace")
+
+    def __init__(self, prompt, path, similarity, namespace=None):
+        self.prompt, self.path, self.similarity, self.namespace = prompt, path, similarity, namespace
+
+    def __repr__(self):
+        return f"PromptMatch({self.similarity:.2f}, {self.path!r})"
+
+
+class PromptIndex:
+    """
+    Incremental MinHash/LSH index of prompt -> artifact path.
+
+    With ``cache_dir`` set, entries are appended to ``<cache_dir>/index.jsonl`` as they
+    are added, so the index survives across runs and is shared by every story.
+    """
+
+    def __init__(self, cache_dir=None, max_entries: int = MAX_ENTRIES):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_entries = max_entries
+        self._entries = []  # (prompt, path, shingle set, namespace)
+        self._buckets = [{} for _ in range(BANDS)]
+
+    @classmethod
+    def load(cls, cache_dir, max_entries: int = MAX_ENTRIES):
+        index = cls(cache_dir, max_entries)
+        index_file = index.cache_dir / INDEX_FILE
+        if not index_file.exists():
+            return index
+        latest, lines = {}, 0
+        with open(index_file, "r", encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue  # torn final line from an interrupted run
+                # A path's last row is its most recent use.
+                latest.pop(row["path"], None)
+                latest[row["path"]] = row
+        live = [row for row in latest.values() if os.path.exists(row["path"])]
+        evicted = live[:-max_entries] if max_entries and len(live) > max_entries else []
+        live = live[len(evicted):]
+        for row in live:
+            index._insert(row["prompt"], row["path"], row.get("namespace"), row.get("bands"))
+        if evicted or lines > len(live) * 1.25 + 16:
+            index._rewrite(live, evicted)
+        return index
+
+    def _rewrite(self, rows: list, evicted: list):
+        """Replace the index file with ``rows`` and delete the cached files of ``evicted``."""
+        index_file = self.cache_dir / INDEX_FILE
+        tmp = index_file.with_name(f".{INDEX_FILE}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        os.replace(tmp, index_file)
+        for row in evicted:
+            path = Path(row["path"])
+            if path.parent.resolve() == self.cache_dir.resolve():
+                path.unlink(missing_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _insert(self, prompt: str, path: str, namespace=None, bands=None) -> list:
+        shingle_set = shingles(prompt)
+        bands = bands or band_keys(minhash(shingle_set))
+        entry_id = len(self._entries)
+        self._entries.append((prompt, str(path), shingle_set, namespace))
+        for band, key in enumerate(bands):
+            self._buckets[band].setdefault(key, []).append(entry_id)
+        return bands
+
+    def _append(self, row: dict):
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.cache_dir / INDEX_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def add(self, prompt: str, path, namespace: str = None):
+        """Index ``prompt`` -> ``path`` (and persist it when the index has a cache dir)."""
+        bands = self._insert(prompt, path, namespace)
+        self._append({"prompt": prompt, "path": str(path), "namespace": namespace, "bands": bands})
+
+    def touch(self, match: PromptMatch):
+        """Mark a reused entry as recently used, so eviction keeps it."""
+        self._append({"prompt": match.prompt, "path": match.path, "namespace": match.namespace,
+                      "bands": band_keys(minhash(shingles(match.prompt)))})
+
+    def query(self, prompt: str, threshold: float = 0.8, namespaces=None):
+        """
+        Most similar indexed prompt with Jaccard similarity >= ``threshold``, or None;
+        with ``namespaces``, only entries in one of them count.
+        """
+        shingle_set = shingles(prompt)
+        candidates = set()
+        for band, key in enumerate(band_keys(minhash(shingle_set))):
+            candidates.update(self._buckets[band].get(key, ()))
+
+        best = None
+        for entry_id in candidates:
+            other_prompt, path, other, namespace = self._entries[entry_id]
+            if namespaces is not None and namespace not in namespaces:
+                continue
+            # Candidates are few; exact Jaccard on the stored shingles avoids MinHash noise.
+            similarity = jaccard(shingle_set, other)
+            if similarity >= threshold and (best is None or similarity > best.similarity):
+                if os.path.exists(path):
+                    best = PromptMatch(other_prompt, path, similarity, namespace)
+        return best
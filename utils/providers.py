@@ -0,0 +1,110 @@
+# utils/providers.py
+"""
+Provider registry for the script (``llm``), ``tts`` and ``image`` agents.
+
+Each agent asks ``resolve(kind)`` for its backend chain instead of hardcoding one, and
+tries the providers in order. The chain comes from config:
+
+    LLM_PROVIDERS=euron,groq     # per kind, tried in this order
+    TTS_PROVIDERS=local
+    STORY_PROVIDERS=local        # every kind at once (a per-kind setting wins)
+
+Without config the chain is every remote provider whose credentials are present, in
+registration order (Euron, then Groq). Remote providers are registered by the agents
+that own their HTTP details; the offline backends below (template script, synthetic
+TTS, procedural images, see ``utils/local_backends.py``) are always registered but only
+used when selected. They produce valid artifacts in milliseconds, so CI and soak runs
+can exercise rendering and orchestration without network or quota.
+
+Call signatures per kind:
+    llm:   fn(prompt, system_prompt, max_tokens) -> str   (raw model text)
+    tts:   fn(text) -> bytes                              (mp3)
+    image: fn(prompt, size) -> bytes                      (jpeg/png)
+"""
+
+import os
+import shutil
+
+KINDS = ("llm", "tts", "image")
+_REGISTRY = {kind: {} for kind in KINDS}
+
+
+class Provider:
+    # A plain slotted class: dataclasses (and the inspect module it pulls in) would add
+    # ~8 ms to the startup of every agent that registers a provider.
+    __slots__ = ("kind", "name", "fn", "label", "available", "default")
+
+    def __init__(self, kind: str, name: str, fn, label: str, available=None, default: bool = True):
+        self.kind, self.name, self.fn, self.label = kind, name, fn, label
+        self.available, self.default = available, default
+
+    def __repr__(self):
+        return f"Provider({self.kind!r}, {self.name!r}, label={self.label!r})"
+
+    def is_available(self) -> bool:
+        return self.available is None or bool(self.available())
+
+    def __call__(self, *args, **kwargs):
+        return self.fn(*args, **kwargs)
+
+
+def register(kind: str, name: str, fn, label: str = None, available=None, default: bool = True) -> Provider:
+    """
+    Add (or replace) provider ``name`` for ``kind``.
+
+    ``available()`` says whether it can be used right now (e.g. its API key is set);
+    ``default=False`` providers are only used when named in config. ``label`` identifies
+    the model or voice in logs and in the TTS duration history.
+    """
+    if kind not in _REGISTRY:
+        raise ValueError(f"Unknown provider kind {kind!r} (choose from {', '.join(KINDS)})")
+    provider = Provider(kind, name, fn, label or name, available, default)
+    _REGISTRY[kind][name] = provider
+    return provider
+
+
+def registered(kind: str) -> list:
+    return list(_REGISTRY[kind])
+
+
+def configured(kind: str):
+    """Provider names configured for ``kind``, or None when the default chain applies."""
+    value = os.getenv(f"{kind.upper()}_PROVIDERS") or os.getenv("STORY_PROVIDERS")
+    return [n.strip() for n in value.split(",") if n.strip()] if value else None
+
+
+def resolve(kind: str) -> list:
+    """Usable providers for ``kind`` in the order they should be tried; raises if there are none."""
+    providers = _REGISTRY[kind]
+    names = configured(kind)
+    if names:
+        unknown = [n for n in names if n not in providers]
+        if unknown:
+            raise ValueError(f"Unknown {kind} provider(s) {unknown}; registered: {', '.join(providers)}")
+        chain = [providers[n] for n in names if providers[n].is_available()]
+    else:
+        chain = [p for p in providers.values() if p.default and p.is_available()]
+    if not chain:
+        raise ValueError(f"No {kind} provider available ({', '.join(names) if names else 'default chain'}): "
+                         f"set the provider API keys, or {kind.upper()}_PROVIDERS=local for offline backends.")
+    return chain
+
+
+# === Offline backends (imported lazily so agents keep their import budget) ===
+
+def _local(fn_name: str):
+    def call(*args, **kwargs):
+        from utils import local_backends
+        return getattr(local_backends, fn_name)(*args, **kwargs)
+    call.__name__ = fn_name
+    return call
+
+
+def _espeak_available() -> bool:
+    return bool(shutil.which("espeak-ng") or shutil.which("espeak"))
+
+
+register("llm", "local", _local("template_script"), label="local:template", default=False)
+register("tts", "local", _local("tone_tts"), label="local:tone", default=False)
+register("tts", "espeak", _local("espeak_tts"), label="local:espeak", available=_espeak_available, default=False)
+register("image", "local", _local("procedural_image"), label="local:procedural", default=False)
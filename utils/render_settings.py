@@ -0,0 +1,206 @@
+# utils/render_settings.py
+"""
+Encoder settings for the video agents.
+
+Picks the x264 preset, thread count and tune for a render from a one-off calibration
+benchmark of this host and a speed/quality profile, and divides the machine's cores
+between the encodes running on it (across processes) when each one starts.
+
+The calibration runs once per host, outside any render: ``python utils/render_settings.py``
+or ``load_calibration()`` before rendering (the video agent does this). Until then
+encodes use the default presets.
+
+    with encoder_settings("balanced", fps=24, height=720) as enc:
+        clip.write_videofile(path, preset=enc["preset"], threads=enc["threads"],
+                             ffmpeg_params=enc["ffmpeg_params"], ...)
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import contextlib
+import subprocess
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from utils.log_utils import log_step, log_warn
+
+# Fastest to slowest; slower presets compress better at the same quality.
+PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow")
+
+# Minimum encode speed as a multiple of real time, for the whole machine share we get.
+PROFILES = {
+    "draft": 8.0,
+    "fast": 3.0,
+    "balanced": 1.5,
+    "quality": 0.5,
+}
+DEFAULT_PROFILE = os.getenv("RENDER_PROFILE", "balanced")
+
+CALIBRATION_FILE = Path(os.getenv("ENCODER_CALIBRATION_FILE", "output/cache/encoder_calibration.json"))
+LEASE_DIR = Path(os.getenv("RENDER_LEASE_DIR", "output/.render_leases"))
+CALIBRATION_FRAMES = 48
+CALIBRATION_SIZE = (1280, 720)
+
+
+def available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def _host_key() -> str:
+    return f"{platform.node()}:{platform.machine()}:{available_cores()}"
+
+
+def _ffmpeg():
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def calibrate(presets=PRESETS, frames=CALIBRATION_FRAMES, size=CALIBRATION_SIZE) -> dict:
+    """Single-thread encode fps per preset at ``size``, on still-image-like content."""
+    results = {}
+    for preset in presets:
+        cmd = [
+            _ffmpeg(), "-loglevel", "error", "-f", "lavfi",
+            "-i", f"testsrc2=size={size[0]}x{size[1]}:rate=24",
+            "-vf", "fade=in:0:24", "-frames:v", str(frames),
+            "-c:v", "libx264", "-preset", preset, "-tune", "stillimage",
+            "-threads", "1", "-f", "null", "-",
+        ]
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, capture_output=True)
+        results[preset] = frames / (time.perf_counter() - start)
+    return results
+
+
+def load_calibration(refresh: bool = False, measure: bool = True) -> dict:
+    """Calibration for this host, measured once and cached on disk (``measure=False``: cached or {})."""
+    cache = {}
+    if CALIBRATION_FILE.exists():
+        try:
+            cache = json.loads(CALIBRATION_FILE.read_text(encoding="utf-8"))
+        except ValueError:
+            cache = {}
+    key = _host_key()
+    if key in cache and not refresh:
+        return cache[key]
+    if not measure:
+        return {}
+
+    log_step("Calibrating x264 presets for this host")
+    try:
+        cache[key] = {"size": list(CALIBRATION_SIZE), "fps": calibrate()}
+    except Exception as e:
+        log_warn(f"Encoder calibration failed, using defaults: {e}")
+        return {}
+    CALIBRATION_FILE.parent.mkdir(parents=True, exist_ok=True)
+    CALIBRATION_FILE.write_text(json.dumps(cache, indent=2), encoding="utf-8")
+    return cache[key]
+
+
+def pick_preset(profile: str, fps: int, height: int, threads: int, calibration: dict) -> str:
+    """Slowest (best compressing) preset that still meets the profile's speed target."""
+    target = PROFILES.get(profile, PROFILES["balanced"]) * fps
+    measured = calibration.get("fps") or {}
+    if not measured:
+        return "veryfast" if profile in ("draft", "fast") else "medium"
+    # Encode cost scales roughly with pixel count; x264 threading is ~80% efficient.
+    scale = (calibration["size"][1] / height) ** 2
+    best = PRESETS[0]
+    for preset in PRESETS:
+        if preset in measured and measured[preset] * scale * (1 + 0.8 * (threads - 1)) >= target:
+            best = preset
+    return best
+
+
+# === Machine-wide core governor ===
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def _lease_lock():
+    LEASE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(LEASE_DIR / ".lock", "a+") as f:
+        try:
+            import fcntl
+        except ImportError:  # Windows: best effort, no cross-process lock
+            yield
+            return
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _active_leases() -> list:
+    leases = []
+    for path in LEASE_DIR.glob("*.lease"):
+        pid = int(path.stem.split("-")[0])
+        if _pid_alive(pid):
+            leases.append(path)
+        else:
+            path.unlink(missing_ok=True)
+    return leases
+
+
+@contextlib.contextmanager
+def core_lease():
+    """
+    Register a running encode and yield its share of cores: cores divided by the
+    encodes live when it starts (itself included), clamped to ``[1, cores]``.
+
+    A lone render gets every core and nothing waits. Leases are files named after the
+    owning pid, so shares are divided between every render on the machine, and leases
+    of crashed processes are reclaimed.
+    """
+    cores = available_cores()
+    with _lease_lock():
+        lease = LEASE_DIR / f"{os.getpid()}-{time.monotonic_ns()}.lease"
+        lease.touch()
+        threads = min(cores, max(1, cores // len(_active_leases())))
+        lease.write_text(str(threads))
+    try:
+        yield threads
+    finally:
+        with _lease_lock():
+            lease.unlink(missing_ok=True)
+
+
+@contextlib.contextmanager
+def encoder_settings(profile: str = None, fps: int = 24, height: int = 720, still_images: bool = True):
+    """
+    Yield ``{"preset", "threads", "ffmpeg_params"}`` for one encode while holding a core lease.
+
+    Only a cached calibration is used: measuring one here would run inside the render.
+    """
+    profile = profile or DEFAULT_PROFILE
+    calibration = load_calibration(measure=False)
+    with core_lease() as threads:
+        preset = pick_preset(profile, fps, height, threads, calibration)
+        params = ["-tune", "stillimage"] if still_images else []
+        yield {"preset": preset, "threads": threads, "ffmpeg_params": params, "profile": profile}
+
+
+if __name__ == "__main__":
+    calibration = load_calibration(refresh="--refresh" in sys.argv)
+    print(json.dumps(calibration, indent=2))
+    for name in PROFILES:
+        print(f"{name:>9}: {pick_preset(name, 24, 720, available_cores(), calibration)}")
@@ -0,0 +1,334 @@
+# utils/run_index.py
+"""
+Index of generation runs (SQLite) with retention-based garbage collection.
+
+Every run records its id, status, output folder and artifacts (path, size, final or
+intermediate), so the final video of a run is a single primary-key lookup instead
+of a walk over the output tree. A retention policy (max age, max total bytes,
+keep-last-N) is enforced by ``gc()``, evicting intermediates before finals.
+
+Runs can also carry a request key (normalized prompt/genre/length) so identical
+requests are coalesced: ``claim_run()`` atomically decides whether a submission leads a
+new run, attaches to an identical one still in flight, or reuses a recent result.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import hashlib
+import shutil
+import sqlite3
+import threading
+import contextlib
+from pathlib import Path
+from dataclasses import dataclass
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from utils.log_utils import log_step, log_success, log_warn
+
+DEFAULT_DB = Path(os.getenv("RUN_INDEX_DB", "output/runs.sqlite"))
+FINAL_NAMES = {"final_story.mp4"}
+# Companions of the final video (other aspect-ratio cuts, posters, sprite sheet) are kept with it.
+FINAL_PREFIX = "final_story"
+# Runs still "running" after this long belonged to a process that died.
+STALE_RUN_S = 24 * 3600
+# Identical requests finished within this window are served from the existing run.
+DEDUP_TTL_S = float(os.getenv("DEDUP_TTL_S", str(24 * 3600)))
+# A claimed run whose owner stopped heartbeating for this long is treated as dead.
+HEARTBEAT_S = 15
+HEARTBEAT_TIMEOUT_S = 120
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL,
+    status      TEXT NOT NULL,
+    output_dir  TEXT NOT NULL,
+    final_video TEXT,
+    params      TEXT,
+    request_key TEXT
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    run_id   TEXT NOT NULL,
+    path     TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    is_final INTEGER NOT NULL,
+    PRIMARY KEY (run_id, path)
+);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created_at);
+"""
+
+
+def new_run_id() -> str:
+    """Timestamp (sortable, readable) plus a random suffix, so runs started in the same second never collide."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def request_key(prompt: str, genre: str = None, length=None) -> str:
+    """Key identifying "the same request": case, whitespace and trailing punctuation ignored."""
+    text = re.sub(r"\s+", " ", prompt or "").strip().rstrip(".!?").lower()
+    raw = json.dumps([text, (genre or "").strip().lower(), str(length or "")], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class RetentionPolicy:
+    max_age_days: float = None
+    max_total_bytes: int = None
+    keep_last: int = 5
+
+    @classmethod
+    def from_env(cls):
+        max_gb = os.getenv("RETENTION_MAX_GB")
+        max_age = os.getenv("RETENTION_MAX_AGE_DAYS")
+        return cls(
+            max_age_days=float(max_age) if max_age else None,
+            max_total_bytes=int(float(max_gb) * 1024 ** 3) if max_gb else None,
+            keep_last=int(os.getenv("RETENTION_KEEP_LAST", "5")),
+        )
+
+
+class RunIndex:
+    def __init__(self, db_path=DEFAULT_DB):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(runs)")}
+            if "request_key" not in columns:  # index created before request coalescing
+                db.execute("ALTER TABLE runs ADD COLUMN request_key TEXT")
+            db.execute("CREATE INDEX IF NOT EXISTS runs_request ON runs (request_key, created_at)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # A connection per call keeps this safe across Streamlit sessions/threads.
+        db = sqlite3.connect(str(self.db_path), timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.row_factory = sqlite3.Row
+        try:
+            with db:  # commit / rollback
+                yield db
+        finally:
+            db.close()
+
+    # === Recording ===
+
+    def start_run(self, run_id: str, output_dir, **params):
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO runs (run_id, created_at, updated_at, status, output_dir, params) "
+                "VALUES (?, ?, ?, 'running', ?, ?)",
+                (run_id, now, now, str(output_dir), json.dumps(params, ensure_ascii=False)),
+            )
+
+    def claim_run(self, run_id: str, output_dir, key: str, ttl_s: float = DEDUP_TTL_S, fresh: bool = False,
+                  **params):
+        """
+        Single-flight admission for a request with ``key``; returns ``(role, run)``.
+
+        ``"reuse"``: an identical run finished within ``ttl_s`` and its final video exists.
+        ``"attach"``: an identical run is in flight (and heartbeating); wait on it.
+        ``"lead"``: ``run_id`` was started for this request and the caller must run it
+        (``run_id`` must be new, see ``new_run_id``: an existing one raises sqlite3.IntegrityError).
+        With ``fresh`` a new run is always started. The decision and the insert happen in
+        one write transaction, so concurrent identical submissions get one leader.
+        """
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            if not fresh:
+                rows = db.execute(
+                    "SELECT * FROM runs WHERE request_key = ? AND status IN ('running', 'done') "
+                    "ORDER BY created_at DESC", (key,)).fetchall()
+                for row in map(dict, rows):
+                    if row["status"] == "running" and row["updated_at"] >= now - HEARTBEAT_TIMEOUT_S:
+                        return "attach", row
+                    if (row["status"] == "done" and row["updated_at"] >= now - ttl_s
+                            and row["final_video"] and os.path.exists(row["final_video"])):
+                        return "reuse", row
+            db.execute(
+                "INSERT INTO runs (run_id, created_at, updated_at, status, output_dir, params, request_key) "
+                "VALUES (?, ?, ?, 'running', ?, ?, ?)",
+                (run_id, now, now, str(output_dir), json.dumps(params, ensure_ascii=False), key),
+            )
+        return "lead", self.get(run_id)
+
+    def touch(self, run_id: str):
+        with self._connect() as db:
+            db.execute("UPDATE runs SET updated_at = ? WHERE run_id = ? AND status = 'running'",
+                       (time.time(), run_id))
+
+    @contextlib.contextmanager
+    def heartbeat(self, run_id: str, interval_s: float = HEARTBEAT_S):
+        """Keep ``run_id`` visibly alive to attached requests while the block runs."""
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval_s):
+                try:
+                    self.touch(run_id)
+                except sqlite3.Error as e:
+                    log_warn(f"Run heartbeat failed: {e}")
+
+        thread = threading.Thread(target=loop, name=f"run-heartbeat-{run_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+
+    def wait_for_run(self, run_id: str, poll_s: float = 1.0, timeout_s: float = None):
+        """Block until ``run_id`` is no longer running (or its owner stopped heartbeating)."""
+        deadline = time.time() + timeout_s if timeout_s else None
+        while True:
+            run = self.get(run_id)
+            if run is None or run["status"] != "running" or run["updated_at"] < time.time() - HEARTBEAT_TIMEOUT_S:
+                return run
+            if deadline and time.time() > deadline:
+                return run
+            time.sleep(poll_s)
+
+    def finish_run(self, run_id: str, status: str = "done", extra_paths=()):
+        """Mark a run finished and record its artifacts (one walk of that run's folder only)."""
+        run = self.get(run_id)
+        if run is None:
+            return None
+        artifacts, final_video = [], None
+        roots = [Path(run["output_dir"])] + [Path(p) for p in extra_paths]
+        for root in roots:
+            if not root.exists():
+                continue
+            files = [root] if root.is_file() else (p for p in root.rglob("*") if p.is_file())
+            for path in files:
+                is_final = path.name.startswith(FINAL_PREFIX)
+                if path.name in FINAL_NAMES:
+                    final_video = str(path)
+                artifacts.append((run_id, str(path), path.stat().st_size, int(is_final)))
+        with self._connect() as db:
+            db.execute("DELETE FROM artifacts WHERE run_id = ?", (run_id,))
+            db.executemany("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?)", artifacts)
+            db.execute("UPDATE runs SET status = ?, updated_at = ?, final_video = ? WHERE run_id = ?",
+                       (status, time.time(), final_video, run_id))
+        return final_video
+
+    # === Lookup ===
+
+    def get(self, run_id: str):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return dict(row) if row else None
+
+    def final_video(self, run_id: str):
+        run = self.get(run_id)
+        if run and run["final_video"] and os.path.exists(run["final_video"]):
+            return run["final_video"]
+        return None
+
+    def runs(self, status: str = None):
+        query = "SELECT * FROM runs" + (" WHERE status = ?" if status else "") + " ORDER BY created_at DESC"
+        with self._connect() as db:
+            return [dict(r) for r in db.execute(query, (status,) if status else ())]
+
+    def total_bytes(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+
+    # === Retention ===
+
+    def _evict(self, db, run_id: str, finals: bool):
+        rows = db.execute("SELECT path, size FROM artifacts WHERE run_id = ? AND is_final = ?",
+                          (run_id, int(finals))).fetchall()
+        freed = 0
+        for row in rows:
+            try:
+                os.remove(row["path"])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log_warn(f"GC could not remove {row['path']}: {e}")
+                continue
+            freed += row["size"]
+            db.execute("DELETE FROM artifacts WHERE run_id = ? AND path = ?", (run_id, row["path"]))
+        if finals:
+            db.execute("UPDATE runs SET status = 'evicted', final_video = NULL WHERE run_id = ?", (run_id,))
+            run = db.execute("SELECT output_dir FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if run:
+                shutil.rmtree(run["output_dir"], ignore_errors=True)
+        return freed
+
+    def gc(self, policy: RetentionPolicy = None) -> dict:
+        """
+        Apply the retention policy. Running runs and the newest ``keep_last`` are never
+        touched; expired runs lose everything; over the byte budget, intermediates of the
+        oldest runs go first and finals only if that is not enough.
+        """
+        policy = policy or RetentionPolicy.from_env()
+        stats = {"runs_expired": 0, "intermediate_bytes": 0, "final_bytes": 0}
+        with self._connect() as db:
+            db.execute("UPDATE runs SET status = 'failed' WHERE status = 'running' AND updated_at < ?",
+                       (time.time() - STALE_RUN_S,))
+            done = [dict(r) for r in db.execute(
+                "SELECT run_id, created_at FROM runs WHERE status NOT IN ('running', 'evicted') "
+                "ORDER BY created_at DESC")]
+            candidates = done[policy.keep_last:]
+            oldest_first = list(reversed(candidates))
+
+            if policy.max_age_days is not None:
+                cutoff = time.time() - policy.max_age_days * 86400
+                for run in oldest_first:
+                    if run["created_at"] < cutoff:
+                        stats["intermediate_bytes"] += self._evict(db, run["run_id"], finals=False)
+                        stats["final_bytes"] += self._evict(db, run["run_id"], finals=True)
+                        stats["runs_expired"] += 1
+
+            if policy.max_total_bytes is not None:
+                total = db.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+                for finals in (False, True):
+                    for run in oldest_first:
+                        if total <= policy.max_total_bytes:
+                            break
+                        freed = self._evict(db, run["run_id"], finals=finals)
+                        total -= freed
+                        stats["final_bytes" if finals else "intermediate_bytes"] += freed
+        return stats
+
+
+_gc_thread = None
+
+
+def start_background_gc(index: RunIndex, policy: RetentionPolicy = None, interval_s: float = 600):
+    """Run ``index.gc(policy)`` every ``interval_s`` in a daemon thread (once per process)."""
+    global _gc_thread
+    if _gc_thread is not None:
+        return _gc_thread
+
+    def loop():
+        while True:
+            try:
+                stats = index.gc(policy)
+                if stats["intermediate_bytes"] or stats["final_bytes"]:
+                    log_success(f"Run GC freed {stats}")
+            except Exception as e:
+                log_warn(f"Run GC failed: {e}")
+            time.sleep(interval_s)
+
+    _gc_thread = threading.Thread(target=loop, name="run-gc", daemon=True)
+    _gc_thread.start()
+    return _gc_thread
+
+
+if __name__ == "__main__":
+    index = RunIndex()
+    if "--gc" in sys.argv:
+        log_step("Running retention GC")
+        print(index.gc())
+    for run in index.runs()[:20]:
+        print(f"{run['run_id']}  {run['status']:<8} {run['final_video'] or '-'}")
@@ -0,0 +1,340 @@
+# utils/speech_duration.py
+"""
+Spoken-duration predictor for narration, calibrated on our own TTS history.
+
+Every mp3 the TTS agent saves is measured and recorded as (text, voice, seconds) in an
+append-only history file. Per voice, a ridge regression over a few text features
+(syllables, words, sentence/clause pauses, digits) is kept as sufficient statistics,
+so each new observation refits the model in O(features^2) without revisiting history.
+With no history yet the model falls back to a words-per-minute prior.
+
+    model = DurationModel.load()
+    seconds = model.predict("Once upon a time...", voice="euron:playai-tts")
+    model.observe(text, voice, mp3_duration("scene_1.mp3"))      # refit incrementally
+
+    python utils/speech_duration.py [--backfill]   # per-voice fits and their held-out error
+"""
+
+import os
+import re
+import sys
+import json
+import struct
+import hashlib
+import threading
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
+
+from utils.log_utils import safe_print, log_step, log_warn
+
+HISTORY_FILE = Path(os.getenv("TTS_DURATION_HISTORY", "output/cache/tts_durations.jsonl"))
+# Written next to a run's scene audio by the TTS agent: the voice label it was produced with.
+VOICE_FILE = "voice.txt"
+
+FEATURES = ("bias", "syllables", "words", "sentence_pauses", "clause_pauses", "digits")
+# Prior (seconds per unit): ~150 wpm narration, ~0.3s after a sentence, ~0.15s after a clause.
+PRIOR = (0.2, 0.0, 0.4, 0.3, 0.15, 0.05)
+# Strength of the pull towards PRIOR, in "observations worth"; small, so data wins quickly.
+RIDGE = 2.0
+
+_WORD = re.compile(r"[A-Za-z']+")
+_VOWEL_GROUPS = re.compile(r"[aeiouy]+")
+
+
+def syllables(word: str) -> int:
+    """Vowel-group syllable estimate (English), good enough as a regression feature."""
+    word = word.lower().strip("'")
+    if not word:
+        return 0
+    count = len(_VOWEL_GROUPS.findall(word))
+    if word.endswith("e") and not word.endswith(("le", "ee")) and count > 1:
+        count -= 1
+    return max(1, count)
+
+
+def features(text: str) -> list:
+    words = _WORD.findall(text)
+    return [
+        1.0,
+        float(sum(syllables(w) for w in words)),
+        float(len(words)),
+        float(len(re.findall(r"[.!?]+", text))),
+        float(len(re.findall(r"[,;:—-]", text))),
+        # Digits are spoken as words ("1947" -> four words), far longer than they look.
+        float(len(re.findall(r"\d", text))),
+    ]
+
+
+def _solve(a: list, b: list) -> list:
+    """Gaussian elimination with partial pivoting for the small normal-equation system."""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        m[col], m[pivot] = m[pivot], m[col]
+        if abs(m[col][col]) < 1e-12:
+            continue
+        for r in range(col + 1, n):
+            f = m[r][col] / m[col][col]
+            for c in range(col, n + 1):
+                m[r][c] -= f * m[col][c]
+    x = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        if abs(m[r][r]) < 1e-12:
+            continue
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+    return x
+
+
+class _VoiceFit:
+    """Running X^T X / X^T y for one voice; coefficients are re-solved lazily."""
+
+    __slots__ = ("xtx", "xty", "n", "_coef")
+
+    def __init__(self):
+        k = len(FEATURES)
+        self.xtx = [[0.0] * k for _ in range(k)]
+        self.xty = [0.0] * k
+        self.n = 0
+        self._coef = None
+
+    def add(self, x: list, y: float):
+        for i, xi in enumerate(x):
+            self.xty[i] += xi * y
+            row = self.xtx[i]
+            for j, xj in enumerate(x):
+                row[j] += xi * xj
+        self.n += 1
+        self._coef = None
+
+    def coef(self) -> list:
+        if self._coef is None:
+            # Ridge towards the prior: (X^T X + lambda I) w = X^T y + lambda w0
+            a = [[v + (RIDGE if i == j else 0.0) for j, v in enumerate(row)] for i, row in enumerate(self.xtx)]
+            b = [v + RIDGE * PRIOR[i] for i, v in enumerate(self.xty)]
+            self._coef = _solve(a, b)
+        return self._coef
+
+
+class DurationModel:
+    def __init__(self, history_file=HISTORY_FILE):
+        self.history_file = Path(history_file) if history_file else None
+        self._fits = {}
+        self._sources = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, history_file=HISTORY_FILE):
+        model = cls(history_file)
+        if model.history_file and model.history_file.exists():
+            with open(model.history_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line from an interrupted run
+                    model._add(row["text"], row["voice"], row["seconds"])
+                    if row.get("source"):
+                        model._sources.add(row["source"])
+        return model
+
+    def _add(self, text: str, voice: str, seconds: float):
+        x = features(text)
+        for key in (voice, "*"):  # per voice, plus a pooled fit for voices without history
+            self._fits.setdefault(key, _VoiceFit()).add(x, seconds)
+
+    def observe(self, text: str, voice: str, seconds: float, source: str = None) -> bool:
+        """
+        Record a measured duration; the next prediction for ``voice`` uses it. An
+        observation whose ``source`` (see ``source_key``) is already recorded is ignored.
+        Returns whether it was recorded.
+        """
+        with self._lock:
+            if source and source in self._sources:
+                return False
+            self._add(text, voice, seconds)
+            row = {"text": text, "voice": voice, "seconds": round(seconds, 3)}
+            if source:
+                self._sources.add(source)
+                row["source"] = source
+            if self.history_file:
+                self.history_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.history_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            return True
+
+    def samples(self, voice: str = "*") -> int:
+        fit = self._fits.get(voice)
+        return fit.n if fit else 0
+
+    def predict(self, text: str, voice: str = "*") -> float:
+        """Predicted spoken length of ``text`` in seconds."""
+        with self._lock:
+            fit = self._fits.get(voice) or self._fits.get("*")
+            coef = fit.coef() if fit else PRIOR
+        if not text.strip():
+            return 0.0
+        return max(0.1, sum(c * x for c, x in zip(coef, features(text))))
+
+    def timeline(self, texts: list, voice: str = "*") -> list:
+        """Predicted ``(start, end)`` seconds per scene, back to back."""
+        spans, t = [], 0.0
+        for text in texts:
+            d = self.predict(text, voice)
+            spans.append((round(t, 3), round(t + d, 3)))
+            t += d
+        return spans
+
+
+# === MP3 duration (frame walk, no decoder needed) ===
+
+_BITRATES = {  # (mpeg1?, layer) -> kbps by index
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_BITRATES[(False, 3)] = _BITRATES[(False, 2)]
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _gapless_trim(data: bytes, frame_start: int, frame_len: int):
+    """
+    Samples to drop for a Xing/Info first frame: the frame itself carries no audio, and
+    a LAME-style tag (LAME or ffmpeg's Lavc) records encoder delay and end padding.
+    Returns None when the frame is ordinary audio.
+    """
+    head = data[frame_start:frame_start + min(frame_len, 64)]
+    for tag in (b"Xing", b"Info"):
+        at = head.find(tag)
+        if at >= 0:
+            break
+    else:
+        return None
+    off = frame_start + at + 4
+    flags = struct.unpack(">I", data[off:off + 4])[0]
+    off += 4 + 4 * bool(flags & 1) + 4 * bool(flags & 2) + 100 * bool(flags & 4) + 4 * bool(flags & 8)
+    delay = padding = 0
+    if data[off:off + 4] in (b"LAME", b"Lavc", b"Lavf"):
+        packed = data[off + 21:off + 24]
+        if len(packed) == 3:
+            delay = packed[0] << 4 | packed[1] >> 4
+            padding = (packed[1] & 0x0F) << 8 | packed[2]
+    return delay + padding
+
+
+def mp3_duration(path) -> float:
+    """Duration of an mp3 file (CBR or VBR) from its frames' sample counts, gapless-trimmed."""
+    data = Path(path).read_bytes()
+    pos = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = data[6] << 21 | data[7] << 14 | data[8] << 7 | data[9]
+        pos = 10 + size
+    total_samples, sample_rate, first, end = 0, 0, True, len(data) - 4
+    while pos <= end:
+        header = struct.unpack(">I", data[pos:pos + 4])[0]
+        version, layer_bits = (header >> 19) & 3, (header >> 17) & 3
+        bitrate_i, rate_i = (header >> 12) & 15, (header >> 10) & 3
+        if (header >> 21) != 0x7FF or version == 1 or layer_bits == 0 or bitrate_i in (0, 15) or rate_i == 3:
+            pos += 1  # not a frame header: resync
+            continue
+        mpeg1, layer = version == 3, 4 - layer_bits
+        bitrate = _BITRATES[(mpeg1, layer)][bitrate_i] * 1000
+        sample_rate = _SAMPLE_RATES[version][rate_i]
+        padding = (header >> 9) & 1
+        if layer == 1:
+            samples, length = 384, (12 * bitrate // sample_rate + padding) * 4
+        else:
+            samples = 1152 if (layer == 2 or mpeg1) else 576
+            length = samples // 8 * bitrate // sample_rate + padding
+        trim = _gapless_trim(data, pos, length) if first else None
+        first = False
+        total_samples += -trim if trim is not None else samples
+        pos += max(length, 4)
+    return max(0, total_samples) / sample_rate if sample_rate else 0.0
+
+
+_default_model = None
+
+
+def default_model() -> DurationModel:
+    """Process-wide model backed by HISTORY_FILE."""
+    global _default_model
+    if _default_model is None:
+        _default_model = DurationModel.load()
+    return _default_model
+
+
+def source_key(audio_path) -> str:
+    """Identity of one TTS clip in the history: run, scene file and a hash of the audio."""
+    path = Path(audio_path)
+    digest = hashlib.blake2b(path.read_bytes(), digest_size=8).hexdigest()
+    return f"{path.parent.parent.name}/{path.stem}:{digest}"
+
+
+def backfill(output_root="output", model: DurationModel = None) -> int:
+    """
+    Seed history from finished runs (generated_videos/<run>/script/story.json +
+    audio_segments/scene_N.mp3). Runs without a recorded voice, or made with a local
+    synthetic one, are skipped; clips already in the history are not added twice.
+    """
+    model = model or default_model()
+    added = 0
+    for script in Path(output_root).glob("generated_videos/*/script/story.json"):
+        audio_dir = script.parent.parent / "audio_segments"
+        voice_file = audio_dir / VOICE_FILE
+        voice = voice_file.read_text(encoding="utf-8").strip() if voice_file.exists() else ""
+        if not voice or voice.startswith("local:"):
+            continue
+        try:
+            scenes = json.loads(script.read_text(encoding="utf-8"))
+        except ValueError:
+            continue
+        for scene in scenes if isinstance(scenes, list) else []:
+            mp3 = audio_dir / f"scene_{scene.get('scene_number')}.mp3"
+            if scene.get("narration") and mp3.exists():
+                added += model.observe(scene["narration"], voice, mp3_duration(mp3), source=source_key(mp3))
+    return added
+
+
+def holdout_errors(history_file=HISTORY_FILE) -> dict:
+    """
+    Mean absolute percentage error per voice (and pooled, as "*"), replaying the history
+    in order and predicting every observation from the fit of the ones before it, so each
+    one is scored while held out. Returns ``{voice: (n, mape)}``.
+    """
+    model = DurationModel(history_file=None)
+    errors = {}
+    path = Path(history_file)
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if row["seconds"] > 0:
+                err = abs(model.predict(row["text"], row["voice"]) - row["seconds"]) / row["seconds"]
+                for key in (row["voice"], "*"):
+                    errors.setdefault(key, []).append(err)
+            model._add(row["text"], row["voice"], row["seconds"])
+    return {voice: (len(errs), sum(errs) / len(errs)) for voice, errs in errors.items()}
+
+
+if __name__ == "__main__":
+    model = default_model()
+    if "--backfill" in sys.argv:
+        log_step("Backfilling TTS duration history from output/")
+        safe_print(f"Added {backfill(model=model)} observations.")
+    errors = holdout_errors(model.history_file) if model.history_file else {}
+    for voice, fit in sorted(model._fits.items()):
+        coef = ", ".join(f"{name}={c:.3f}" for name, c in zip(FEATURES, fit.coef()))
+        mape = f"held-out MAPE={errors[voice][1]:.1%}" if voice in errors else ""
+        safe_print(f"{voice:<24} n={fit.n:<6} {coef}  {mape}")
+    if not model._fits:
+        log_warn("No TTS duration history yet; predictions use the words-per-minute prior.")
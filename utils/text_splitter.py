@@ -1,16 +1,28 @@
-"""Splits story text into meaningful scenes for video rendering."""
 """
 Splits the storytelling script into smaller, meaningful scene segments.
 This helps us create synchronized visuals and audio for each scene.
 """
 
 import re
-from typing import List
+from typing import Callable, Iterable, Iterator, List
+
+# Spoken-length defaults for narration scenes (seconds); see agents/script_agent.py.
+WORDS_PER_SECOND = 150 / 60
+TARGET_SCENE_SECONDS = 20.0
+MIN_SCENE_SECONDS = 8.0
+MAX_SCENE_SECONDS = 30.0
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+# Segments below the minimum are only chosen when nothing else fits (e.g. a very short story).
+_UNDER_MIN_PENALTY = 1e6
 
 def split_script_into_scenes(script: str, max_chars: int = 250) -> List[str]:
     """
     Splits a storytelling script into smaller scenes without breaking sentences abruptly.
 
+    Scenes are balanced by length (see ``iter_scenes``) instead of packed greedily, so the
+    last scene is not left as a short remainder.
+
     Args:
         script (str): The full storytelling script.
         max_chars (int): Approximate max number of characters per scene.
@@ -18,31 +30,151 @@ def split_script_into_scenes(script: str, max_chars: int = 250) -> List[str]:
     Returns:
         List[str]: A list of scene text segments.
     """
+    # Length in characters, counting the space that joins a sentence to the next one.
+    return list(iter_scenes([script], target_s=0.8 * max_chars, min_s=0.4 * max_chars, max_s=max_chars + 1,
+                            duration_fn=lambda sentence: len(sentence) + 1))
+
+
+def split_sentences(text: str, min_chars: int = 0) -> List[str]:
+    """
+    Splits text at sentence boundaries; sentences shorter than ``min_chars`` are merged
+    into the following one (or the previous one, at the end).
+    """
+    sentences = []
+    for sentence in _SENTENCE_END.split(" ".join(text.split())):
+        if sentences and len(sentences[-1]) < min_chars:
+            sentences[-1] = f"{sentences[-1]} {sentence}"
+        elif sentence:
+            sentences.append(sentence)
+    if len(sentences) > 1 and len(sentences[-1]) < min_chars:
+        sentences[-2:] = [" ".join(sentences[-2:])]
+    return sentences
+
+
+def estimate_seconds(text: str) -> float:
+    """
+    Rough spoken duration of ``text``: words at narration pace plus sentence/comma pauses.
+    """
+    words = len(text.split())
+    pauses = 0.3 * len(re.findall(r'[.!?]', text)) + 0.15 * len(re.findall(r'[,;:]', text))
+    return words / WORDS_PER_SECOND + pauses
 
-    # Clean script and normalize spacing
-    script = script.replace("\n", " ").strip()
-    script = re.sub(r'\s+', ' ', script)
 
-    # Split by sentence delimiters
-    sentences = re.split(r'(?<=[.!?])\s+', script)
-    scenes = []
-    current_scene = ""
+def _segment_cost(duration: float, target: float, min_s: float) -> float:
+    cost = (duration - target) ** 2
+    if duration < min_s:
+        cost += _UNDER_MIN_PENALTY * (min_s - duration) ** 2
+    return cost
 
-    for sentence in sentences:
-        # If adding this sentence stays within the limit, append
-        if len(current_scene) + len(sentence) + 1 <= max_chars:
-            current_scene += sentence + " "
-        else:
-            # Close current scene and start a new one
-            if current_scene.strip():
-                scenes.append(current_scene.strip())
-            current_scene = sentence + " "
 
-    # Append any remaining text
-    if current_scene.strip():
-        scenes.append(current_scene.strip())
+def _balanced_boundaries(durations: List[float], target: float, min_s: float, max_s: float) -> List[int]:
+    """
+    Optimal split points (exclusive end indices) minimizing the squared deviation of
+    every scene from ``target``, with no scene above ``max_s`` (unless it is a single
+    sentence) and none below ``min_s`` unless unavoidable.
+
+    Each end index only looks back over the sentences that fit in ``max_s``, so this is
+    O(n * sentences-per-scene) rather than O(n^2).
+    """
+    n = len(durations)
+    prefix = [0.0] * (n + 1)
+    for i, d in enumerate(durations):
+        prefix[i + 1] = prefix[i] + d
 
-    return scenes
+    best = [0.0] + [float("inf")] * n
+    back = [0] * (n + 1)
+    for j in range(1, n + 1):
+        for i in range(j - 1, -1, -1):
+            duration = prefix[j] - prefix[i]
+            if duration > max_s and i < j - 1:
+                break
+            cost = best[i] + _segment_cost(duration, target, min_s)
+            if cost < best[j]:
+                best[j], back[j] = cost, i
+
+    ends, j = [], n
+    while j > 0:
+        ends.append(j)
+        j = back[j]
+    return ends[::-1]
+
+
+def iter_scenes(
+    chunks: Iterable[str],
+    target_s: float = TARGET_SCENE_SECONDS,
+    min_s: float = MIN_SCENE_SECONDS,
+    max_s: float = MAX_SCENE_SECONDS,
+    duration_fn: Callable[[str], float] = estimate_seconds,
+    horizon_s: float = None,
+) -> Iterator[str]:
+    """
+    Streaming duration-balanced segmentation: consume text incrementally, yield scenes.
+
+    Sentences are buffered until about ``horizon_s`` seconds of speech are pending, then
+    segmented optimally; scenes well behind the end of the buffer are emitted and the tail
+    is kept, so boundaries near the frontier can still move when more text arrives.
+
+    Args:
+        chunks (Iterable[str]): Text in arbitrary pieces (a whole script, lines, a stream).
+        target_s (float): Desired spoken length per scene, in seconds.
+        min_s (float): Scenes shorter than this are only produced when unavoidable.
+        max_s (float): Scenes never exceed this, unless a single sentence does.
+        duration_fn (Callable[[str], float]): Spoken-duration estimate for a sentence.
+        horizon_s (float): Buffered speech before segmenting; defaults to 10 * ``max_s``.
+
+    Yields:
+        str: Scene text, one scene at a time.
+    """
+    horizon_s = horizon_s or 10 * max_s
+    keep_s = 2 * max_s
+    pending = ""
+    sentences, durations = [], []
+    buffered = 0.0
+
+    def flush(final: bool):
+        nonlocal buffered
+        start = 0
+        for end in _balanced_boundaries(durations, target_s, min_s, max_s):
+            scene_s = sum(durations[start:end])
+            if not final and buffered - scene_s < keep_s:
+                break
+            buffered -= scene_s
+            yield " ".join(sentences[start:end])
+            start = end
+        del sentences[:start]
+        del durations[:start]
+
+    def add(sentence: str):
+        nonlocal buffered
+        sentence = " ".join(sentence.split())
+        if sentence:
+            sentences.append(sentence)
+            durations.append(duration_fn(sentence))
+            buffered += durations[-1]
+
+    for chunk in chunks:
+        parts = _SENTENCE_END.split(pending + chunk)
+        # The last part may be an unfinished sentence; wait for more text.
+        pending = parts.pop()
+        for sentence in parts:
+            add(sentence)
+        if buffered >= horizon_s:
+            yield from flush(final=False)
+
+    add(pending)
+    if sentences:
+        yield from flush(final=True)
+
+
+def segment_scenes(script: str, target_s: float = TARGET_SCENE_SECONDS, min_s: float = MIN_SCENE_SECONDS,
+                   max_s: float = MAX_SCENE_SECONDS, duration_fn: Callable[[str], float] = estimate_seconds) -> List[str]:
+    """
+    Splits a script into scenes of balanced spoken duration (see ``iter_scenes``).
+
+    Returns:
+        List[str]: A list of scene text segments.
+    """
+    return list(iter_scenes([script], target_s, min_s, max_s, duration_fn))
 
 
 # Optional: test script splitting directly
@@ -59,3 +191,8 @@ if __name__ == "__main__":
     print(f"🧠 Total scenes: {len(scenes)}\n")
     for idx, s in enumerate(scenes, 1):
         print(f"Scene {idx}: {s}\n")
+
+    balanced = segment_scenes(test_script, target_s=10, min_s=5, max_s=15)
+    print(f"⚖️ Duration-balanced scenes: {len(balanced)}\n")
+    for idx, s in enumerate(balanced, 1):
+        print(f"Scene {idx} (~{estimate_seconds(s):.1f}s): {s}\n")
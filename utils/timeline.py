@@ -0,0 +1,347 @@
+# utils/timeline.py
+"""
+Timeline IR shared by every render backend.
+
+A ``Timeline`` is the story as a renderer sees it: scene records (image and audio refs,
+duration, caption, fade in/out) plus audio layers mixed under the whole story (the
+music bed). ``compile(fps)`` validates it and returns a ``RenderPlan`` with the exact
+frame range of every scene, the fade gain of any frame and the audio sample ranges, so
+all renderers cut scenes at the same frames. Planning never opens media: durations come
+from the TTS agent's ``durations.json`` manifest (or an mp3 frame walk for older runs, or
+clips that no longer match it), and compiling is arithmetic over arrays, microseconds even for long stories.
+
+``diff(old, new)`` compares two plans and returns the frame spans that changed, which is
+how renders decide whether they are up to date.
+
+    timeline = Timeline.from_paths(images, audio, captions=subtitles, music="assets/bg_music.mp3")
+    plan = timeline.compile(fps=24)
+    plan.frames(0), plan.scene_at(1000), plan.gain(1, 3)
+"""
+
+import os
+import json
+import bisect
+from array import array
+
+# scene number -> {"seconds": ..., "size": ...}; written by the TTS agent.
+DURATIONS_FILE = "durations.json"
+
+
+class TimelineError(ValueError):
+    """A timeline that cannot be rendered; ``problems`` lists every reason."""
+
+    def __init__(self, problems):
+        self.problems = list(problems)
+        super().__init__("; ".join(self.problems))
+
+
+class Scene:
+    __slots__ = ("number", "image", "audio", "duration", "caption", "fade_in", "fade_out", "rev")
+
+    def __init__(self, number, image, audio, duration, caption=None, fade_in=0.0, fade_out=0.0, rev=None):
+        self.number = number
+        self.image = image
+        self.audio = audio
+        self.duration = duration
+        self.caption = caption
+        self.fade_in = fade_in
+        self.fade_out = fade_out
+        self.rev = rev  # cheap content stamp of the assets (size/mtime), for diff
+
+    def key(self) -> tuple:
+        return (self.number, str(self.image), str(self.audio), self.duration, self.caption,
+                self.fade_in, self.fade_out, self.rev)
+
+
+class AudioLayer:
+    """Audio under the whole timeline (e.g. the music bed) at ``volume``."""
+    __slots__ = ("path", "volume", "rev")
+
+    def __init__(self, path, volume=1.0, rev=None):
+        self.path = path
+        self.volume = volume
+        self.rev = rev
+
+    def key(self) -> tuple:
+        return (str(self.path), self.volume, self.rev)
+
+
+def _rev(path):
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def audio_duration(path) -> float:
+    """Length of a narration clip without decoding it (mp3 frame walk, WAV header)."""
+    if str(path).lower().endswith(".wav"):
+        import wave
+        with wave.open(str(path), "rb") as w:
+            return w.getnframes() / w.getframerate()
+    from utils.speech_duration import mp3_duration
+    return mp3_duration(path)
+
+
+class Timeline:
+    __slots__ = ("scenes", "layers")
+
+    def __init__(self, scenes=(), layers=()):
+        self.scenes = list(scenes)
+        self.layers = list(layers)
+
+    def __len__(self):
+        return len(self.scenes)
+
+    def add_scene(self, number, image, audio, duration, caption=None, fade_in=0.0, fade_out=0.0, rev=None) -> Scene:
+        scene = Scene(number, image, audio, duration, caption, fade_in, fade_out, rev)
+        self.scenes.append(scene)
+        return scene
+
+    def add_layer(self, path, volume=1.0) -> AudioLayer:
+        layer = AudioLayer(path, volume, _rev(path))
+        self.layers.append(layer)
+        return layer
+
+    def crossfade(self, seconds: float) -> "Timeline":
+        """Fade through black between consecutive scenes (not into the first or out of the last)."""
+        last = len(self.scenes) - 1
+        for i, scene in enumerate(self.scenes):
+            scene.fade_in = seconds if i > 0 else 0.0
+            scene.fade_out = seconds if i < last else 0.0
+        return self
+
+    @classmethod
+    def from_paths(cls, image_paths, audio_paths, durations=None, captions=None, fade=1.0,
+                   music=None, music_volume=0.15) -> "Timeline":
+        """
+        Timeline from parallel lists (scene N is index N-1). Missing ``durations`` are read
+        from the audio headers. ``music`` is skipped when the file does not exist.
+        """
+        problems = []
+        if len(image_paths) != len(audio_paths):
+            problems.append(f"{len(image_paths)} images for {len(audio_paths)} audio clips")
+        if captions is not None and len(captions) != len(audio_paths):
+            problems.append(f"{len(captions)} captions for {len(audio_paths)} scenes")
+        if durations is not None and len(durations) != len(audio_paths):
+            problems.append(f"{len(durations)} durations for {len(audio_paths)} scenes")
+        if problems:
+            raise TimelineError(problems)
+        timeline = cls()
+        for i, (image, audio) in enumerate(zip(image_paths, audio_paths)):
+            duration = durations[i] if durations is not None else audio_duration(audio)
+            timeline.add_scene(i + 1, str(image), str(audio), float(duration),
+                               captions[i] if captions is not None else None, rev=(_rev(image), _rev(audio)))
+        if music and os.path.exists(music):
+            timeline.add_layer(str(music), music_volume)
+        return timeline.crossfade(fade)
+
+    def to_dict(self) -> dict:
+        return {"scenes": [list(s.key()) for s in self.scenes], "layers": [list(l.key()) for l in self.layers]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Timeline":
+        scenes = [Scene(n, img, aud, d, cap, fi, fo, tuple(rev) if isinstance(rev, list) else rev)
+                  for n, img, aud, d, cap, fi, fo, rev in data["scenes"]]
+        return cls(scenes, [AudioLayer(*layer) for layer in data["layers"]])
+
+    def validate(self, fps: float = None) -> list:
+        """Every reason this timeline cannot be rendered (empty when it can)."""
+        problems = []
+        if not self.scenes:
+            problems.append("timeline has no scenes")
+        if fps is not None and not fps > 0:
+            problems.append(f"fps must be positive, got {fps}")
+        seen = set()
+        for s in self.scenes:
+            label = f"scene {s.number}"
+            if s.number in seen:
+                problems.append(f"{label} appears twice")
+            seen.add(s.number)
+            if not s.image:
+                problems.append(f"{label} has no image")
+            if not s.audio:
+                problems.append(f"{label} has no audio")
+            if not isinstance(s.duration, (int, float)) or not 0 < s.duration < float("inf"):
+                problems.append(f"{label} has invalid duration {s.duration!r}")
+            if s.fade_in < 0 or s.fade_out < 0:
+                problems.append(f"{label} has a negative fade")
+        for layer in self.layers:
+            if layer.volume < 0:
+                problems.append(f"audio layer {layer.path} has negative volume {layer.volume}")
+        return problems
+
+    def compile(self, fps: float) -> "RenderPlan":
+        problems = self.validate(fps)
+        if problems:
+            raise TimelineError(problems)
+        return RenderPlan(self, fps)
+
+
+class RenderPlan:
+    """
+    A validated timeline at a frame rate. Scene ``i`` covers frames
+    ``bounds[i]:bounds[i + 1]``, the rounded cumulative scene start times, so rounding
+    never accumulates into drift between picture and sound.
+    """
+    __slots__ = ("fps", "scenes", "layers", "times", "bounds", "fade_in", "fade_out")
+
+    def __init__(self, timeline: Timeline, fps: float):
+        self.fps = fps
+        self.scenes = tuple(timeline.scenes)
+        self.layers = tuple(timeline.layers)
+        self.times = array("d", [0.0])
+        t = 0.0
+        for s in self.scenes:
+            t += s.duration
+            self.times.append(t)
+        self.bounds = array("q", (int(round(t * fps)) for t in self.times))
+        self.fade_in = array("q", (int(round(s.fade_in * fps)) for s in self.scenes))
+        self.fade_out = array("q", (int(round(s.fade_out * fps)) for s in self.scenes))
+
+    def __len__(self):
+        return len(self.scenes)
+
+    @property
+    def total_frames(self) -> int:
+        return self.bounds[-1]
+
+    @property
+    def duration(self) -> float:
+        return self.times[-1]
+
+    def frames(self, i: int) -> range:
+        return range(self.bounds[i], self.bounds[i + 1])
+
+    def frame_count(self, i: int) -> int:
+        return self.bounds[i + 1] - self.bounds[i]
+
+    def samples(self, i: int, rate: int) -> tuple:
+        """``(first, end)`` audio sample of scene ``i`` at ``rate`` Hz."""
+        return int(round(self.times[i] * rate)), int(round(self.times[i + 1] * rate))
+
+    def scene_at(self, frame: int) -> int:
+        """Index of the scene showing ``frame``."""
+        if not 0 <= frame < self.total_frames:
+            raise IndexError(f"frame {frame} outside 0..{self.total_frames - 1}")
+        return bisect.bisect_right(self.bounds, frame) - 1
+
+    def gain(self, i: int, k: int) -> float:
+        """Brightness of the ``k``-th frame of scene ``i`` (fades go through black)."""
+        count = self.bounds[i + 1] - self.bounds[i]
+        gain = 1.0
+        fade_in, fade_out = self.fade_in[i], self.fade_out[i]
+        if fade_in and k < fade_in:
+            gain = k / fade_in
+        if fade_out and count - k <= fade_out:
+            gain = min(gain, (count - k) / fade_out)
+        return gain
+
+    @property
+    def image_paths(self) -> list:
+        return [s.image for s in self.scenes]
+
+    @property
+    def audio_paths(self) -> list:
+        return [s.audio for s in self.scenes]
+
+    def to_dict(self) -> dict:
+        return {"fps": self.fps, **Timeline(self.scenes, self.layers).to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RenderPlan":
+        return Timeline.from_dict(data).compile(data["fps"])
+
+
+def diff(old: RenderPlan, new: RenderPlan) -> dict:
+    """
+    What differs in ``new`` compared with ``old``: ``spans`` are merged ``[first, end)``
+    frame ranges of ``new`` whose picture changed, ``scenes`` the scene numbers they
+    cover, ``removed`` scenes of ``old`` that are gone, and ``audio`` whether the
+    soundtrack changed anywhere. A scene counts as changed when its assets, timing,
+    caption or fades differ, or when it now starts at another frame.
+    """
+    if old is None or old.fps != new.fps:
+        return {"spans": [[0, new.total_frames]], "scenes": [s.number for s in new.scenes],
+                "removed": [], "audio": True}
+    spans, scenes, audio = [], [], [l.key() for l in old.layers] != [l.key() for l in new.layers]
+    for i, scene in enumerate(new.scenes):
+        same = (i < len(old.scenes) and old.scenes[i].key() == scene.key()
+                and old.bounds[i] == new.bounds[i] and old.bounds[i + 1] == new.bounds[i + 1])
+        if same:
+            continue
+        scenes.append(scene.number)
+        audio = audio or i >= len(old.scenes) or old.times[i] != new.times[i] \
+            or (str(old.scenes[i].audio), old.scenes[i].duration) != (str(scene.audio), scene.duration)
+        first, end = new.bounds[i], new.bounds[i + 1]
+        if spans and spans[-1][1] == first:
+            spans[-1][1] = end
+        else:
+            spans.append([first, end])
+    kept = {s.number for s in new.scenes}
+    removed = [s.number for s in old.scenes if s.number not in kept]
+    return {"spans": spans, "scenes": scenes, "removed": removed, "audio": audio or bool(removed)}
+
+
+def run_timeline(artifacts, narration=None, fade=1.0, music=None, music_volume=0.15, strict=False) -> Timeline:
+    """
+    Timeline of a run: images from ``artifacts`` and narration audio (plus captions from
+    its script) from ``narration`` (default: the same run), paired by scene number.
+
+    A scene with an image but no audio or the other way round is left out with a
+    warning, or raises ``TimelineError`` when ``strict``.
+    """
+    from utils.log_utils import log_warn
+
+    narration = narration or artifacts
+    images = {_scene_number(n): n for n in artifacts.names("images", "scene_*.jpg")}
+    audio = {_scene_number(n): n for n in narration.names("audio_segments", "scene_*.mp3")}
+    missing = [f"scene {n} has no {'audio' if n in images else 'image'}" for n in sorted(images.keys() ^ audio.keys())]
+    numbers = sorted(images.keys() & audio.keys())
+    if not numbers:
+        raise TimelineError(missing or ["no scene images or audio_segments in this run"])
+    if missing:
+        if strict:
+            raise TimelineError(missing)
+        log_warn(f"Leaving out incomplete scenes: {'; '.join(missing)}")
+
+    captions, durations = {}, {}
+    if narration.exists("script", "story.json"):
+        try:
+            captions = {int(s["scene_number"]): s.get("narration") for s in
+                        json.loads(narration.read_text("script", "story.json")) if isinstance(s, dict)}
+        except (ValueError, KeyError, TypeError):
+            pass
+    if narration.exists("audio_segments", DURATIONS_FILE):
+        durations = {int(k): v for k, v in json.loads(narration.read_text("audio_segments", DURATIONS_FILE)).items()}
+
+    timeline = Timeline()
+    for n in numbers:
+        image = str(artifacts.fetch("images", images[n]))
+        aud = str(narration.fetch("audio_segments", audio[n]))
+        rev = (_rev(image), _rev(aud))
+        timeline.add_scene(n, image, aud, _manifest_duration(durations.get(n), aud) or audio_duration(aud),
+                           captions.get(n), rev=rev)
+    if music and os.path.exists(music):
+        timeline.add_layer(str(music), music_volume)
+    return timeline.crossfade(fade)
+
+
+def _manifest_duration(entry, audio_path):
+    """
+    The manifest's duration for a clip, or None when the clip changed since it was
+    written. Size is the check rather than mtime: fetching from a remote store gives
+    the local copy a new mtime.
+    """
+    if not isinstance(entry, dict):
+        return None  # older manifests had bare seconds and no way to tell if they are stale
+    try:
+        size = os.path.getsize(audio_path)
+    except OSError:
+        return None
+    return entry.get("seconds") if entry.get("size") == size else None
+
+
+def _scene_number(name: str) -> int:
+    return int(os.path.splitext(name)[0].split("_")[-1])